@@ -0,0 +1,180 @@
+"""Structured, non-blocking logging for the app
+
+Log calls take %-style arguments, so nothing is formatted unless a record is actually
+emitted. Emitted records are put on a queue and formatted by a background listener
+thread, which writes them as JSON lines to a rotating file and keeps the most recent
+ones in a ring buffer that can be dumped from the tray. Clipboard contents are only
+ever logged through clip(), which redacts them unless log_clipboard_text is on; hot
+paths check isEnabledFor first, so a disabled call doesn't even build the wrapper.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from collections import deque
+from collections.abc import Mapping
+
+# Debug mode flag - set to False for production (this is just for me)
+DEBUG_MODE = False
+
+# Process names and ids are the same for every record of a desktop app, skip collecting them
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+ROOT_LOGGER = logging.getLogger("rephrase")
+ROOT_LOGGER.setLevel(logging.DEBUG if DEBUG_MODE else logging.INFO)
+ROOT_LOGGER.propagate = False
+ROOT_LOGGER.addHandler(logging.NullHandler())  # Silent until setup_logging runs
+
+# Attributes every LogRecord has; anything else was passed with extra= and is structured data
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_state = {"listener": None, "ring": None, "log_clipboard_text": False}
+
+# Log arguments the caller can change after the call, before the listener formats them
+_MUTABLE_TYPES = (list, dict, set, bytearray)
+
+
+def get_logger(name):
+    """Logger for one module of the app"""
+    return ROOT_LOGGER.getChild(name)
+
+
+class ClipboardText:
+    """Clipboard content passed as a log argument
+
+    Rendered only when the record is written, as a length unless clipboard text logging
+    was turned on, and then cut to limit characters.
+    """
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text, limit):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self):
+        if self.text is None:
+            return "None"
+        if not _state["log_clipboard_text"]:
+            return f"<{len(self.text)} chars redacted>"
+        if len(self.text) > self.limit:
+            return self.text[:self.limit] + "..."
+        return self.text
+
+
+def clip(text, limit=50):
+    """Wrap clipboard or model text for logging, see ClipboardText"""
+    return ClipboardText(text, limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread, message and any extra= fields"""
+
+    def format(self, record):
+        data = {
+            "t": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "src": f"{record.module}:{record.lineno}",
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last capacity formatted records in memory"""
+
+    def __init__(self, capacity=500):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+    def dump(self, path):
+        lines = list(self.records)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return len(lines)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() merges the message and arguments in the logging thread; the
+    record only crosses threads here, never processes, so it can go on the queue as is.
+    Only a record with a mutable argument (a stats dict, a list) is formatted right
+    away, so it logs the value at the time of the call rather than a later one.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if args and (isinstance(args, Mapping) or any(isinstance(arg, _MUTABLE_TYPES) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(log_dir, debug=False, log_clipboard_text=False, max_bytes=1_000_000, backups=3, ring_size=500,
+                  file_name="rephrase.log"):
+    """Start the background listener writing to log_dir/file_name, the ring buffer and (when debugging) stdout"""
+    shutdown_logging()
+    _state["log_clipboard_text"] = log_clipboard_text
+    handlers = []
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, file_name), maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        print(f"Cannot write log files to {log_dir}: {e}")
+
+    ring = RingBufferHandler(ring_size)
+    ring.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s [%(threadName)s] %(message)s"))
+    handlers.append(ring)
+    if debug:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter("%(message)s"))
+        handlers.append(console)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    _state["listener"] = listener
+    _state["ring"] = ring
+
+    ROOT_LOGGER.handlers = [_DeferredQueueHandler(log_queue)]
+    ROOT_LOGGER.setLevel(logging.DEBUG if debug else logging.INFO)
+
+
+def dump_recent_events(folder):
+    """Write the ring buffer to a timestamped file in folder, returns its path (None before setup)"""
+    ring = _state["ring"]
+    if ring is None:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"recent-{time.strftime('%Y%m%d-%H%M%S')}.log")
+    ring.dump(path)
+    return path
+
+
+def shutdown_logging():
+    """Flush the queue and stop the listener thread"""
+    listener, _state["listener"] = _state["listener"], None
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,250 @@
+"""Micro-benchmarks for the latency-sensitive parts of the app
+
+Usage: python benchmarks.py <benchmark> [--iterations N]
+
+The clipboard benchmarks need a display; on a headless Linux box run them under Xvfb:
+    xvfb-run python benchmarks.py clipboard --iterations 200
+    xvfb-run python benchmarks.py clipboard_session
+"""
+import argparse
+import logging
+import tempfile
+import threading
+import time
+
+import hotkeys
+import clipboard_backends
+import app_logging
+from cancellation import CancelToken, Cancelled
+from idle import IdleManager, resident_memory, megabytes
+from fake_server import StandInServer, echo_responder
+from pipeline import RephrasePipeline
+from providers import MockProvider, OpenAICompatibleProvider
+from worker_process import WorkerPipeline
+
+
+def report(name, total_seconds, iterations):
+    """Print the per-iteration cost of a benchmark"""
+    per_call_us = total_seconds / iterations * 1e6
+    print(f"{name:<45} {per_call_us:10.2f} us/op  ({iterations} ops)")
+
+
+def bench_hotkeys(iterations=100000):
+    """Python-side cost of one ordinary (non-hotkey) keystroke for each hotkey backend"""
+    # In-memory backend: the dictionary lookup every backend needs at minimum
+    backend = hotkeys.InMemoryHotkeyBackend()
+    backend.register("ctrl+shift+r", lambda: None)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        backend.press("a")
+    report("memory: non-matching keystroke", time.perf_counter() - start, iterations)
+
+    # keyboard hook backend: feed synthetic events through the hook's Python callback
+    try:
+        import keyboard
+        keyboard.add_hotkey("ctrl+shift+r", lambda: None, suppress=True)
+        # direct_callback is private to the keyboard library, not every version or platform has it
+        if hasattr(getattr(keyboard, "_listener", None), "direct_callback"):
+            key_down = keyboard.KeyboardEvent(keyboard.KEY_DOWN, 30, 'a')
+            key_up = keyboard.KeyboardEvent(keyboard.KEY_UP, 30, 'a')
+            start = time.perf_counter()
+            for _ in range(iterations):
+                keyboard._listener.direct_callback(key_down)
+                keyboard._listener.direct_callback(key_up)
+            report("keyboard: non-matching keystroke", time.perf_counter() - start, iterations)
+        else:
+            print(f"{'keyboard: non-matching keystroke':<45} unsupported (no keyboard._listener.direct_callback)")
+        keyboard.unhook_all()
+    except Exception as e:
+        print(f"{'keyboard: non-matching keystroke':<45} unavailable ({e})")
+
+    # OS-registered backends never see non-matching keystrokes
+    for name, backend_class in hotkeys.HOTKEY_BACKENDS.items():
+        if backend_class.os_filtered:
+            print(f"{name + ': non-matching keystroke':<45} {0:10.2f} us/op  (filtered by the OS)")
+
+
+def bench_clipboard(iterations=200):
+    """Copy + paste round trip through pyperclip and the persistent native backend"""
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+
+    try:
+        import pyperclip
+        start = time.perf_counter()
+        for _ in range(iterations):
+            pyperclip.copy(text)
+            pyperclip.paste()
+        report("pyperclip: set + get", time.perf_counter() - start, iterations)
+    except Exception as e:
+        print(f"{'pyperclip: set + get':<45} unavailable ({e})")
+
+    backend = clipboard_backends.create_clipboard_backend()
+    if not backend:
+        print(f"{'native: set + get':<45} unavailable (no display or Windows)")
+        return
+    start = time.perf_counter()
+    for _ in range(iterations):
+        backend.set_text(text)
+        backend.get_text()
+    report(f"{backend.name}: set + get", time.perf_counter() - start, iterations)
+    backend.close()
+
+
+def bench_clipboard_session(iterations=5):
+    """Snapshot + restore cost of a ClipboardSession for large clipboard payloads"""
+    backend = clipboard_backends.create_clipboard_backend()
+    if not backend:
+        try:
+            backend = clipboard_backends.PyperclipClipboardBackend()
+        except Exception as e:
+            print(f"{'session: snapshot + restore':<45} unavailable ({e})")
+            return
+
+    for size_mb in (1, 10, 50):
+        payload = ("x" * 1023 + "\n") * (size_mb * 1024)
+        backend.set_text(payload)
+        snapshot_total = restore_total = 0.0
+        for _ in range(iterations):
+            session = clipboard_backends.ClipboardSession(backend)
+            with session:
+                pass
+            snapshot_total += session.snapshot_seconds
+            restore_total += session.restore_seconds
+        report(f"{backend.name} {size_mb} MB: snapshot + clear", snapshot_total, iterations)
+        report(f"{backend.name} {size_mb} MB: restore", restore_total, iterations)
+    backend.close()
+
+
+def bench_cancellation(iterations=10):
+    """Time from cancel() to the rephrase call returning, against a server that answers after 5 s"""
+    server = StandInServer(responder=echo_responder(delay=5.0)).start()
+    config = {"model": "stand-in", "creativity_level": 5, "user_system_prompt": "Rephrase"}
+    providers = [MockProvider(delay=5.0), OpenAICompatibleProvider(server.base_url)]
+    try:
+        for provider in providers:
+            pipeline = RephrasePipeline(provider, "System prompt")
+            worst = total = 0.0
+            for _ in range(iterations):
+                token = CancelToken()
+                returned = threading.Event()
+
+                def run():
+                    try:
+                        pipeline.rephrase("Some text to rephrase", config, token)
+                    except Cancelled:
+                        pass
+                    finally:
+                        returned.set()
+
+                threading.Thread(target=run, daemon=True).start()
+                time.sleep(0.2)  # Let the request get in flight
+                start = time.perf_counter()
+                token.cancel()
+                if not returned.wait(5.0):
+                    print(f"{provider.name}: rephrase did not return after cancel")
+                    return
+                elapsed = time.perf_counter() - start
+                total += elapsed
+                worst = max(worst, elapsed)
+            report(f"{provider.name}: cancel to return", total, iterations)
+            print(f"{provider.name + ': worst case':<45} {worst * 1e3:10.2f} ms")
+    finally:
+        server.stop()
+
+
+def bench_logging(iterations=100000):
+    """Caller-side cost of a hot-path log call with clipboard text, with debug logging off and on"""
+    text = "Some selected text the user wants rephrased. " * 40
+    logger = app_logging.get_logger("bench")
+
+    # The old debug_print: the f-string and slice are built before the flag check, and when
+    # on it prints synchronously (here to a file, a console is slower still)
+    debug_mode = [False]
+    with tempfile.TemporaryFile('w') as out:
+        def debug_print(*args):
+            if debug_mode[0]:
+                print(*args, file=out)
+        for debug in (False, True):
+            debug_mode[0] = debug
+            start = time.perf_counter()
+            for _ in range(iterations):
+                debug_print(f"Text captured from clipboard: {text[:50]}...")
+            report(f"debug_print ({'on, synchronous print' if debug else 'off'})", time.perf_counter() - start, iterations)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        for debug in (False, True):
+            app_logging.setup_logging(log_dir, debug=False)
+            app_logging.ROOT_LOGGER.setLevel("DEBUG" if debug else "INFO")
+            start = time.perf_counter()
+            for _ in range(iterations):
+                # As the app does on its hot paths: no clip() wrapper unless debug logging is on
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Text captured from clipboard: %s", app_logging.clip(text))
+            elapsed = time.perf_counter() - start
+            app_logging.shutdown_logging()  # Waits for the listener to drain the queue
+            report(f"logger.debug ({'on, queued to file' if debug else 'off'})", elapsed, iterations)
+
+
+def bench_idle(iterations=5):
+    """Resident memory freed by idle mode, and the delay it adds to the first request after it"""
+    config = {"provider": "mock", "model": "mock-model", "creativity_level": 5, "user_system_prompt": "Rephrase"}
+    with tempfile.TemporaryDirectory() as log_dir:
+        state = {}
+
+        def rehydrate():
+            state["worker"] = WorkerPipeline("System prompt", log_dir)
+            state["worker"].prepare(config)
+            state["worker"].wait_ready(10)
+
+        def release():
+            state.pop("worker").stop()
+
+        def total_memory():
+            worker = state.get("worker")
+            worker_memory = resident_memory(worker.process.pid) if worker else 0
+            return resident_memory() + (worker_memory or 0)
+
+        rehydrate()
+        state["worker"].rephrase("Warm up the worker", config)
+        idle = IdleManager(3600, release, rehydrate)
+        for overlap in (0.0, 0.2):
+            total_penalty = total_first = 0.0
+            for _ in range(iterations):
+                before = total_memory()
+                idle.release_now()
+                after = total_memory()
+                start = time.perf_counter()
+                idle.wake()
+                time.sleep(overlap)  # The clipboard capture the rebuild runs alongside
+                total_penalty += idle.wait_awake()
+                state["worker"].rephrase("Some text to rephrase", config)
+                total_first += time.perf_counter() - start - overlap
+            start = time.perf_counter()
+            state["worker"].rephrase("Some text to rephrase", config)
+            warm = time.perf_counter() - start
+            print(f"{'resident memory, front + worker':<45} {megabytes(before):>10} -> {megabytes(after)}")
+            report(f"wake penalty, {overlap * 1000:.0f} ms capture overlap", total_penalty, iterations)
+            report(f"first request after wake, {overlap * 1000:.0f} ms overlap", total_first, iterations)
+            print(f"{'warm request':<45} {warm * 1e3:10.2f} ms")
+        release()
+
+
+BENCHMARKS = {
+    "hotkeys": bench_hotkeys,
+    "clipboard": bench_clipboard,
+    "clipboard_session": bench_clipboard_session,
+    "cancellation": bench_cancellation,
+    "logging": bench_logging,
+    "idle": bench_idle,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--iterations", type=int, help="override the benchmark's default iteration count")
+    args = parser.parse_args()
+
+    selected = BENCHMARKS if args.benchmark == "all" else {args.benchmark: BENCHMARKS[args.benchmark]}
+    for name, bench in selected.items():
+        print(f"== {name} ==")
+        bench(args.iterations) if args.iterations else bench()
@@ -0,0 +1,291 @@
+"""Resumable bulk rephrasing of a corpus through the app's rephrase pipeline
+
+Usage: python bulk_rephrase.py corpus.jsonl results.jsonl [--ledger FILE] [--workers N]
+
+The input is either JSONL with a "text" field (and an optional "id") or plain text
+with one snippet per line. Results are appended to the output file as JSONL.
+
+Every finished or failed item is appended to a ledger (results.jsonl.ledger by
+default) with its content hash and the offset of its result in the output file.
+Re-running the same command resumes from the ledger: finished items are skipped,
+failed ones are retried up to --max-retries times, and a partially written result
+from a crash is cut off the output file. An item whose text or settings changed is
+rephrased again and its new result appended, so the last result for an id is the
+current one. Rate-limited requests wait for the time the server asks for and are
+retried; the job stops only when the quota itself is used up.
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app_logging import get_logger
+from key_pool import is_throttled
+from pipeline import load_pipeline
+from providers import MockProvider, ProviderError
+
+logger = get_logger("bulk_rephrase")
+
+# Wording of errors that mean the quota is gone (for the day, or until billing is fixed), not just busy
+QUOTA_EXHAUSTED = re.compile(r"insufficient_quota|per ?day|daily|billing", re.IGNORECASE)
+
+# Google errors carry the wait in their RetryInfo detail, as in 'retryDelay': '37s'
+RETRY_DELAY = re.compile(r"retryDelay\W+(\d+(?:\.\d+)?)s")
+
+# Rate limit waits: when the server doesn't say, and beyond which waiting is pointless
+DEFAULT_RATE_LIMIT_WAIT = 10
+MAX_RATE_LIMIT_WAIT = 600
+
+# Rate limit waits per item before the job gives up as if the quota were gone
+MAX_RATE_LIMIT_RETRIES = 20
+
+
+def read_corpus(path):
+    """Return the corpus items as a list of {"id", "text"} dicts"""
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            if path.endswith('.jsonl'):
+                record = json.loads(line)
+                items.append({"id": record.get("id", index), "text": record["text"]})
+            else:
+                items.append({"id": index, "text": line})
+    return items
+
+
+def item_hash(item, config, provider_name):
+    """Hash of an item's text and the settings, provider included, that shape its result"""
+    provider = f"openai {config.get('provider_url', '')}" if provider_name == "openai" else provider_name
+    key = json.dumps([item["text"], provider, config["model"], config.get("creativity_level", 5),
+                      config["user_system_prompt"]])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def retry_delay(error):
+    """Seconds the server asked us to wait before retrying, None if it didn't say"""
+    if getattr(error, "retry_after", None) is not None:
+        return error.retry_after
+    match = RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def is_quota_error(error):
+    """True if the error means the API quota (not just the request rate) is exhausted"""
+    if not is_throttled(error):
+        return False
+    return bool(QUOTA_EXHAUSTED.search(str(error))) or (retry_delay(error) or 0) > MAX_RATE_LIMIT_WAIT
+
+
+class JobLedger:
+    """Append-only record of each item's status, content hash and output location
+
+    entries holds each item's latest entry and results its latest done one, which a
+    later failed attempt (after the item's text or settings changed) doesn't replace:
+    that result is still in the output file, and still current if the change is undone.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                valid_size = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line from a crash, everything before it is valid
+                    self._remember(entry)
+                    valid_size += len(line)
+                f.truncate(valid_size)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def _remember(self, entry):
+        self.entries[str(entry["id"])] = entry
+        if entry["status"] == "done":
+            self.results[str(entry["id"])] = entry
+
+    def get(self, item_id):
+        return self.entries.get(str(item_id))
+
+    def is_done(self, item_id, digest):
+        """True if the output holds a result for the item as it is now"""
+        result = self.results.get(str(item_id))
+        return bool(result) and result["hash"] == digest
+
+    def committed_output_size(self):
+        """End of the last result the ledger knows about - anything after it is a torn write"""
+        return max((e["offset"] + e["length"] for e in self.results.values()), default=0)
+
+    def record(self, entry):
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self._remember(entry)
+
+    def close(self):
+        self.file.close()
+
+
+class ThroughputMeter:
+    """Progress and ETA from the throughput measured during this run"""
+
+    def __init__(self, total_items, total_chars):
+        self.total_items = total_items
+        self.remaining_chars = total_chars
+        self.done_items = 0
+        self.done_chars = 0
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def update(self, chars):
+        with self.lock:
+            self.done_items += 1
+            self.done_chars += chars
+            self.remaining_chars -= chars
+            elapsed = time.perf_counter() - self.start
+            chars_per_second = self.done_chars / elapsed if elapsed else 0
+            eta = self.remaining_chars / chars_per_second if chars_per_second else 0
+            print(f"[{self.done_items}/{self.total_items}] "
+                  f"{self.done_items / elapsed * 60:.1f} items/min, {chars_per_second:.0f} chars/s, "
+                  f"ETA {time.strftime('%H:%M:%S', time.gmtime(eta))}", flush=True)
+
+
+class BulkJob:
+    """Runs a corpus through the pipeline, checkpointing every item in the ledger"""
+
+    def __init__(self, pipeline, config, output_path, ledger_path, max_retries=3, workers=1):
+        self.pipeline = pipeline
+        self.config = config
+        self.output_path = output_path
+        self.ledger = JobLedger(ledger_path)
+        self.max_retries = max_retries
+        self.workers = workers
+        self.output_lock = threading.Lock()
+        self.quota_exhausted = threading.Event()
+
+        # Cut off a result that was written but never made it into the ledger
+        committed = self.ledger.committed_output_size()
+        with open(output_path, 'ab') as f:
+            if f.tell() > committed:
+                logger.debug("Truncating %s bytes of uncommitted output", f.tell() - committed)
+                f.truncate(committed)
+        self.output = open(output_path, 'ab')
+
+    def pending_items(self, items):
+        """Items that still need a request: new, changed, or failed with retries left"""
+        pending = []
+        for item in items:
+            entry = self.ledger.get(item["id"])
+            digest = item_hash(item, self.config, self.pipeline.provider.name)
+            if self.ledger.is_done(item["id"], digest):
+                continue
+            if not entry or entry["hash"] != digest:
+                pending.append((item, digest, 0))
+            elif entry["status"] == "failed" and entry["attempts"] < self.max_retries:
+                pending.append((item, digest, entry["attempts"]))
+        return pending
+
+    def commit_result(self, item, digest, attempts, text):
+        """Append a result to the output file and record it in the ledger as one step
+
+        With several workers, a result written after another worker's committed one
+        could otherwise survive a crash unrecorded, and be written again on resume.
+        Done in turn, only the last result can be uncommitted, and it is cut off.
+        """
+        data = (json.dumps({"id": item["id"], "text": text}) + '\n').encode('utf-8')
+        with self.output_lock:
+            offset = self.output.tell()
+            self.output.write(data)
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            self.ledger.record({"id": item["id"], "hash": digest, "status": "done",
+                                "attempts": attempts, "offset": offset, "length": len(data)})
+
+    def run_item(self, item, digest, attempts, meter):
+        rate_limited = 0
+        while attempts < self.max_retries:
+            if self.quota_exhausted.is_set():
+                return
+            try:
+                result = self.pipeline.rephrase(item["text"], self.config)
+                if not result:
+                    raise ProviderError("Empty response")
+                break
+            except Exception as e:
+                # Rate limits and running out of quota are not the item's fault, so they don't use up an attempt
+                if is_throttled(e) and not is_quota_error(e) and rate_limited < MAX_RATE_LIMIT_RETRIES:
+                    rate_limited += 1
+                    wait = retry_delay(e) or DEFAULT_RATE_LIMIT_WAIT
+                    print(f"Item {item['id']} rate limited, retrying in {wait:.0f}s", flush=True)
+                    time.sleep(wait)
+                    continue
+                quota_error = is_throttled(e)
+                if quota_error:
+                    self.quota_exhausted.set()
+                else:
+                    attempts += 1
+                    print(f"Item {item['id']} failed (attempt {attempts}/{self.max_retries}): {e}", flush=True)
+                self.ledger.record({"id": item["id"], "hash": digest, "status": "failed",
+                                    "attempts": attempts, "error": str(e)[:200]})
+                if not quota_error and attempts < self.max_retries:
+                    time.sleep(min(2 ** attempts, 30))  # Back off before retrying
+        else:
+            return
+
+        self.commit_result(item, digest, attempts + 1, result)
+        meter.update(len(item["text"]))
+
+    def run(self, items):
+        """Process every pending item, returns the number of items still not done"""
+        pending = self.pending_items(items)
+        print(f"{len(items) - len(pending)} items already done, {len(pending)} to process", flush=True)
+        meter = ThroughputMeter(len(pending), sum(len(item["text"]) for item, _, _ in pending))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for item, digest, attempts in pending:
+                executor.submit(self.run_item, item, digest, attempts, meter)
+
+        if self.quota_exhausted.is_set():
+            print("Quota exhausted - stopped. Re-run the same command to resume.", flush=True)
+        provider_name = self.pipeline.provider.name
+        remaining = [item for item in items
+                     if not self.ledger.is_done(item["id"], item_hash(item, self.config, provider_name))]
+        return len(remaining)
+
+    def close(self):
+        self.output.close()
+        self.ledger.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="corpus file (.jsonl with a text field, or one snippet per line)")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--ledger", help="ledger file (default: <output>.ledger)")
+    parser.add_argument("--config", help="config.json to take the model and instructions from")
+    parser.add_argument("--max-retries", type=int, default=3, help="attempts per item before giving up")
+    parser.add_argument("--workers", type=int, default=1, help="concurrent requests")
+    parser.add_argument("--mock", action="store_true", help="use the local mock provider instead of the configured one")
+    args = parser.parse_args()
+
+    pipeline, config = load_pipeline(args.config, provider=MockProvider() if args.mock else None)
+    job = BulkJob(pipeline, config, args.output, args.ledger or args.output + ".ledger",
+                  max_retries=args.max_retries, workers=args.workers)
+    try:
+        remaining = job.run(read_corpus(args.input))
+    finally:
+        job.close()
+    print(f"{remaining} items not done")
+    sys.exit(1 if remaining else 0)
@@ -0,0 +1,59 @@
+import threading
+
+
+class Cancelled(BaseException):
+    """The user cancelled the rephrase in progress
+
+    Like asyncio.CancelledError this derives from BaseException, so the many
+    `except Exception` fallbacks along the clipboard and request path let it through.
+    """
+
+
+class CancelToken:
+    """Shared flag that every stage of a rephrase checks, plus abort callbacks for blocking I/O"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """Cancel the operation and run the registered abort callbacks once"""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """Call callback on cancellation (now, if already cancelled), returns a function that unregisters it"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def check(self):
+        """Raise Cancelled if the operation was cancelled"""
+        if self.event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        """Sleep that wakes up and raises Cancelled as soon as the operation is cancelled"""
+        if self.event.wait(seconds):
+            raise Cancelled()
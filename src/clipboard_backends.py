@@ -0,0 +1,507 @@
+import os
+import base64
+import platform
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import ctypes
+from ctypes import wintypes
+
+from app_logging import get_logger
+
+logger = get_logger("clipboard_backends")
+
+# Windows clipboard constants
+CF_UNICODETEXT = 13
+GMEM_MOVEABLE = 0x0002
+
+# Formats whose clipboard handle is a GDI object rather than global memory. Windows
+# synthesizes them from CF_DIB/CF_ENHMETAFILE equivalents, so they are not snapshotted.
+GDI_HANDLE_FORMATS = {2, 3, 9, 14, 0x0080, 0x0082, 0x0083, 0x008E}
+# CF_PRIVATEFIRST..CF_GDIOBJLAST hold app-private handles that can't be copied either
+PRIVATE_HANDLE_FORMATS = range(0x0200, 0x0400)
+
+# Text targets kept when snapshotting an X11 clipboard through Tk
+X11_TEXT_TARGETS = ["UTF8_STRING", "STRING", "TEXT", "text/plain", "text/plain;charset=utf-8", "text/html", "text/uri-list"]
+
+# Target/MIME type password managers (KeePassXC, KDE) add to mark a copied secret
+PASSWORD_MANAGER_HINT = "x-kde-passwordManagerHint"
+
+
+class ClipboardBackend:
+    """Base class for the persistent in-process clipboard backends"""
+    name = "base"
+
+    def get_text(self):
+        """Return the clipboard text, or None if there is no text"""
+        raise NotImplementedError
+
+    def set_text(self, text):
+        """Put text on the clipboard, returns True on success"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Empty the clipboard"""
+        return self.set_text('')
+
+    def snapshot(self, clear=False):
+        """Return every clipboard format as {format: raw data}, optionally emptying it in the same pass"""
+        text = self.get_text()
+        if clear:
+            self.clear()
+        return {"text": text} if text is not None else {}
+
+    def restore(self, snapshot):
+        """Put a snapshot taken with snapshot() back on the clipboard"""
+        if "text" in snapshot:
+            return self.set_text(snapshot["text"])
+        return self.clear()
+
+    def change_count(self):
+        """Number that changes whenever the clipboard does, or None if the backend can't tell cheaply"""
+        return None
+
+    def is_sensitive(self):
+        """True if the app that owns the clipboard marked its content as secret (password managers do)"""
+        return False
+
+    def close(self):
+        """Release the connection or helper process"""
+        pass
+
+
+class PyperclipClipboardBackend(ClipboardBackend):
+    """Text-only fallback when no persistent backend is available"""
+    name = "pyperclip"
+
+    def __init__(self):
+        import pyperclip
+        self.pyperclip = pyperclip
+
+    def get_text(self):
+        return self.pyperclip.paste() or None
+
+    def set_text(self, text):
+        self.pyperclip.copy(text)
+        return True
+
+
+class Win32ClipboardBackend(ClipboardBackend):
+    """Windows clipboard through the Win32 API, including raw snapshots of every format"""
+    name = "win32"
+
+    def __init__(self):
+        if platform.system() != 'Windows':
+            raise OSError("The Win32 clipboard is only available on Windows")
+        # Private DLL handles so the pointer-sized signatures don't leak into other callers
+        self.user32 = ctypes.WinDLL('user32')
+        self.kernel32 = ctypes.WinDLL('kernel32')
+        self.user32.GetClipboardData.restype = wintypes.HANDLE
+        self.user32.SetClipboardData.argtypes = [wintypes.UINT, wintypes.HANDLE]
+        self.user32.SetClipboardData.restype = wintypes.HANDLE
+        self.kernel32.GlobalAlloc.argtypes = [wintypes.UINT, ctypes.c_size_t]
+        self.kernel32.GlobalAlloc.restype = wintypes.HGLOBAL
+        self.kernel32.GlobalLock.argtypes = [wintypes.HGLOBAL]
+        self.kernel32.GlobalLock.restype = wintypes.LPVOID
+        self.kernel32.GlobalUnlock.argtypes = [wintypes.HGLOBAL]
+        self.kernel32.GlobalSize.argtypes = [wintypes.HGLOBAL]
+        self.kernel32.GlobalSize.restype = ctypes.c_size_t
+        self.kernel32.GlobalFree.argtypes = [wintypes.HGLOBAL]
+        # Formats that clipboard managers are asked to honour by not looking at the content
+        self.sensitive_formats = [
+            self.user32.RegisterClipboardFormatW("ExcludeClipboardContentFromMonitorProcessing"),
+            self.user32.RegisterClipboardFormatW("Clipboard Viewer Ignore"),
+        ]
+
+    def _open(self):
+        """Open the clipboard, retrying briefly while another app holds it"""
+        for _ in range(20):
+            if self.user32.OpenClipboard(None):
+                return
+            time.sleep(0.01)
+        raise OSError("Clipboard is locked by another application")
+
+    def _read_format(self, fmt):
+        handle = self.user32.GetClipboardData(fmt)
+        if not handle:
+            return None
+        ptr = self.kernel32.GlobalLock(handle)
+        if not ptr:
+            return None
+        try:
+            return ctypes.string_at(ptr, self.kernel32.GlobalSize(handle))
+        finally:
+            self.kernel32.GlobalUnlock(handle)
+
+    def _write_format(self, fmt, data):
+        h_mem = self.kernel32.GlobalAlloc(GMEM_MOVEABLE, len(data))
+        ptr = self.kernel32.GlobalLock(h_mem)
+        ctypes.memmove(ptr, data, len(data))
+        self.kernel32.GlobalUnlock(h_mem)
+        if not self.user32.SetClipboardData(fmt, h_mem):
+            # Ownership only passes to the system on success
+            self.kernel32.GlobalFree(h_mem)
+            return False
+        return True
+
+    def get_text(self):
+        self._open()
+        try:
+            data = self._read_format(CF_UNICODETEXT)
+        finally:
+            self.user32.CloseClipboard()
+        if not data:
+            return None
+        return data.decode('utf-16le', errors='replace').split('\x00', 1)[0] or None
+
+    def set_text(self, text):
+        self._open()
+        try:
+            self.user32.EmptyClipboard()
+            return self._write_format(CF_UNICODETEXT, text.encode('utf-16le') + b'\x00\x00')
+        finally:
+            self.user32.CloseClipboard()
+
+    def clear(self):
+        self._open()
+        try:
+            return bool(self.user32.EmptyClipboard())
+        finally:
+            self.user32.CloseClipboard()
+
+    def change_count(self):
+        # Incremented by Windows on every change, and cheap: no need to open the clipboard
+        return self.user32.GetClipboardSequenceNumber()
+
+    def is_sensitive(self):
+        return any(self.user32.IsClipboardFormatAvailable(fmt) for fmt in self.sensitive_formats)
+
+    def snapshot(self, clear=False):
+        snapshot = {}
+        self._open()
+        try:
+            fmt = self.user32.EnumClipboardFormats(0)
+            while fmt:
+                if fmt not in GDI_HANDLE_FORMATS and fmt not in PRIVATE_HANDLE_FORMATS:
+                    data = self._read_format(fmt)
+                    if data is not None:
+                        snapshot[fmt] = data
+                fmt = self.user32.EnumClipboardFormats(fmt)
+            if clear:
+                self.user32.EmptyClipboard()
+        finally:
+            self.user32.CloseClipboard()
+        return snapshot
+
+    def restore(self, snapshot):
+        self._open()
+        try:
+            self.user32.EmptyClipboard()
+            ok = True
+            for fmt, data in snapshot.items():
+                ok = self._write_format(fmt, data) and ok
+            return ok
+        finally:
+            self.user32.CloseClipboard()
+
+
+class TkClipboardBackend(ClipboardBackend):
+    """X11 clipboard through a hidden Tk interpreter that keeps its display connection open
+
+    Tk talks to the X server directly, so reads and writes never fork a helper process.
+    The Tk root lives on its own thread because Tk objects may only be used from the
+    thread that created them, and it has to keep running to serve the selection to
+    other applications after we copy.
+    """
+    name = "tk"
+
+    # How often the Tk thread checks for pending requests (ms)
+    POLL_INTERVAL_MS = 10
+
+    def __init__(self):
+        if not os.environ.get("DISPLAY"):
+            raise OSError("No X11 display available")
+        self.requests = queue.Queue()
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+
+    def _run(self):
+        try:
+            import tkinter as tk
+            self.root = tk.Tk()
+            self.root.withdraw()
+            self.TclError = tk.TclError
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+
+        self.ready.set()
+        self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        self.root.mainloop()
+
+    def _poll(self):
+        while True:
+            try:
+                func, args, done, result = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                result.append(func(*args))
+            except Exception as e:
+                result.append(e)
+            done.set()
+        self.root.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def _call(self, func, *args, timeout=2.0):
+        """Run func on the Tk thread and return its result"""
+        done = threading.Event()
+        result = []
+        self.requests.put((func, args, done, result))
+        if not done.wait(timeout):
+            raise TimeoutError("Tk clipboard thread did not respond")
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+    def _get_text(self):
+        try:
+            return self.root.clipboard_get(type='UTF8_STRING')
+        except self.TclError:
+            try:
+                return self.root.clipboard_get()
+            except self.TclError:
+                return None  # Empty clipboard or no text format
+
+    def _set_text(self, text):
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+        # Flush so we own the selection before the caller simulates Ctrl+V
+        self.root.update_idletasks()
+        return True
+
+    def _targets(self):
+        try:
+            return self.root.tk.splitlist(
+                self.root.tk.call('selection', 'get', '-selection', 'CLIPBOARD', '-type', 'TARGETS'))
+        except self.TclError:
+            return []
+
+    def _snapshot(self, clear):
+        targets = self._targets()
+
+        snapshot = {}
+        for target in X11_TEXT_TARGETS:
+            if target in targets:
+                try:
+                    snapshot[target] = self.root.clipboard_get(type=target)
+                except self.TclError:
+                    pass
+        if clear:
+            self.root.clipboard_clear()
+            self.root.update_idletasks()
+        return snapshot
+
+    def _restore(self, snapshot):
+        self.root.clipboard_clear()
+        for target, data in snapshot.items():
+            self.root.clipboard_append(data, type=target)
+        self.root.update_idletasks()
+        return True
+
+    def get_text(self):
+        return self._call(self._get_text)
+
+    def set_text(self, text):
+        return self._call(self._set_text, text)
+
+    def is_sensitive(self):
+        return PASSWORD_MANAGER_HINT in self._call(self._targets)
+
+    def snapshot(self, clear=False):
+        # Tk can only hand out text targets as strings, so images are not preserved on X11
+        return self._call(self._snapshot, clear)
+
+    def restore(self, snapshot):
+        return self._call(self._restore, snapshot)
+
+    def close(self):
+        try:
+            self._call(self.root.quit)
+        except Exception:
+            pass
+
+
+class WaylandClipboardBackend(ClipboardBackend):
+    """Wayland clipboard through a single long-running `wl-paste --watch` helper
+
+    The helper pushes every clipboard change to us as a line holding the offered MIME
+    types and the text, both base64, so reading the text, checking for a password
+    manager and snapshotting text are memory lookups. Writing (set_text, clear,
+    restore) still runs `wl-copy`, since serving a Wayland selection needs a protocol
+    client of its own, and so does snapshotting an image.
+
+    wl-copy serves a single MIME type, so a snapshot keeps only the first image or
+    text type offered: rich content copied with several types (say HTML and plain
+    text) comes back as that one type.
+    """
+    name = "wayland"
+
+    def __init__(self):
+        if not os.environ.get("WAYLAND_DISPLAY"):
+            raise OSError("No Wayland display available")
+        if not shutil.which("wl-paste") or not shutil.which("wl-copy"):
+            raise OSError("wl-clipboard is not installed")
+
+        self.current_text = None
+        self.current_types = []
+        self.changes = 0
+        self.changed = threading.Condition()
+        # One line per change: "<types> <text>", the text arriving on the command's stdin
+        self.helper = subprocess.Popen(
+            ['wl-paste', '--no-newline', '--type', 'text', '--watch',
+             'sh', '-c', 'wl-paste --list-types </dev/null | base64 | tr -d "\\n"; printf " "; '
+                         'base64 | tr -d "\\n"; echo'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        threading.Thread(target=self._read_changes, daemon=True).start()
+
+    def _read_changes(self):
+        for line in self.helper.stdout:
+            types, _, text = line.rstrip(b'\n').partition(b' ')
+            try:
+                types = base64.b64decode(types).decode('utf-8', errors='replace').split()
+                text = base64.b64decode(text).decode('utf-8', errors='replace')
+            except Exception as e:
+                logger.warning("Bad clipboard update from wl-paste: %s", e)
+                continue
+            with self.changed:
+                self.current_text = text or None
+                self.current_types = types
+                self.changes += 1
+                self.changed.notify_all()
+
+    def get_text(self):
+        return self.current_text
+
+    def change_count(self):
+        return self.changes
+
+    def is_sensitive(self):
+        return PASSWORD_MANAGER_HINT in self.current_types
+
+    def set_text(self, text):
+        args = ['wl-copy'] if text else ['wl-copy', '--clear']
+        process = subprocess.run(args, input=text.encode('utf-8'), capture_output=True, check=False)
+        if process.returncode != 0:
+            return False
+        # Keep the cache consistent even before the watcher reports the change
+        with self.changed:
+            self.current_text = text or None
+            self.current_types = ['text/plain;charset=utf-8'] if text else []
+        return True
+
+    def snapshot(self, clear=False):
+        snapshot = {}
+        for mime_type in self.current_types:
+            # wl-copy serves a single type, so keep the first image or text type offered
+            if mime_type.startswith('text/plain') and self.current_text is not None:
+                snapshot[mime_type] = self.current_text.encode('utf-8')
+                break
+            if mime_type.startswith(('image/', 'text/')):
+                snapshot[mime_type] = subprocess.run(['wl-paste', '--no-newline', '--type', mime_type],
+                                                     capture_output=True, check=False).stdout
+                break
+        if clear:
+            self.clear()
+        return snapshot
+
+    def restore(self, snapshot):
+        if not snapshot:
+            return self.clear()
+        mime_type, data = next(iter(snapshot.items()))
+        process = subprocess.run(['wl-copy', '--type', mime_type], input=data, capture_output=True, check=False)
+        return process.returncode == 0
+
+    def close(self):
+        self.helper.terminate()
+
+
+class ClipboardSession:
+    """Snapshot the user's clipboard once, hand it over for a capture/paste round trip, then restore it
+
+    The snapshot holds the raw data of every format the backend can read, so images and
+    rich text survive the round trip. Leaving the `with` block restores it in one pass.
+    """
+
+    def __init__(self, backend=None, restore=True):
+        self.backend = backend or PyperclipClipboardBackend()
+        self.restore_on_exit = restore
+        self.snapshot = None
+        self.snapshot_seconds = 0.0
+        self.restore_seconds = 0.0
+
+    @property
+    def snapshot_bytes(self):
+        """Size of the held snapshot"""
+        return sum(len(data) for data in (self.snapshot or {}).values())
+
+    def __enter__(self):
+        start = time.perf_counter()
+        try:
+            # Snapshot and clear in the same pass so the capture can tell new text from old
+            snapshot = self.backend.snapshot(clear=True)
+            self.snapshot = snapshot if self.restore_on_exit else None
+        except Exception as e:
+            logger.warning("Clipboard snapshot failed: %s", e)
+            self.snapshot = None
+            try:
+                self.backend.clear()
+            except Exception:
+                pass
+        self.snapshot_seconds = time.perf_counter() - start
+        logger.debug("Clipboard snapshot: %s formats, %s bytes in %.1f ms",
+                     len(self.snapshot or {}), self.snapshot_bytes, self.snapshot_seconds * 1000)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.restore()
+        return False
+
+    def restore(self):
+        """Put the snapshot back (or leave the clipboard empty when restoring is disabled)"""
+        start = time.perf_counter()
+        try:
+            if self.snapshot is not None:
+                self.backend.restore(self.snapshot)
+            else:
+                self.backend.clear()
+        except Exception as e:
+            logger.warning("Clipboard restore failed: %s", e)
+        self.snapshot = None
+        self.restore_seconds = time.perf_counter() - start
+        logger.debug("Clipboard restored in %.1f ms", self.restore_seconds * 1000)
+
+
+def create_clipboard_backend():
+    """Create a persistent in-process clipboard backend, or None if none is available"""
+    if platform.system() == 'Windows':
+        backend_classes = (Win32ClipboardBackend,)
+    else:
+        backend_classes = (TkClipboardBackend, WaylandClipboardBackend)
+
+    for backend_class in backend_classes:
+        try:
+            backend = backend_class()
+            logger.info("Using %s clipboard backend", backend.name)
+            return backend
+        except Exception as e:
+            logger.debug("Clipboard backend %s unavailable: %s", backend_class.name, e)
+    return None
@@ -0,0 +1,154 @@
+import os
+import json
+import threading
+from types import MappingProxyType
+
+from app_logging import get_logger
+
+logger = get_logger("config_store")
+
+
+def freeze(value):
+    """Read-only copy of a JSON value: lists become tuples, objects mapping proxies"""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    return value
+
+
+def thaw(value):
+    """Plain JSON-serialisable copy of a frozen value"""
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    return value
+
+
+class ConfigStore:
+    """The app's settings as immutable snapshots, saved atomically and reloaded on external edits
+
+    Readers take store.snapshot, a single attribute read with no lock, and get a
+    read-only mapping that never changes under them. update() merges changes into a
+    new snapshot, writes it to a temp file next to the config file, moves that over
+    the file with os.replace (so a crash leaves the old or the new file, never half of
+    one) and publishes it. A watcher thread checks the file's modification time and
+    size, and loads and publishes edits made outside the app the same way.
+
+    Subscribers registered with subscribe(keys, callback) are called with the old and
+    new snapshots when one of their keys changed, in the thread that made the change.
+    """
+
+    def __init__(self, path, defaults, poll_interval=2.0):
+        self.path = path
+        self.defaults = dict(defaults)
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.subscribers = []
+        self.file_state = None
+        self.stop_event = threading.Event()
+        self.snapshot = freeze(self.defaults)
+
+    def load(self):
+        """Read the config file (writing the defaults if there is none) and publish it without notifying"""
+        self.file_state = self._stat()
+        try:
+            self.snapshot = freeze(self._read())
+            logger.info("Configuration loaded from %s", self.path)
+        except FileNotFoundError:
+            logger.debug("No configuration file found, using defaults")
+            self._write(self.snapshot)
+        except Exception as e:
+            logger.warning("Error loading configuration: %s", e)
+        return self.snapshot
+
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("the configuration must be a JSON object")
+        # Keys added in newer versions get their defaults
+        return dict(self.defaults, **data)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _write(self, snapshot):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(thaw(snapshot), f, indent=4)
+                f.write('\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self.file_state = self._stat()
+            logger.info("Configuration saved to %s", self.path)
+        except OSError as e:
+            logger.warning("Error saving configuration: %s", e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def preview(self, changes=None, **more):
+        """The snapshot update() would publish, without saving or publishing it"""
+        merged = dict(self.snapshot)
+        merged.update(changes or {}, **more)
+        return freeze(merged)
+
+    def update(self, changes=None, **more):
+        """Apply changes, save them and notify the subscribers of the keys that changed"""
+        with self.lock:
+            new = self.preview(changes, **more)
+            if new == self.snapshot:
+                return new
+            self._write(new)
+            self._publish(new)
+            return new
+
+    def subscribe(self, keys, callback):
+        """Call callback(old, new) whenever one of keys changes"""
+        self.subscribers.append((frozenset(keys), callback))
+
+    def _publish(self, new):
+        old, self.snapshot = self.snapshot, new
+        changed = {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+        logger.debug("Configuration changed: %s", sorted(changed))
+        for keys, callback in self.subscribers:
+            if keys & changed:
+                try:
+                    callback(old, new)
+                except Exception as e:
+                    logger.warning("Error applying configuration change: %s", e)
+
+    def start_watching(self):
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.poll_interval):
+            state = self._stat()
+            if state is None or state == self.file_state:
+                continue
+            with self.lock:
+                # Remembered even if the file can't be read, so a broken edit is reported once
+                self.file_state = state
+                try:
+                    new = freeze(self._read())
+                except Exception as e:
+                    # Most likely an editor halfway through saving, its next write is picked up again
+                    logger.warning("Ignoring unreadable configuration edit: %s", e)
+                    continue
+                if new != self.snapshot:
+                    logger.info("Configuration file changed on disk, applying it")
+                    self._publish(new)
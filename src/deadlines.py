@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import Counter
+
+from app_logging import get_logger
+
+logger = get_logger("deadlines")
+
+# Share of the end-to-end budget each stage may use. Time a stage leaves unused
+# rolls over to the next one, time it overruns is taken from the ones after it.
+STAGE_SHARES = (
+    ("capture", 0.20),
+    ("request", 0.70),
+    ("paste", 0.10),
+)
+
+# Ways to degrade when the request stage runs out of time
+FALLBACKS = ["abort", "partial", "faster_model"]
+
+
+class DeadlineExceeded(Exception):
+    """A stage of the rephrase ran out of its time budget"""
+
+    def __init__(self, stage, partial=''):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+        # Text streamed before the deadline hit, if any
+        self.partial = partial
+
+
+class DeadlineMisses:
+    """Per-stage count of deadline misses, shared by all the deadlines of the app"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, stage):
+        with self.lock:
+            self.counts[stage] += 1
+            return dict(self.counts)
+
+
+class Deadline:
+    """End-to-end time budget of one hotkey press, split across the capture, request and paste stages"""
+
+    def __init__(self, total_seconds, misses=None, shares=STAGE_SHARES):
+        self.start = time.monotonic()
+        self.total_seconds = total_seconds
+        self.misses = misses
+        self.missed = []
+
+        # Absolute end of each stage: the cumulative share of the budget
+        self.stage_ends = {}
+        elapsed_share = 0.0
+        for stage, share in shares:
+            elapsed_share += share
+            self.stage_ends[stage] = self.start + total_seconds * elapsed_share
+
+    @classmethod
+    def from_remaining(cls, remaining, misses=None):
+        """Rebuild a deadline from stage_remaining() of one made in another process"""
+        deadline = cls(max(remaining.values(), default=0), misses, shares=())
+        deadline.stage_ends = {stage: deadline.start + seconds for stage, seconds in remaining.items()}
+        return deadline
+
+    def stage_remaining(self):
+        """Seconds left in every stage; monotonic clocks don't compare across processes"""
+        return {stage: self.remaining(stage) for stage in self.stage_ends}
+
+    def remaining(self, stage):
+        """Seconds left until stage must be done (negative once it overran)"""
+        return self.stage_ends[stage] - time.monotonic()
+
+    def miss(self, stage):
+        """Record that stage missed its deadline"""
+        self.missed.append(stage)
+        if self.misses:
+            counts = self.misses.add(stage)
+            logger.warning("Deadline missed during %s, misses so far: %s", stage, counts)
+
+    def end_stage(self, stage):
+        """Mark stage as finished, counting a miss if it overran; returns False on a miss"""
+        if self.remaining(stage) < 0:
+            self.miss(stage)
+            return False
+        return True
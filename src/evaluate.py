@@ -0,0 +1,283 @@
+"""Compare models and creativity levels on a corpus by speed and by how much they change the text
+
+Usage: python evaluate.py corpus.jsonl [--models a,b] [--creativity 2,5,8] [--record FILE | --offline FILE]
+                          [--repeat N] [--output comparison.csv] [--min-change X] [--max-change X]
+
+Every corpus item is rephrased through the pipeline once per model and creativity
+level (--repeat times), one request at a time so the timings don't disturb each
+other. Each request is measured for time to first chunk, total time and output
+tokens per second, and scored with the change ratio: the character edit distance
+between input and output divided by the length of the longer one.
+
+Live runs can be recorded with --record. The recording holds the response texts
+(unlike trace.jsonl, which never contains the user's words), so --offline can run
+the same comparison again later with no network, answering every request from the
+recording with its recorded timing. The comparison table is printed and written to
+--output, and the fastest combination whose median change ratio lies between
+--min-change and --max-change is recommended.
+"""
+import os
+import csv
+import time
+import argparse
+import statistics
+
+from bulk_rephrase import read_corpus
+from model_catalog import ModelCatalog, tokens_per_second
+from pipeline import APP_DIR, load_pipeline
+from providers import ModelProvider, MockProvider, ProviderError
+from replay import percentile
+from tracing import TraceRecorder, read_trace, text_digest
+
+TABLE_FIELDS = ["model", "creativity", "requests", "errors", "ttfb_p50", "total_p50", "total_p95",
+                "tokens_per_second", "change_median", "change_mean", "acceptable"]
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings, bit-parallel (Myers 1999, Hyyrö 2001)
+
+    One column of the dynamic programming table is kept as bit vectors of vertical
+    +1/-1 differences, with Python ints as vectors as wide as the shorter string, so
+    each character of the longer one costs a handful of whole-column operations
+    instead of one step per cell.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+
+    peq = {}
+    for i, ch in enumerate(b):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << len(b)) - 1
+    high = 1 << (len(b) - 1)
+    pv, mv, score = mask, 0, len(b)
+
+    for ch in a:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # The top row grows by one per character, so a 1 is shifted in
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def change_ratio(original, rephrased):
+    """Share of the text the model changed, 0 for an unchanged text and 1 for a complete rewrite"""
+    longest = max(len(original), len(rephrased))
+    return edit_distance(original, rephrased) / longest if longest else 0.0
+
+
+def recording_key(model, temperature, prompt_sha):
+    return model, round(temperature, 3), prompt_sha
+
+
+class RecordingProvider(ModelProvider):
+    """Streams every request through provider, timing it and optionally recording it with its response
+
+    The timing of the latest request is kept in last; requests are expected one at a time.
+    """
+
+    def __init__(self, provider, recorder=None):
+        self.provider = provider
+        self.recorder = recorder
+        self.name = provider.name
+        self.last = None
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        self.last = None
+        start = time.perf_counter()
+        ttfb = None
+        chunks = []
+        for chunk in self.provider.stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout):
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            chunks.append(chunk)
+            yield chunk
+
+        response = ''.join(chunks)
+        self.last = {"ttfb": ttfb, "total": time.perf_counter() - start, "chunks": len(chunks)}
+        if self.recorder:
+            self.recorder.record(t=round(time.time(), 3), provider=self.name, model=model, temperature=temperature,
+                                 prompt_sha=text_digest(prompt), response=response,
+                                 **{field: round(value, 4) if isinstance(value, float) else value
+                                    for field, value in self.last.items()})
+
+    def list_models(self):
+        return self.provider.list_models()
+
+
+class RecordedProvider(ModelProvider):
+    """Answers from a recording made with RecordingProvider, instantly, reporting the recorded timing
+
+    A prompt recorded several times (--repeat) gets its recordings in turn.
+    """
+    name = "recorded"
+
+    def __init__(self, records):
+        self.responses = {}
+        for record in records:
+            if "response" in record:
+                key = recording_key(record["model"], record["temperature"], record["prompt_sha"])
+                self.responses.setdefault(key, []).append(record)
+        self.used = {}
+        self.last = None
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        key = recording_key(model, temperature, text_digest(prompt))
+        recorded = self.responses.get(key)
+        if not recorded:
+            self.last = None
+            raise ProviderError(f"No recorded response for {model} at temperature {temperature}")
+        record = recorded[self.used.get(key, 0) % len(recorded)]
+        self.used[key] = self.used.get(key, 0) + 1
+        self.last = {"ttfb": record.get("ttfb"), "total": record.get("total"), "chunks": record.get("chunks")}
+        yield record["response"]
+
+    def list_models(self):
+        return sorted({model for model, _, _ in self.responses})
+
+    def creativity_levels(self):
+        return sorted({round(temperature * 10) for _, temperature, _ in self.responses})
+
+
+def evaluate(pipeline, provider, config, items, models, creativity_levels, repeat=1):
+    """Rephrase every item with every combination, returns the measurements per request"""
+    results = []
+    for model in models:
+        for creativity in creativity_levels:
+            request_config = dict(config, model=model, creativity_level=creativity)
+            for _ in range(repeat):
+                for item in items:
+                    result = {"model": model, "creativity": creativity, "id": item["id"]}
+                    try:
+                        response = pipeline.rephrase(item["text"], request_config)
+                    except Exception as e:
+                        print(f"{model} creativity {creativity}, item {item['id']} failed: {e}")
+                        result["error"] = str(e)
+                        results.append(result)
+                        continue
+                    timing = provider.last or {}
+                    result.update(ttfb=timing.get("ttfb"), total=timing.get("total"),
+                                  change=change_ratio(item["text"], response))
+                    if timing.get("total") is not None:
+                        result["tokens_per_second"] = tokens_per_second(len(response), timing["ttfb"] or 0,
+                                                                        timing["total"])
+                    results.append(result)
+    return results
+
+
+def comparison_table(results, min_change, max_change):
+    """One row per model and creativity level, in the order they were run"""
+    groups = {}
+    for result in results:
+        groups.setdefault((result["model"], result["creativity"]), []).append(result)
+
+    rows = []
+    for (model, creativity), group in groups.items():
+        done = [r for r in group if "error" not in r]
+        changes = [r["change"] for r in done]
+        throughputs = [r["tokens_per_second"] for r in done if r.get("tokens_per_second")]
+        totals = [r["total"] for r in done if r.get("total") is not None]
+        change_median = statistics.median(changes) if changes else None
+        rows.append({
+            "model": model,
+            "creativity": creativity,
+            "requests": len(group),
+            "errors": len(group) - len(done),
+            "ttfb_p50": percentile([r["ttfb"] for r in done if r.get("ttfb") is not None], 0.5),
+            "total_p50": percentile(totals, 0.5),
+            "total_p95": percentile(totals, 0.95),
+            "tokens_per_second": statistics.median(throughputs) if throughputs else None,
+            "change_median": change_median,
+            "change_mean": statistics.mean(changes) if changes else None,
+            "acceptable": bool(done) and len(done) == len(group) and min_change <= change_median <= max_change,
+        })
+    return rows
+
+
+def recommend(rows):
+    """The acceptable row with the lowest median total time, None if there is none"""
+    acceptable = [row for row in rows if row["acceptable"]]
+    return min(acceptable, key=lambda row: row["total_p50"]) if acceptable else None
+
+
+def _cell(value):
+    if value is None or value != value:
+        return "-"  # No measurement (None or NaN)
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def print_table(rows):
+    widths = {field: max([len(field)] + [len(_cell(row[field])) for row in rows]) for field in TABLE_FIELDS}
+    print("  ".join(field.ljust(widths[field]) for field in TABLE_FIELDS))
+    for row in rows:
+        print("  ".join(_cell(row[field]).ljust(widths[field]) for field in TABLE_FIELDS))
+
+
+def write_table(rows, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: "" if row[field] is None else row[field] for field in TABLE_FIELDS})
+
+
+def _split(value, convert=str):
+    return [convert(part.strip()) for part in value.split(',') if part.strip()] if value else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="corpus file (.jsonl with a text field, or one snippet per line)")
+    parser.add_argument("--models", help="comma-separated models (default: the cached model list, "
+                                         "or the recorded models with --offline)")
+    parser.add_argument("--creativity", help="comma-separated creativity levels 0-10 (default: the configured one, "
+                                             "or the recorded ones with --offline)")
+    parser.add_argument("--config", help="config.json to take the provider and instructions from")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--record", help="append the live requests and their responses to this file")
+    source.add_argument("--offline", help="answer from a file written with --record instead of the provider")
+    parser.add_argument("--mock", action="store_true", help="use the local mock provider instead of the configured one")
+    parser.add_argument("--repeat", type=int, default=1, help="times each item is sent per combination")
+    parser.add_argument("--output", default="comparison.csv", help="CSV file for the comparison table")
+    parser.add_argument("--min-change", type=float, default=0.01, help="smallest acceptable median change ratio")
+    parser.add_argument("--max-change", type=float, default=0.5, help="largest acceptable median change ratio")
+    args = parser.parse_args()
+
+    if args.offline:
+        provider = RecordedProvider(read_trace(args.offline))
+        pipeline, config = load_pipeline(args.config, provider=provider)
+        models = _split(args.models) or provider.list_models()
+        creativity_levels = _split(args.creativity, int) or provider.creativity_levels()
+    else:
+        pipeline, config = load_pipeline(args.config, provider=MockProvider() if args.mock else None)
+        provider = RecordingProvider(pipeline.provider, TraceRecorder(args.record) if args.record else None)
+        pipeline.provider = provider
+        models = _split(args.models) or ModelCatalog(os.path.join(APP_DIR, "model_catalog.json")).names(config)
+        creativity_levels = _split(args.creativity, int) or [config.get("creativity_level", 5)]
+
+    items = read_corpus(args.corpus)
+    print(f"Evaluating {len(items)} items with {len(models)} models at creativity {creativity_levels}")
+    rows = comparison_table(evaluate(pipeline, provider, config, items, models, creativity_levels, args.repeat),
+                            args.min_change, args.max_change)
+    print_table(rows)
+    write_table(rows, args.output)
+
+    best = recommend(rows)
+    if best:
+        print(f"Fastest acceptable: {best['model']} at creativity {best['creativity']} "
+              f"(total p50={best['total_p50']:.3f}s, median change {best['change_median']:.1%})")
+    else:
+        print(f"No combination kept its median change ratio within {args.min_change}-{args.max_change} without errors")
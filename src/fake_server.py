@@ -0,0 +1,213 @@
+"""Local OpenAI-compatible stand-in server for offline testing and load replay
+
+Usage: python fake_server.py [--port 8080] [--delay SECONDS] [--key-limit KEY=REQUESTS ...] [--limit-window SECONDS]
+
+Point the app at it with provider "openai" and provider_url http://localhost:8080/v1.
+With --key-limit only the listed API keys are accepted, each allowed REQUESTS chat
+completions per --limit-window seconds before it gets HTTP 429, like a hosted API.
+"""
+import json
+import time
+import socket
+import select
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_logging import get_logger
+
+logger = get_logger("fake_server")
+
+
+def echo_responder(delay=0.0, chunk_size=16):
+    """Responder that echoes the task text back, spreading delay evenly over the chunks"""
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        text = prompt.split("Text for the task:\n", 1)[-1].rstrip('\n')
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or ['']
+        return [(delay / len(chunks), chunk) for chunk in chunks]
+    return respond
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like a real inference server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("Stand-in server: " + format, *args)
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _check_key(self):
+        """Enforce the per-key limits, returns the rate limit headers or None if an error was sent"""
+        if self.server.key_limits is None:
+            return {}
+        key = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        if key not in self.server.key_limits:
+            self._send_json(401, {"error": {"message": "Invalid API key", "code": "invalid_api_key"}})
+            return None
+
+        allowed, remaining, reset = self.server.take_request(key)
+        headers = {
+            "x-ratelimit-limit-requests": str(self.server.key_limits[key]),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{reset:.1f}s",
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(int(reset + 0.999), 1))
+            self._send_json(429, {"error": {"message": "Rate limit reached for this key", "code": "rate_limit_exceeded"}},
+                            headers)
+            return None
+        return headers
+
+    def _wait(self, delay):
+        """Sleep for delay seconds, returns False as soon as the client closes the connection"""
+        readable, _, _ = select.select([self.connection], [], [], delay)
+        if not readable:
+            return True
+        try:
+            # Nothing is pipelined after a request, so the only thing to read is the end of the stream
+            if self.connection.recv(1, socket.MSG_PEEK):
+                return True
+        except OSError:
+            pass
+        self.server.disconnects.append(time.monotonic())
+        self.close_connection = True
+        return False
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in self.server.models]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip('/').endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        rate_limit_headers = self._check_key()
+        if rate_limit_headers is None:
+            return
+
+        self.server.requests += 1
+        plan = self.server.responder(body)
+        model = body.get("model", "stand-in")
+
+        if not body.get("stream"):
+            if not self._wait(sum(delay for delay, _ in plan)):
+                return
+            text = ''.join(chunk for _, chunk in plan)
+            self._send_json(200, {
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            }, rate_limit_headers)
+            return
+
+        # Server-sent events over chunked transfer encoding
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in rate_limit_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            for delay, chunk in plan:
+                if delay and not self._wait(delay):
+                    return
+                event = {"object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": chunk}}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Stand-in server: client went away mid-stream")
+            self.server.disconnects.append(time.monotonic())
+            self.close_connection = True
+
+
+class StandInServer(ThreadingHTTPServer):
+    """OpenAI-compatible server whose responses and timing come from a responder callable
+
+    The responder gets the decoded request body and returns a list of
+    (delay_seconds, text) chunks to send. key_limits ({api_key: requests}) turns on
+    per-key fixed-window rate limits of limit_window seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, responder=None, models=None, key_limits=None, limit_window=60.0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.responder = responder or echo_responder()
+        self.models = models or ["stand-in"]
+        self.requests = 0
+        # When clients closed the connection before their response was complete
+        self.disconnects = []
+        self.thread = None
+        self.key_limits = key_limits
+        self.limit_window = limit_window
+        self.key_windows = {}  # api_key -> (window start, requests in window)
+        self.requests_by_key = {}
+        self.throttled_by_key = {}
+        self.limits_lock = threading.Lock()
+
+    def take_request(self, key):
+        """Count a request against key's window, returns (allowed, remaining, seconds until reset)"""
+        with self.limits_lock:
+            now = time.monotonic()
+            start, used = self.key_windows.get(key, (now, 0))
+            if now - start >= self.limit_window:
+                start, used = now, 0
+            allowed = used < self.key_limits[key]
+            if allowed:
+                used += 1
+                self.requests_by_key[key] = self.requests_by_key.get(key, 0) + 1
+            else:
+                self.throttled_by_key[key] = self.throttled_by_key.get(key, 0) + 1
+            self.key_windows[key] = (start, used)
+            return allowed, self.key_limits[key] - used, start + self.limit_window - now
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        """Serve on a background thread, returns self"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds each response takes")
+    parser.add_argument("--key-limit", action="append", metavar="KEY=REQUESTS",
+                        help="accept this API key for REQUESTS requests per window (repeatable)")
+    parser.add_argument("--limit-window", type=float, default=60.0, help="rate limit window in seconds")
+    args = parser.parse_args()
+
+    key_limits = None
+    if args.key_limit:
+        key_limits = {key: int(limit) for key, limit in (entry.rsplit('=', 1) for entry in args.key_limit)}
+    server = StandInServer(args.port, echo_responder(args.delay), key_limits=key_limits, limit_window=args.limit_window)
+    print(f"Stand-in server listening on {server.base_url}")
+    server.serve_forever()
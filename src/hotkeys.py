@@ -0,0 +1,542 @@
+import platform
+import queue
+import select
+import threading
+import ctypes
+from ctypes import wintypes
+
+from app_logging import get_logger
+
+logger = get_logger("hotkeys")
+
+# python-xlib is optional - only needed for the X11 backend on Linux
+try:
+    import Xlib.threaded  # noqa: F401 - makes the Xlib display thread-safe
+    from Xlib import X, XK
+    from Xlib.display import Display
+except ImportError:
+    Display = None
+
+# How long the X11 backend waits for the KeyPress that follows an autorepeat KeyRelease
+X11_REPEAT_WAIT = 0.02
+
+# Win32 hotkey constants
+MOD_ALT = 0x0001
+MOD_CONTROL = 0x0002
+MOD_SHIFT = 0x0004
+MOD_WIN = 0x0008
+MOD_NOREPEAT = 0x4000
+WM_HOTKEY = 0x0312
+WM_QUIT = 0x0012
+WM_APP_SYNC = 0x8000 + 1  # WM_APP + 1, wakes the message loop to process pending requests
+
+MODIFIER_ALIASES = {
+    "ctrl": "ctrl", "control": "ctrl",
+    "alt": "alt", "option": "alt",
+    "shift": "shift",
+    "win": "win", "windows": "win", "cmd": "win", "command": "win", "super": "win",
+}
+
+KEY_ALIASES = {
+    "return": "enter",
+    "escape": "esc",
+    "del": "delete",
+    "ins": "insert",
+    "pgup": "page up",
+    "pgdn": "page down",
+    "spacebar": "space",
+}
+
+WIN32_VIRTUAL_KEYS = {
+    "backspace": 0x08, "tab": 0x09, "enter": 0x0D, "esc": 0x1B, "space": 0x20,
+    "page up": 0x21, "page down": 0x22, "end": 0x23, "home": 0x24,
+    "left": 0x25, "up": 0x26, "right": 0x27, "down": 0x28,
+    "insert": 0x2D, "delete": 0x2E, "pause": 0x13, "print screen": 0x2C,
+}
+
+X11_KEYSYM_NAMES = {
+    "enter": "Return", "esc": "Escape", "space": "space", "tab": "Tab",
+    "backspace": "BackSpace", "delete": "Delete", "insert": "Insert",
+    "home": "Home", "end": "End", "page up": "Prior", "page down": "Next",
+    "left": "Left", "up": "Up", "right": "Right", "down": "Down",
+    "pause": "Pause", "print screen": "Print",
+}
+
+
+def parse_shortcut(shortcut):
+    """Split a shortcut string like 'ctrl+shift+r' into (modifiers, key)"""
+    parts = [part.strip().lower() for part in shortcut.split('+') if part.strip()]
+    if not parts:
+        raise ValueError(f"Empty shortcut: {shortcut!r}")
+
+    modifiers = set()
+    key = None
+    for part in parts:
+        if part in MODIFIER_ALIASES:
+            modifiers.add(MODIFIER_ALIASES[part])
+        elif key is None:
+            key = KEY_ALIASES.get(part, part)
+        else:
+            raise ValueError(f"Shortcut has more than one non-modifier key: {shortcut!r}")
+
+    if key is None:
+        raise ValueError(f"Shortcut has no non-modifier key: {shortcut!r}")
+    return frozenset(modifiers), key
+
+
+def format_shortcut(modifiers, key):
+    """Build a canonical shortcut string from modifiers and key"""
+    ordered = [m for m in ("ctrl", "alt", "shift", "win") if m in modifiers]
+    return '+'.join(ordered + [key])
+
+
+class HotkeyBackend:
+    """Base class for the global hotkey backends"""
+    name = "base"
+
+    # True if non-matching keystrokes never reach Python code
+    os_filtered = False
+
+    def register(self, shortcut, callback):
+        """Register a global shortcut that calls callback when pressed"""
+        raise NotImplementedError
+
+    def unregister(self, shortcut):
+        """Remove one registered shortcut"""
+        raise NotImplementedError
+
+    def unregister_all(self):
+        """Remove every registered shortcut"""
+        raise NotImplementedError
+
+    def record_next(self, callback):
+        """Capture the next key combination and pass it to callback as a shortcut string"""
+        raise NotImplementedError
+
+    def stop_recording(self):
+        """Abort a pending record_next call"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any OS resources held by the backend"""
+        self.unregister_all()
+
+
+class KeyboardHookBackend(HotkeyBackend):
+    """Hotkeys through the `keyboard` package's global low-level hook
+
+    Every keystroke in the system runs a Python callback with this backend, so it is
+    only used when no OS-registered backend is available.
+    """
+    name = "keyboard"
+
+    def __init__(self):
+        import keyboard
+        self.keyboard = keyboard
+        self.recording = False
+
+    def register(self, shortcut, callback):
+        # suppress=True prevents other applications from processing the hotkey
+        self.keyboard.add_hotkey(shortcut, callback, suppress=True)
+        logger.debug("Keyboard hook set up for shortcut: %s with suppression", shortcut)
+
+    def unregister(self, shortcut):
+        self.keyboard.remove_hotkey(shortcut)
+
+    def unregister_all(self):
+        self.keyboard.unhook_all()
+
+    def record_next(self, callback):
+        self.recording = True
+
+        def on_press(event):
+            if not self.recording:
+                return
+
+            key_name = event.name
+            # If it's just a modifier key press, ignore it
+            if key_name in MODIFIER_ALIASES:
+                return
+
+            modifiers = {m for m in ("ctrl", "alt", "shift") if self.keyboard.is_pressed(m)}
+            self.stop_recording()
+            callback(format_shortcut(modifiers, key_name))
+
+        self.keyboard.unhook_all()
+        self.keyboard.on_press(on_press)
+
+    def stop_recording(self):
+        if self.recording:
+            self.recording = False
+            self.keyboard.unhook_all()
+
+
+class Win32HotkeyBackend(HotkeyBackend):
+    """Hotkeys registered with the OS through RegisterHotKey
+
+    Windows only delivers WM_HOTKEY for the registered combinations, so ordinary typing
+    never wakes the interpreter and the hotkey is swallowed by the OS itself.
+    """
+    name = "win32"
+    os_filtered = True
+
+    def __init__(self):
+        if platform.system() != 'Windows':
+            raise OSError("Win32 hotkeys are only available on Windows")
+        self.user32 = ctypes.windll.user32
+        self.kernel32 = ctypes.windll.kernel32
+        self.callbacks = {}
+        self.shortcut_ids = {}
+        self.next_id = 1
+        self.requests = queue.Queue()
+        self.recording_backend = None
+        self.thread_id = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._message_loop, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def _message_loop(self):
+        """Own the hotkeys and pump WM_HOTKEY messages (RegisterHotKey is per-thread)"""
+        self.thread_id = self.kernel32.GetCurrentThreadId()
+        msg = wintypes.MSG()
+        # Force creation of the thread's message queue before anyone posts to it
+        self.user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, 0)
+        self.ready.set()
+
+        while self.user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            if msg.message == WM_HOTKEY:
+                callback = self.callbacks.get(msg.wParam)
+                if callback:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logger.warning("Hotkey callback failed: %s", e)
+            elif msg.message == WM_APP_SYNC:
+                self._drain_requests()
+
+        for hotkey_id in list(self.callbacks):
+            self.user32.UnregisterHotKey(None, hotkey_id)
+
+    def _drain_requests(self):
+        while True:
+            try:
+                func, args, done, result = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result.append(func(*args))
+            except Exception as e:
+                result.append(e)
+            done.set()
+
+    def _call_in_loop(self, func, *args):
+        """Run func on the message loop thread and return its result"""
+        if threading.get_ident() == self.thread.ident:
+            return func(*args)  # Already there (called from a hotkey callback)
+        done = threading.Event()
+        result = []
+        self.requests.put((func, args, done, result))
+        self.user32.PostThreadMessageW(self.thread_id, WM_APP_SYNC, 0, 0)
+        done.wait()
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+    def _virtual_key(self, key):
+        if key in WIN32_VIRTUAL_KEYS:
+            return WIN32_VIRTUAL_KEYS[key]
+        if len(key) > 1 and key[0] == 'f' and key[1:].isdigit():
+            return 0x70 + int(key[1:]) - 1  # VK_F1..VK_F24
+        if len(key) == 1:
+            if key.isalnum():
+                return ord(key.upper())
+            scan = self.user32.VkKeyScanW(ord(key))
+            if scan != -1:
+                return scan & 0xFF
+        raise ValueError(f"Unsupported key for Win32 hotkey: {key!r}")
+
+    def _register(self, shortcut, callback):
+        modifiers, key = parse_shortcut(shortcut)
+        flags = MOD_NOREPEAT
+        flags |= MOD_CONTROL if "ctrl" in modifiers else 0
+        flags |= MOD_ALT if "alt" in modifiers else 0
+        flags |= MOD_SHIFT if "shift" in modifiers else 0
+        flags |= MOD_WIN if "win" in modifiers else 0
+
+        hotkey_id = self.next_id
+        if not self.user32.RegisterHotKey(None, hotkey_id, flags, self._virtual_key(key)):
+            raise OSError(f"RegisterHotKey failed for {shortcut} (already taken by another app?)")
+        self.next_id += 1
+        self.callbacks[hotkey_id] = callback
+        self.shortcut_ids[parse_shortcut(shortcut)] = hotkey_id
+
+    def _unregister(self, shortcut):
+        hotkey_id = self.shortcut_ids.pop(parse_shortcut(shortcut), None)
+        if hotkey_id is not None:
+            self.user32.UnregisterHotKey(None, hotkey_id)
+            self.callbacks.pop(hotkey_id, None)
+
+    def _unregister_all(self):
+        for hotkey_id in list(self.callbacks):
+            self.user32.UnregisterHotKey(None, hotkey_id)
+        self.callbacks.clear()
+        self.shortcut_ids.clear()
+
+    def register(self, shortcut, callback):
+        self._call_in_loop(self._register, shortcut, callback)
+        logger.debug("Win32 hotkey registered for shortcut: %s", shortcut)
+
+    def unregister(self, shortcut):
+        self._call_in_loop(self._unregister, shortcut)
+
+    def unregister_all(self):
+        self._call_in_loop(self._unregister_all)
+
+    def record_next(self, callback):
+        # Recording needs to see arbitrary keys, so a keyboard hook is installed only
+        # for the duration of the recording
+        self.recording_backend = KeyboardHookBackend()
+        self.recording_backend.record_next(callback)
+
+    def stop_recording(self):
+        if self.recording_backend:
+            self.recording_backend.stop_recording()
+            self.recording_backend = None
+
+    def close(self):
+        self.stop_recording()
+        self.user32.PostThreadMessageW(self.thread_id, WM_QUIT, 0, 0)
+        self.thread.join(timeout=1)
+
+
+class X11HotkeyBackend(HotkeyBackend):
+    """Hotkeys grabbed on the X11 root window through python-xlib
+
+    The X server only sends the grabbed combinations to this client and keeps them
+    from reaching the focused window.
+    """
+    name = "x11"
+    os_filtered = True
+
+    def __init__(self):
+        if Display is None:
+            raise ImportError("python-xlib is required for the X11 hotkey backend")
+        self.display = Display()
+        self.root = self.display.screen().root
+        self.modifier_masks = {
+            "ctrl": X.ControlMask, "shift": X.ShiftMask,
+            "alt": X.Mod1Mask, "win": X.Mod4Mask,
+        }
+        # CapsLock and NumLock must not stop the hotkey from matching
+        self.ignored_masks = [0, X.LockMask, X.Mod2Mask, X.LockMask | X.Mod2Mask]
+        self.grabs = {}
+        # Keycodes pressed and not yet released, so holding a shortcut fires it once (like MOD_NOREPEAT)
+        self.held = set()
+        self.next_event = None
+        self.record_callback = None
+        self.running = True
+        self.thread = threading.Thread(target=self._event_loop, daemon=True)
+        self.thread.start()
+
+    def _keycode(self, key):
+        name = X11_KEYSYM_NAMES.get(key, key)
+        if len(key) > 1 and key[0] == 'f' and key[1:].isdigit():
+            name = key.upper()  # Function keys are F1..F35 in X11
+        keysym = XK.string_to_keysym(name)
+        keycode = self.display.keysym_to_keycode(keysym) if keysym else 0
+        if not keycode:
+            raise ValueError(f"Unsupported key for X11 hotkey: {key!r}")
+        return keycode
+
+    def _event_loop(self):
+        while self.running:
+            try:
+                event, self.next_event = self.next_event or self.display.next_event(), None
+                if event.type == X.KeyRelease:
+                    if not self._is_autorepeat(event):
+                        self.held.discard(event.detail)
+                    continue
+            except Exception as e:
+                if self.running:
+                    logger.warning("X11 hotkey event loop stopped: %s", e)
+                return
+            if event.type != X.KeyPress or event.detail in self.held:
+                continue
+            self.held.add(event.detail)
+
+            state = event.state & ~(X.LockMask | X.Mod2Mask)
+            if self.record_callback:
+                self._finish_recording(event.detail, state)
+                continue
+
+            callback = self.grabs.get((event.detail, state))
+            if callback:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.warning("Hotkey callback failed: %s", e)
+
+    def _is_autorepeat(self, release):
+        """True if release is the first half of an autorepeat, consuming the KeyPress that goes with it
+
+        X reports each repeat of a held key as a KeyRelease and a KeyPress with the same
+        time (XkbSetDetectableAutoRepeat would hide them, but python-xlib has no XKB).
+        """
+        if not self.display.pending_events():
+            select.select([self.display], [], [], X11_REPEAT_WAIT)
+            if not self.display.pending_events():
+                return False
+        event = self.display.next_event()
+        if event.type == X.KeyPress and event.detail == release.detail and event.time == release.time:
+            return True
+        self.next_event = event
+        return False
+
+    def _finish_recording(self, keycode, state):
+        keysym = self.display.keycode_to_keysym(keycode, 0)
+        key_name = None
+        for name, x11_name in X11_KEYSYM_NAMES.items():
+            if XK.string_to_keysym(x11_name) == keysym:
+                key_name = name
+        if key_name is None and XK.XK_F1 <= keysym <= XK.XK_F35:
+            key_name = f"f{keysym - XK.XK_F1 + 1}"
+        if key_name is None:
+            char = XK.keysym_to_string(keysym)
+            key_name = char.lower() if char else None
+        if not key_name:
+            return  # Just a modifier (or an unsupported key), keep waiting
+
+        modifiers = {name for name, mask in self.modifier_masks.items() if state & mask}
+        callback = self.record_callback
+        self.stop_recording()
+        callback(format_shortcut(modifiers, key_name))
+
+    def register(self, shortcut, callback):
+        keycode, mask = self._grab_key(shortcut)
+        for ignored in self.ignored_masks:
+            self.root.grab_key(keycode, mask | ignored, True, X.GrabModeAsync, X.GrabModeAsync)
+        self.grabs[(keycode, mask)] = callback
+        self.display.flush()
+        logger.debug("X11 hotkey grabbed for shortcut: %s", shortcut)
+
+    def _grab_key(self, shortcut):
+        modifiers, key = parse_shortcut(shortcut)
+        mask = 0
+        for modifier in modifiers:
+            mask |= self.modifier_masks[modifier]
+        return self._keycode(key), mask
+
+    def _ungrab(self, keycode, mask):
+        for ignored in self.ignored_masks:
+            self.root.ungrab_key(keycode, mask | ignored)
+
+    def unregister(self, shortcut):
+        grab = self._grab_key(shortcut)
+        if self.grabs.pop(grab, None):
+            self._ungrab(*grab)
+            self.held.discard(grab[0])
+            self.display.flush()
+
+    def unregister_all(self):
+        for keycode, mask in list(self.grabs):
+            self._ungrab(keycode, mask)
+        self.grabs.clear()
+        # A key released after its grab is gone never reports it
+        self.held.clear()
+        self.display.flush()
+
+    def record_next(self, callback):
+        self.record_callback = callback
+        self.root.grab_keyboard(True, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
+        self.display.flush()
+
+    def stop_recording(self):
+        if self.record_callback:
+            self.record_callback = None
+            self.display.ungrab_keyboard(X.CurrentTime)
+            self.held.clear()
+            self.display.flush()
+
+    def close(self):
+        self.running = False
+        self.stop_recording()
+        self.unregister_all()
+        self.display.close()
+
+
+class InMemoryHotkeyBackend(HotkeyBackend):
+    """Backend driven by press() calls instead of a real keyboard, for testing and benchmarks"""
+    name = "memory"
+
+    def __init__(self):
+        self.callbacks = {}
+        self.record_callback = None
+        self.keystrokes = 0
+
+    def register(self, shortcut, callback):
+        self.callbacks[parse_shortcut(shortcut)] = callback
+
+    def unregister(self, shortcut):
+        self.callbacks.pop(parse_shortcut(shortcut), None)
+
+    def unregister_all(self):
+        self.callbacks.clear()
+
+    def record_next(self, callback):
+        self.record_callback = callback
+
+    def stop_recording(self):
+        self.record_callback = None
+
+    def press(self, shortcut):
+        """Simulate a key combination being pressed, returns True if a hotkey fired"""
+        self.keystrokes += 1
+        combo = parse_shortcut(shortcut)
+        if self.record_callback:
+            callback = self.record_callback
+            self.record_callback = None
+            callback(format_shortcut(*combo))
+            return True
+
+        callback = self.callbacks.get(combo)
+        if callback:
+            callback()
+            return True
+        return False
+
+
+HOTKEY_BACKENDS = {
+    "win32": Win32HotkeyBackend,
+    "x11": X11HotkeyBackend,
+    "keyboard": KeyboardHookBackend,
+    "memory": InMemoryHotkeyBackend,
+}
+
+
+def create_hotkey_backend(preferred="auto"):
+    """Create the requested hotkey backend, or the cheapest one available for 'auto'
+
+    Falls back to an InMemoryHotkeyBackend when none can be set up; callers check for
+    it (backend.name == "memory") to tell the user the shortcut is unavailable.
+    """
+    if preferred and preferred != "auto":
+        candidates = [preferred]
+    elif platform.system() == 'Windows':
+        candidates = ["win32", "keyboard"]
+    else:
+        candidates = ["x11", "keyboard"]
+
+    errors = []
+    for name in candidates:
+        try:
+            backend = HOTKEY_BACKENDS[name]()
+            logger.info("Using %s hotkey backend", name)
+            return backend
+        except Exception as e:
+            logger.debug("Hotkey backend %s unavailable: %s", name, e)
+            errors.append(f"{name}: {e}")
+
+    # The in-memory backend never sees a real key press, so the shortcut is dead until this is fixed
+    logger.warning("No hotkey backend available (%s), the shortcut will not work", "; ".join(errors))
+    return InMemoryHotkeyBackend()
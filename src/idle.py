@@ -0,0 +1,185 @@
+import os
+import gc
+import sys
+import time
+import ctypes
+import threading
+from ctypes import wintypes
+
+from app_logging import get_logger
+
+logger = get_logger("idle")
+
+
+class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    _fields_ = [
+        ("cb", wintypes.DWORD),
+        ("PageFaultCount", wintypes.DWORD),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def resident_memory(pid=None):
+    """Resident memory of a process (this one by default) in bytes, None where it can't be read"""
+    if sys.platform == "win32":
+        kernel32 = ctypes.WinDLL('kernel32')
+        psapi = ctypes.WinDLL('psapi')
+        kernel32.OpenProcess.restype = wintypes.HANDLE
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        # PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ
+        handle = kernel32.OpenProcess(0x1000 | 0x0010, False, pid) if pid else kernel32.GetCurrentProcess()
+        if not handle:
+            return None
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        try:
+            if not psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return None
+            return counters.WorkingSetSize
+        finally:
+            if pid:
+                kernel32.CloseHandle(handle)
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def trim_memory():
+    """Hand memory freed by the garbage collector back to the OS where the allocator keeps it"""
+    try:
+        if sys.platform == "win32":
+            kernel32 = ctypes.WinDLL('kernel32')
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            kernel32.SetProcessWorkingSetSize.argtypes = [wintypes.HANDLE, ctypes.c_size_t, ctypes.c_size_t]
+            kernel32.SetProcessWorkingSetSize(kernel32.GetCurrentProcess(), ctypes.c_size_t(-1), ctypes.c_size_t(-1))
+        elif sys.platform.startswith("linux"):
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError) as e:
+        logger.debug("Cannot trim memory: %s", e)
+
+
+def megabytes(size):
+    return f"{size / 2**20:.1f} MB" if size is not None else "unknown"
+
+
+class IdleManager:
+    """Frees heavyweight resources after idle_seconds without activity and rebuilds them on next use
+
+    A watcher thread calls release() once the app has been idle long enough and busy()
+    is False, then collects garbage and trims the heap, logging resident memory before
+    and after. wake() starts rehydrate() on a background thread, so it overlaps with
+    whatever the caller does next (capturing the clipboard), and wait_awake() blocks
+    until it is done, recording how long the caller had to wait for it.
+    """
+
+    def __init__(self, idle_seconds, release, rehydrate, busy=lambda: False, check_interval=30):
+        self.idle_seconds = idle_seconds
+        self.release = release
+        self.rehydrate = rehydrate
+        self.busy = busy
+        self.check_interval = check_interval
+        self.last_activity = time.monotonic()
+        self.idle = False
+        self.waking = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        # Metrics
+        self.releases = 0
+        self.last_release = None  # {"before": bytes, "after": bytes, "seconds": ...}
+        self.wake_penalties = []
+
+    def start(self):
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def touch(self):
+        """Note activity, pushing the next release back"""
+        self.last_activity = time.monotonic()
+
+    def _is_idle(self):
+        # An idle_seconds of 0 turns idle mode off
+        return bool(self.idle_seconds) and time.monotonic() - self.last_activity >= self.idle_seconds
+
+    def _watch(self):
+        while not self.stop_event.wait(self.check_interval):
+            if not self.idle and self._is_idle():
+                self.release_now(only_if_idle=True)
+
+    def release_now(self, only_if_idle=False):
+        """Release the resources right away (the watcher does this after idle_seconds)
+
+        With only_if_idle nothing happens if there was activity in the last idle_seconds
+        or busy() is True. The lock is held from that check to the end of the release, so
+        a wake() arriving meanwhile waits for it and then rebuilds what was released.
+        """
+        with self.lock:
+            if self.idle or only_if_idle and (not self._is_idle() or self.busy()):
+                return
+            self.idle = True
+            start = time.perf_counter()
+            before = resident_memory()
+            try:
+                self.release()
+            except Exception as e:
+                logger.warning("Error releasing idle resources: %s", e)
+            gc.collect()
+            trim_memory()
+            after = resident_memory()
+            self.releases += 1
+            self.last_release = {"before": before, "after": after, "seconds": round(time.perf_counter() - start, 3)}
+        logger.info("Idle, released resources: resident memory %s -> %s", megabytes(before), megabytes(after))
+
+    def wake(self):
+        """Start rebuilding what release() dropped, if anything; returns at once"""
+        self.touch()
+        with self.lock:
+            if not self.idle:
+                return
+            self.idle = False
+            self.waking = threading.Thread(target=self._rehydrate, daemon=True)
+            self.waking.start()
+
+    def _rehydrate(self):
+        start = time.perf_counter()
+        try:
+            self.rehydrate()
+        except Exception as e:
+            logger.warning("Error rebuilding resources after idle: %s", e)
+        logger.info("Rebuilt resources after idle in %.0f ms", (time.perf_counter() - start) * 1000)
+
+    def wait_awake(self):
+        """Wait for a rehydration in progress, returns the seconds spent waiting"""
+        waking = self.waking
+        if not waking:
+            return 0.0
+        start = time.perf_counter()
+        waking.join()
+        penalty = time.perf_counter() - start
+        with self.lock:
+            if self.waking is waking:
+                self.waking = None
+                self.wake_penalties.append(round(penalty, 3))
+                logger.info("Waking from idle delayed the request by %.0f ms", penalty * 1000)
+        return penalty
+
+    def stats(self):
+        return {
+            "idle": self.idle,
+            "releases": self.releases,
+            "last_release": self.last_release,
+            "wake_penalties": self.wake_penalties[-10:],
+        }
@@ -0,0 +1,239 @@
+import time
+import threading
+from collections import deque
+
+from app_logging import get_logger
+from providers import ModelProvider, ProviderError
+
+logger = get_logger("key_pool")
+
+# Ways to pick the key for the next request
+STRATEGIES = ["least_loaded", "weighted_round_robin"]
+
+# Statuses that mean the key itself is bad, not just busy
+KEY_REJECTED_STATUSES = {401, 403}
+
+
+def configured_api_keys(config):
+    """The API keys in config: the "api_keys" list, or the single "api_key" """
+    keys = [key.strip() for key in config.get("api_keys") or [] if key.strip()]
+    if not keys and config.get("api_key"):
+        keys = [config["api_key"]]
+    return keys
+
+
+def error_status(error):
+    """HTTP status of a provider error (ProviderError.status, google-genai APIError.code)"""
+    return getattr(error, "status", None) or getattr(error, "code", None)
+
+
+def is_throttled(error):
+    """True if the error means this key hit a rate limit or its quota"""
+    message = str(error).lower()
+    return error_status(error) == 429 or "resource_exhausted" in message or "quota" in message
+
+
+def is_rejected(error):
+    """True if the error means the key itself is invalid or not allowed"""
+    return error_status(error) in KEY_REJECTED_STATUSES or "api key not valid" in str(error).lower()
+
+
+class KeyState:
+    """One API key of the pool with its own provider (and so its own connection pool)"""
+
+    def __init__(self, key, provider, weight=1, requests_per_minute=None):
+        self.key = key
+        self.provider = provider
+        self.weight = weight
+        self.requests_per_minute = requests_per_minute
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.recent = deque()  # Start times of the requests of the last minute, with requests_per_minute
+        self.total_requests = 0
+        self.throttled = 0
+        self.current_weight = 0  # Smooth weighted round-robin state
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def remaining_quota(self):
+        """Estimated requests left in the current window, None if unknown
+
+        Uses what the server last reported when it sends rate limit headers, otherwise
+        the requests_per_minute limit minus the requests of the last minute.
+        """
+        rate_limit = getattr(self.provider, "rate_limit", None)
+        if rate_limit:
+            return rate_limit["remaining"]
+        if self.requests_per_minute:
+            self.forget_old_requests()
+            return max(self.requests_per_minute - len(self.recent), 0)
+        return None
+
+    def note_request(self):
+        self.total_requests += 1
+        if self.requests_per_minute:
+            self.recent.append(time.monotonic())
+            self.forget_old_requests()
+
+    def forget_old_requests(self):
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+
+    def cool_down(self, seconds):
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+
+class KeyPoolProvider(ModelProvider):
+    """Spreads requests over several API keys of the same provider
+
+    Throttled keys (HTTP 429 or quota errors) cool down for the server's Retry-After or
+    cooldown seconds, rejected keys (401/403) for ten times as long, and the request is
+    retried on another key as long as no output was streamed yet.
+    """
+
+    def __init__(self, keys, make_provider, strategy="least_loaded", weights=None, cooldown=60,
+                 requests_per_minute=None):
+        if not keys:
+            raise ValueError("The key pool needs at least one API key")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown key pool strategy: {strategy}")
+        # Keys without a weight (say, added in the settings window) count as weight 1
+        weights = list(weights or [])[:len(keys)]
+        weights += [1] * (len(keys) - len(weights))
+        self.keys = [KeyState(key, make_provider(key), weight, requests_per_minute)
+                     for key, weight in zip(keys, weights)]
+        self.name = self.keys[0].provider.name
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+
+    def _acquire(self, exclude):
+        with self.lock:
+            candidates = [state for state in self.keys if state.available and state not in exclude]
+            if not candidates:
+                wait = min(state.cooldown_until for state in self.keys) - time.monotonic()
+                raise ProviderError(f"All API keys are cooling down, next one is free in {max(wait, 0):.0f}s",
+                                    status=429, retry_after=max(wait, 0))
+
+            if self.strategy == "least_loaded":
+                # Fewest requests in flight per unit of weight, then the most quota left
+                def load(state):
+                    remaining = state.remaining_quota()
+                    return (state.in_flight / state.weight, -(remaining if remaining is not None else float('inf')))
+                state = min(candidates, key=load)
+            else:
+                # Smooth weighted round-robin, as in nginx: even spread that honours the weights
+                total = sum(candidate.weight for candidate in candidates)
+                for candidate in candidates:
+                    candidate.current_weight += candidate.weight
+                state = max(candidates, key=lambda candidate: candidate.current_weight)
+                state.current_weight -= total
+
+            state.in_flight += 1
+            state.note_request()
+            return state
+
+    def _release(self, state, error=None):
+        with self.lock:
+            state.in_flight -= 1
+            if error is None:
+                state.consecutive_failures = 0
+                return
+            state.consecutive_failures += 1
+            if is_throttled(error):
+                state.throttled += 1
+                state.cool_down(getattr(error, "retry_after", None) or self.cooldown)
+                logger.warning("API key %s throttled, cooling down", mask_key(state.key))
+            elif is_rejected(error):
+                state.cool_down(self.cooldown * 10)
+                logger.warning("API key %s rejected, taking it out of rotation", mask_key(state.key))
+
+    def _retryable(self, error):
+        return is_throttled(error) or is_rejected(error)
+
+    def generate(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        tried = []
+        while True:
+            state = self._acquire(tried)
+            tried.append(state)
+            try:
+                result = state.provider.generate(prompt, model, temperature, max_output_tokens, cancel_token, timeout)
+            except Exception as e:
+                self._release(state, e)
+                if not self._retryable(e) or len(tried) == len(self.keys):
+                    raise
+                continue
+            self._release(state)
+            return result
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        tried = []
+        while True:
+            state = self._acquire(tried)
+            tried.append(state)
+            streamed = False
+            try:
+                for chunk in state.provider.stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                self._release(state, e)
+                # Once output reached the caller the request can't be replayed on another key
+                if streamed or not self._retryable(e) or len(tried) == len(self.keys):
+                    raise
+                continue
+            except BaseException:
+                self._release(state)
+                raise
+            self._release(state)
+            return
+
+    def list_models(self):
+        state = self._acquire([])
+        try:
+            return state.provider.list_models()
+        finally:
+            self._release(state)
+
+    def describe_models(self):
+        state = self._acquire([])
+        try:
+            return state.provider.describe_models()
+        finally:
+            self._release(state)
+
+    def health(self, model, timeout=10):
+        """Check every key, returns (ok, message) with ok if at least one key works"""
+        failures = []
+        for state in self.keys:
+            ok, message = state.provider.health(model, timeout)
+            if not ok:
+                failures.append(f"{mask_key(state.key)}: {message}")
+        if len(failures) == len(self.keys):
+            return False, "; ".join(failures)
+        if failures:
+            return True, f"{len(self.keys) - len(failures)} of {len(self.keys)} API keys work. " + "; ".join(failures)
+        return True, f"Connection successful! All {len(self.keys)} API keys are valid."
+
+    def stats(self):
+        """Per-key health for display and logging, with the keys masked"""
+        now = time.monotonic()
+        return [{
+            "key": mask_key(state.key),
+            "in_flight": state.in_flight,
+            "requests": state.total_requests,
+            "throttled": state.throttled,
+            "remaining": state.remaining_quota(),
+            "cooling_down_for": round(max(state.cooldown_until - now, 0)),
+        } for state in self.keys]
+
+
+def mask_key(key):
+    """Show only the last 3 characters of a key"""
+    if not key or len(key) <= 3:
+        return key
+    return '*' * (len(key) - 3) + key[-3:]
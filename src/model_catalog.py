@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import time
+import threading
+
+from app_logging import get_logger
+
+logger = get_logger("model_catalog")
+
+# Shown before the first listing from the provider has arrived
+FALLBACK_MODELS = {
+    "gemini": ['gemini-2.0-flash', 'gemini-2.0-flash-lite', 'gemini-1.5-flash', 'gemini-1.5-flash-8b'],
+}
+
+# Models that can't rephrase text: embeddings, speech, images, video, retrieval
+NON_TEXT_MODEL = re.compile(r"embed|aqa|imagen|image-generation|tts|whisper|dall-e|audio|live|rerank|moderation|veo",
+                            re.IGNORECASE)
+
+# Pinned releases and dated snapshots of a model that is also listed under its plain name
+VERSION_SUFFIX = re.compile(r"-(?:\d{3}|\d{2}-\d{2}|\d{4}-\d{2}-\d{2}|latest)$")
+
+# Too short an output limit to rephrase a paragraph
+MIN_OUTPUT_TOKENS = 1024
+
+# Weight of the newest request in the observed averages
+OBSERVED_SMOOTHING = 0.3
+
+# Rough characters per token, to turn streamed characters into a throughput
+CHARS_PER_TOKEN = 4
+
+
+def tokens_per_second(response_chars, first_chunk_seconds, total_seconds):
+    """Estimated output tokens per second of a request, None if it took no measurable time"""
+    # Streaming time after the first chunk, or the whole request when it came in one piece
+    generating = total_seconds - first_chunk_seconds if total_seconds > first_chunk_seconds else total_seconds
+    return response_chars / CHARS_PER_TOKEN / generating if generating > 0 else None
+
+
+def text_models(models):
+    """Keep the models that can rephrase text, leaving out duplicates of the same model
+
+    Models whose provider lists their methods must support generateContent. Pinned
+    versions (gemini-1.5-flash-002) are dropped when the plain name is listed too.
+    """
+    kept = []
+    for model in models:
+        if "actions" in model and "generateContent" not in model["actions"]:
+            continue
+        if NON_TEXT_MODEL.search(model["name"]):
+            continue
+        if (model.get("output_token_limit") or MIN_OUTPUT_TOKENS) < MIN_OUTPUT_TOKENS:
+            continue
+        kept.append(model)
+
+    names = {model["name"] for model in kept}
+    return [model for model in kept if VERSION_SUFFIX.sub('', model["name"]) not in names - {model["name"]}]
+
+
+def catalog_source(config):
+    """Which listing config uses: the provider, plus the server for OpenAI-compatible ones"""
+    provider = config.get("provider", "gemini")
+    if provider == "openai":
+        return f"openai {config.get('provider_url', '')}"
+    return provider
+
+
+class ModelCatalog:
+    """Model listings per provider cached on disk, plus the latency and throughput the app measured
+
+    A listing is fetched from the provider once and reused until it is older than ttl
+    seconds, so the settings window can fill its model list without waiting on the
+    network. Measurements are kept per model name, as an exponential moving average
+    of the time to the first chunk and the output tokens per second, and written to
+    the same file a few seconds after they change.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, save_delay=5.0):
+        self.path = path
+        self.ttl = ttl
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        # Held while writing, so the delayed save and refresh()'s don't share the temp file
+        self.save_lock = threading.Lock()
+        self.save_timer = None
+        self.listings = {}
+        self.observed = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.listings = data.get("listings", {})
+            self.observed = data.get("observed", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Ignoring unreadable model catalog %s: %s", self.path, e)
+
+    def save(self):
+        """Write the catalog atomically, so a crash never leaves a torn file behind"""
+        with self.save_lock:
+            with self.lock:
+                self.save_timer = None
+                data = json.dumps({"listings": self.listings, "observed": self.observed}, indent=1)
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.warning("Error saving model catalog: %s", e)
+
+    def _save_later(self):
+        with self.lock:
+            if self.save_timer:
+                return
+            self.save_timer = threading.Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def is_stale(self, config):
+        listing = self.listings.get(catalog_source(config))
+        return not listing or time.time() - listing["fetched_at"] > self.ttl
+
+    def models(self, config):
+        """The cached text models for config's provider, each with its observed figures (may be empty)"""
+        listing = self.listings.get(catalog_source(config))
+        if not listing:
+            return []
+        return [dict(model, observed=self.observed.get(model["name"])) for model in listing["models"]]
+
+    def names(self, config):
+        """Model names for the settings window: the cached listing, else a built-in list"""
+        names = [model["name"] for model in self.models(config)]
+        return names or list(FALLBACK_MODELS.get(config.get("provider", "gemini"), []))
+
+    def refresh(self, provider, config):
+        """Fetch the listing from provider, cache it and return its text models"""
+        start = time.perf_counter()
+        models = text_models(provider.describe_models())
+        logger.info("Fetched %s text models from %s in %.2fs", len(models), catalog_source(config),
+                    time.perf_counter() - start)
+        with self.lock:
+            self.listings[catalog_source(config)] = {"fetched_at": time.time(), "models": models}
+        self.save()
+        return self.models(config)
+
+    def observe(self, model, first_chunk_seconds, total_seconds, response_chars):
+        """Fold one finished request into the model's averages"""
+        throughput = tokens_per_second(response_chars, first_chunk_seconds, total_seconds)
+        with self.lock:
+            entry = self.observed.setdefault(model, {"requests": 0})
+            for field, value in (("first_chunk_seconds", first_chunk_seconds), ("tokens_per_second", throughput)):
+                if value is None:
+                    continue
+                previous = entry.get(field)
+                entry[field] = round(value if previous is None else
+                                     previous + OBSERVED_SMOOTHING * (value - previous), 3)
+            entry["requests"] += 1
+        self._save_later()
+
+    def describe(self, model):
+        """One line about how model has performed here, for the settings window"""
+        entry = self.observed.get(model)
+        if not entry:
+            return "Not used yet"
+        parts = [f"first words after {entry['first_chunk_seconds']:.1f}s"]
+        if entry.get("tokens_per_second"):
+            parts.append(f"~{entry['tokens_per_second']:.0f} tokens/s")
+        return f"{', '.join(parts)} (over {entry['requests']} requests)"
@@ -0,0 +1,87 @@
+import re
+import threading
+from collections import OrderedDict
+
+# A paragraph ends at a blank line (possibly holding spaces or tabs), the boundary the
+# system prompt tells the model to preserve
+PARAGRAPH_BREAK = re.compile(r"((?:\r?\n)[ \t]*(?:\r?\n)(?:[ \t]*\r?\n)*)")
+
+
+def split_paragraphs(text):
+    """Split text into (paragraphs, separators), with len(separators) == len(paragraphs) - 1
+
+    Joining them back with join_paragraphs gives the original text byte for byte.
+    """
+    parts = PARAGRAPH_BREAK.split(text)
+    return parts[0::2], parts[1::2]
+
+
+def join_paragraphs(paragraphs, separators):
+    pieces = [paragraphs[0]]
+    for separator, paragraph in zip(separators, paragraphs[1:]):
+        pieces.append(separator)
+        pieces.append(paragraph)
+    return ''.join(pieces)
+
+
+def split_padding(paragraph):
+    """Return (leading whitespace, content, trailing whitespace) of a paragraph"""
+    content = paragraph.strip()
+    if not content:
+        return paragraph, '', ''
+    start = paragraph.index(content)
+    return paragraph[:start], content, paragraph[start + len(content):]
+
+
+class ParagraphCache:
+    """Rephrased paragraphs keyed by their text plus the settings that shaped them
+
+    Only the content is stored. The original paragraph's surrounding whitespace and
+    the separators between paragraphs are put back from the input when stitching, so
+    the formatting of the output always matches the input.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Totals over every rephrase, for the reused-vs-sent ratio
+        self.reused_paragraphs = 0
+        self.sent_paragraphs = 0
+        self.reused_chars = 0
+        self.sent_chars = 0
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, content):
+        with self.lock:
+            self.entries[key] = content
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def count(self, reused, sent):
+        """Add the paragraphs of one rephrase to the totals, as lists of paragraph texts"""
+        with self.lock:
+            self.reused_paragraphs += len(reused)
+            self.sent_paragraphs += len(sent)
+            self.reused_chars += sum(len(p) for p in reused)
+            self.sent_chars += sum(len(p) for p in sent)
+
+    def stats(self):
+        total_chars = self.reused_chars + self.sent_chars
+        return {
+            "reused_paragraphs": self.reused_paragraphs,
+            "sent_paragraphs": self.sent_paragraphs,
+            "reused_char_ratio": round(self.reused_chars / total_chars, 3) if total_chars else None,
+        }
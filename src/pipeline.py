@@ -0,0 +1,233 @@
+import os
+import json
+import time
+
+from app_logging import get_logger
+from providers import create_provider
+from deadlines import DeadlineExceeded
+from paragraph_cache import split_paragraphs, join_paragraphs, split_padding
+from response_cache import response_key
+
+logger = get_logger("pipeline")
+
+# Directory holding config.json and system_prompt.txt next to the app
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Share of the request stage kept back for the faster model when "faster_model" is the deadline fallback
+FALLBACK_SHARE = 0.4
+
+
+def build_prompt(system_prompt, user_system_prompt, text, before=None, after=None):
+    """Create the prompt for the rephrasing task
+
+    before and after are the neighbouring paragraphs when only part of a document is
+    sent, so the model keeps the tone and flow without rewriting them.
+    """
+    if user_system_prompt.endswith(':'):
+        user_system_prompt = user_system_prompt[:-1]
+
+    context = ""
+    if before or after:
+        context = "Surrounding text, for context only. Do not rephrase it or include it in your answer:\n"
+        if before:
+            context += f"Before the text:\n{before}\n"
+        if after:
+            context += f"After the text:\n{after}\n"
+        context += "\n"
+
+    return f"""
+Your System Prompt:
+{system_prompt}
+
+User's instructions:
+{user_system_prompt}:
+
+{context}Text for the task:
+{text}
+"""
+
+
+class RephrasePipeline:
+    """The request path shared by the hotkey, the settings window and the offline tools"""
+
+    def __init__(self, provider, system_prompt, recorder=None, paragraph_cache=None, catalog=None):
+        self.provider = provider
+        self.system_prompt = system_prompt
+        # Optional TraceRecorder, requests are streamed while recording to capture chunk timing
+        self.recorder = recorder
+        # Optional ParagraphCache, unchanged paragraphs of a document rephrased before are reused
+        self.paragraph_cache = paragraph_cache
+        # Optional ModelCatalog, gets the latency and throughput of every finished request
+        self.catalog = catalog
+
+    def rephrase(self, text, config, cancel_token=None, deadline=None):
+        """Rephrase text with the model, instructions and creativity level from config
+
+        With a Deadline the request gets what is left of the request stage, and when that
+        runs out it degrades as config["deadline_fallback"] says (see _degrade).
+        """
+        if self.paragraph_cache:
+            return self._rephrase_paragraphs(text, config, cancel_token, deadline)
+        return self._rephrase_text(text, config, cancel_token, deadline)
+
+    def _rephrase_text(self, text, config, cancel_token=None, deadline=None, before=None, after=None):
+        """Send text in a single request"""
+        # Convert creativity level (0-10) to temperature (0-1)
+        temperature = config.get("creativity_level", 5) / 10
+        logger.debug("Using temperature: %s", temperature)
+
+        prompt = build_prompt(self.system_prompt, config["user_system_prompt"], text, before, after)
+        if deadline is None:
+            if self.recorder:
+                return ''.join(self._stream(prompt, text, config["model"], temperature, cancel_token))
+            start = time.perf_counter()
+            response = self.provider.generate(prompt, config["model"], temperature, cancel_token=cancel_token)
+            if self.catalog and response:
+                elapsed = time.perf_counter() - start
+                self.catalog.observe(config["model"], elapsed, elapsed, len(response))
+            return response
+
+        fallback = config.get("deadline_fallback", "abort")
+        fallback_model = config.get("fallback_model")
+        use_faster_model = fallback == "faster_model" and fallback_model and fallback_model != config["model"]
+        timeout = deadline.remaining("request")
+        if use_faster_model:
+            # Leave part of the request stage for the faster model
+            timeout *= 1 - FALLBACK_SHARE
+
+        # Streamed, so whatever arrived before the deadline is there to fall back on
+        chunks = []
+        try:
+            for chunk in self._stream(prompt, text, config["model"], temperature, cancel_token, timeout):
+                chunks.append(chunk)
+            return ''.join(chunks)
+        except TimeoutError:
+            deadline.miss("request")
+            return self._degrade(prompt, text, temperature, ''.join(chunks), fallback, fallback_model,
+                                 use_faster_model, cancel_token, deadline)
+
+    def _rephrase_paragraphs(self, text, config, cancel_token, deadline):
+        """Rephrase only the paragraphs not already in the paragraph cache and stitch the result
+
+        Runs of consecutive changed paragraphs go in one request each, with the paragraphs
+        around them as context. The whitespace around every paragraph and the separators
+        between them are copied from the input, so the output keeps its exact layout.
+        """
+        paragraphs, separators = split_paragraphs(text)
+        keys = [response_key(paragraph.strip(), config) for paragraph in paragraphs]
+        cached = [self.paragraph_cache.get(key) if paragraph.strip() else '' for key, paragraph in zip(keys, paragraphs)]
+        changed = [i for i, content in enumerate(cached) if content is None]
+
+        if not changed or not any(cached):
+            # Nothing to reuse: one request for the whole text gives the model the most context.
+            # Nothing changed: the user is asking for another take, so don't hand back the last one.
+            self.paragraph_cache.count([], [paragraph for paragraph in paragraphs if paragraph.strip()])
+            response = self._rephrase_text(text, config, cancel_token, deadline)
+            contents = self._remember(paragraphs, keys, response, deadline)
+            if not contents:
+                return response
+            cached, changed = contents, []
+        else:
+            reused = [paragraphs[i] for i, content in enumerate(cached) if content]
+            self.paragraph_cache.count(reused, [paragraphs[i] for i in changed])
+            logger.debug("Reusing %s of %s paragraphs, sending %s, totals: %s",
+                         len(reused), len(paragraphs), len(changed), self.paragraph_cache.stats())
+
+        # Each unit is (first paragraph, last paragraph + 1, content)
+        units = [(i, i + 1, content) for i, content in enumerate(cached) if content is not None]
+        for start, end in self._runs(changed):
+            run_text = join_paragraphs(paragraphs[start:end], separators[start:end - 1])
+            before = paragraphs[start - 1].strip() if start > 0 else None
+            after = paragraphs[end].strip() if end < len(paragraphs) else None
+            response = self._rephrase_text(run_text, config, cancel_token, deadline, before, after)
+            if not response:
+                return response
+            contents = self._remember(paragraphs[start:end], keys[start:end], response, deadline)
+            if contents:
+                units.extend((start + offset, start + offset + 1, content) for offset, content in enumerate(contents))
+            else:
+                # The model merged or split paragraphs, keep its answer for the run as one piece
+                units.append((start, end, response.strip()))
+        units.sort()
+
+        pieces = []
+        for number, (start, end, content) in enumerate(units):
+            leading = split_padding(paragraphs[start])[0]
+            trailing = split_padding(paragraphs[end - 1])[2]
+            pieces.append(leading + content + trailing if content else paragraphs[start])
+            if number < len(units) - 1:
+                pieces.append(separators[end - 1])
+
+        return ''.join(pieces)
+
+    @staticmethod
+    def _runs(indexes):
+        """Group sorted paragraph indexes into (start, end) runs of consecutive ones"""
+        runs = []
+        for i in indexes:
+            if runs and runs[-1][1] == i:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1])
+        return runs
+
+    def _remember(self, paragraphs, keys, response, deadline):
+        """Cache the response paragraph by paragraph, returns their contents (None if they don't line up)"""
+        if not response or (deadline and "request" in deadline.missed):
+            return None  # Never cache a partial or fallback answer
+        contents = [paragraph.strip() for paragraph in split_paragraphs(response)[0] if paragraph.strip()]
+        originals = [(paragraph, key) for paragraph, key in zip(paragraphs, keys) if paragraph.strip()]
+        if len(contents) != len(originals):
+            return None
+        for (paragraph, key), content in zip(originals, contents):
+            self.paragraph_cache.put(key, content)
+        # Blank paragraphs (leading or trailing newlines) were not sent and stay as they are
+        contents = iter(contents)
+        return [next(contents) if paragraph.strip() else '' for paragraph in paragraphs]
+
+    def _degrade(self, prompt, text, temperature, partial, fallback, fallback_model, use_faster_model,
+                 cancel_token, deadline):
+        """Answer from a faster model, paste the partial output, or raise DeadlineExceeded"""
+        if use_faster_model:
+            logger.info("Request deadline hit, falling back to %s", fallback_model)
+            try:
+                return ''.join(self._stream(prompt, text, fallback_model, temperature, cancel_token,
+                                            deadline.remaining("request")))
+            except TimeoutError:
+                raise DeadlineExceeded("request", partial)
+        if fallback == "partial" and partial:
+            logger.info("Request deadline hit, using the %s characters streamed so far", len(partial))
+            return partial
+        raise DeadlineExceeded("request", partial)
+
+    def _stream(self, prompt, text, model, temperature, cancel_token, timeout=None):
+        if self.recorder:
+            chunks = self.recorder.traced_stream(
+                self.provider, prompt, text, model, temperature, cancel_token=cancel_token, timeout=timeout)
+        else:
+            chunks = self.provider.stream(prompt, model, temperature, cancel_token=cancel_token, timeout=timeout)
+        return self._observed(chunks, model) if self.catalog else chunks
+
+    def _observed(self, chunks, model):
+        """Pass chunks through, reporting the request's timing to the catalog if it completes"""
+        start = time.perf_counter()
+        first_chunk = None
+        response_chars = 0
+        for chunk in chunks:
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+            response_chars += len(chunk)
+            yield chunk
+        if response_chars:
+            self.catalog.observe(model, first_chunk, time.perf_counter() - start, response_chars)
+
+
+def load_pipeline(config_path=None, provider=None, recorder=None):
+    """Build a pipeline from config.json and system_prompt.txt for the command-line tools"""
+    config_path = config_path or os.path.join(APP_DIR, "config.json")
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    with open(os.path.join(APP_DIR, "system_prompt.txt"), 'r') as f:
+        system_prompt = f.read()
+
+    return RephrasePipeline(provider or create_provider(config), system_prompt, recorder), config
@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from collections import Counter
+
+from app_logging import get_logger
+
+logger = get_logger("profiling")
+
+
+class ProfilingSession:
+    """On-demand profiling of the running app, safe to leave on during a problem session
+
+    While active it samples the stacks of every thread, runs the rephrase work under
+    cProfile and tracks allocations with tracemalloc. Duration is capped by max_seconds
+    and the sampler backs off if sampling costs more than max_overhead of wall time.
+    Reports are written to a timestamped folder under output_root when it stops.
+    A session covers one process only, the worker process runs its own (see
+    WorkerPipeline.profile).
+    """
+
+    def __init__(self, output_root, max_seconds=300, sample_interval=0.01, max_overhead=0.02, tracemalloc_frames=10):
+        self.output_root = output_root
+        self.max_seconds = max_seconds
+        self.base_interval = sample_interval
+        self.max_overhead = max_overhead
+        self.tracemalloc_frames = tracemalloc_frames
+        self.active = False
+        self.lock = threading.Lock()
+
+    def start(self, folder=None):
+        """Start profiling, returns False if a session is already running
+
+        Reports go to folder if given, else to a new timestamped folder under output_root.
+        """
+        with self.lock:
+            if self.active:
+                return False
+            self.active = True
+            self.started = time.time()
+            self.folder = folder or os.path.join(self.output_root, time.strftime("%Y%m%d-%H%M%S"))
+            self.samples = Counter()
+            self.sample_count = 0
+            self.stats = None
+            self.stop_event = threading.Event()
+
+            tracemalloc.start(self.tracemalloc_frames)
+            self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self.sampler.start()
+            self.timer = threading.Timer(self.max_seconds, self.stop)
+            self.timer.daemon = True
+            self.timer.start()
+        logger.info("Profiling started, reports will go to %s", self.folder)
+        return True
+
+    def stop(self):
+        """Stop profiling and write the reports, returns the report folder (None if not running)"""
+        with self.lock:
+            if not self.active:
+                return None
+            self.active = False
+            self.timer.cancel()
+            self.stop_event.set()
+        self.sampler.join(timeout=1)
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            self._write_samples()
+            self._write_cprofile()
+            self._write_allocations(snapshot)
+        except Exception as e:
+            logger.warning("Error writing profiling reports: %s", e)
+        logger.info("Profiling stopped, reports written to %s", self.folder)
+        return self.folder
+
+    def profile_call(self, func, *args):
+        """Run func under cProfile while a session is active, plain otherwise"""
+        if not self.active:
+            return func(*args)
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def _sample_loop(self):
+        own_thread = threading.get_ident()
+        interval = self.base_interval
+        while not self.stop_event.wait(interval):
+            sample_start = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 40:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+
+            # Back off if sampling eats more than the overhead budget
+            cost = time.perf_counter() - sample_start
+            interval = max(self.base_interval, cost / self.max_overhead)
+
+    def _write_samples(self):
+        """Collapsed stacks (flamegraph.pl / speedscope format) plus the hottest frames"""
+        with open(os.path.join(self.folder, "samples.collapsed"), 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        leaf_counts = Counter()
+        for stack, count in self.samples.items():
+            leaf_counts[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaf_counts.values()) or 1
+        with open(os.path.join(self.folder, "samples_top.txt"), 'w') as f:
+            f.write(f"{self.sample_count} samples over {time.time() - self.started:.1f}s\n\n")
+            for frame, count in leaf_counts.most_common(50):
+                f.write(f"{count / total:7.2%}  {frame}\n")
+
+    def _write_cprofile(self):
+        if self.stats is None:
+            return  # No rephrase ran while profiling
+        self.stats.dump_stats(os.path.join(self.folder, "rephrase.pstats"))
+        with open(os.path.join(self.folder, "rephrase_top.txt"), 'w') as f:
+            stats = pstats.Stats(os.path.join(self.folder, "rephrase.pstats"), stream=f)
+            stats.sort_stats("cumulative").print_stats(50)
+
+    def _write_allocations(self, snapshot):
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        with open(os.path.join(self.folder, "allocations_top.txt"), 'w') as f:
+            f.write("Top allocations by line:\n")
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"{stat}\n")
+            f.write("\nTracebacks of the 5 largest allocation sites:\n")
+            for stat in snapshot.statistics("traceback")[:5]:
+                f.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
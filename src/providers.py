@@ -0,0 +1,509 @@
+import json
+import time
+import queue
+import socket
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from app_logging import get_logger
+
+logger = get_logger("providers")
+
+# End-of-stream marker for the Gemini stream reader thread
+_STREAM_DONE = object()
+
+
+class ProviderError(Exception):
+    """A model provider request failed"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        # Seconds the server asked us to wait before trying again (HTTP 429/503)
+        self.retry_after = retry_after
+
+
+class ModelProvider:
+    """Base class for the model backends the rephrase pipeline can talk to"""
+    name = "base"
+
+    def generate(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        """Return the full response text for prompt"""
+        return ''.join(self.stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout))
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        """Yield the response text in chunks as it arrives
+
+        Raises Cancelled if cancel_token fires, and TimeoutError once the whole request
+        has taken more than timeout seconds.
+        """
+        raise NotImplementedError
+
+    def list_models(self):
+        """Return the names of the models that can generate text"""
+        raise NotImplementedError
+
+    def describe_models(self):
+        """Return every model the provider offers as a dict with at least a "name"
+
+        Providers that know more add "display_name", "input_token_limit",
+        "output_token_limit" and "actions" (the methods the model supports).
+        """
+        return [{"name": name} for name in self.list_models()]
+
+    def health(self, model, timeout=10):
+        """Check that the provider is reachable and model answers, returns (ok, message)"""
+        try:
+            response = self.generate("Hello", model, temperature=0.2, max_output_tokens=10, timeout=timeout)
+        except Exception as e:
+            return False, str(e)
+        if response:
+            return True, "Connection successful! API settings are valid."
+        return False, "Connection test returned empty response."
+
+
+class GeminiProvider(ModelProvider):
+    """Google Gemini through the google-genai SDK"""
+    name = "gemini"
+
+    def __init__(self, api_key, timeout=60):
+        from google import genai
+        from google.genai import types
+        self.types = types
+        # The response socket of the stream each reader thread is running, see _track_response
+        self.local = threading.local()
+        # The SDK takes its HTTP timeout in milliseconds, this default bounds list_models too.
+        # client_args (passed on to the httpx client) needs google-genai 1.11.0 or later
+        http_options = types.HttpOptions(timeout=int(timeout * 1000),
+                                         client_args={"event_hooks": {"response": [self._track_response]}})
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+
+    def _track_response(self, response):
+        """httpx response hook, runs on the thread that sent the request as soon as the headers are in"""
+        response_socket = getattr(self.local, "response_socket", None)
+        network_stream = response.extensions.get("network_stream")
+        if response_socket and network_stream:
+            response_socket.attach(network_stream.get_extra_info("socket"))
+
+    def _config(self, temperature, max_output_tokens, timeout=None):
+        return self.types.GenerateContentConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            http_options=self.types.HttpOptions(timeout=max(int(timeout * 1000), 1)) if timeout is not None else None
+        )
+
+    def generate(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        if cancel_token or timeout is not None:
+            # Streaming gives us chunk boundaries to abort the request at
+            return super().generate(prompt, model, temperature, max_output_tokens, cancel_token, timeout)
+        response = self.client.models.generate_content(
+            model=model,
+            contents=[prompt],
+            config=self._config(temperature, max_output_tokens)
+        )
+        if response and hasattr(response, "text"):
+            return response.text
+        return None
+
+    def _stream_chunks(self, prompt, model, temperature, max_output_tokens, timeout=None):
+        return self.client.models.generate_content_stream(
+            model=model,
+            contents=[prompt],
+            config=self._config(temperature, max_output_tokens, timeout)
+        )
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        if not cancel_token and timeout is None:
+            for chunk in self._stream_chunks(prompt, model, temperature, max_output_tokens):
+                if chunk.text:
+                    yield chunk.text
+            return
+
+        # The SDK call blocks, so it runs on a reader thread and we poll the token and the
+        # clock while waiting. When either fires (or the caller stops reading) the response
+        # socket is shut down, which ends the HTTP request, so the server stops generating
+        # and the reader's blocked read returns at once.
+        chunks = queue.Queue()
+        response_socket = _ResponseSocket()
+        finished = threading.Event()
+        give_up_at = time.monotonic() + timeout if timeout is not None else None
+
+        def read_stream():
+            self.local.response_socket = response_socket
+            try:
+                for chunk in self._stream_chunks(prompt, model, temperature, max_output_tokens, timeout):
+                    if response_socket.aborted:
+                        break
+                    chunks.put(chunk.text)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                self.local.response_socket = None
+                finished.set()
+                chunks.put(_STREAM_DONE)
+
+        threading.Thread(target=read_stream, daemon=True).start()
+        try:
+            yield from self._drain(chunks, cancel_token, give_up_at)
+        finally:
+            if not finished.is_set():
+                response_socket.abort()
+
+    def _drain(self, chunks, cancel_token, give_up_at):
+        """Yield the reader thread's chunks, checking the token and the clock at least every 50 ms"""
+        while True:
+            try:
+                item = chunks.get(timeout=0.05)
+            except queue.Empty:
+                item = None
+            if cancel_token:
+                cancel_token.check()
+            if item is _STREAM_DONE:
+                break
+            if give_up_at is not None and time.monotonic() >= give_up_at:
+                raise TimeoutError("Gemini request timed out")
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+
+    def list_models(self):
+        return [model["name"] for model in self.describe_models() if "generateContent" in model["actions"]]
+
+    def describe_models(self):
+        return [{
+            "name": model.name.split('/')[-1],
+            "display_name": getattr(model, "display_name", None),
+            "input_token_limit": getattr(model, "input_token_limit", None),
+            "output_token_limit": getattr(model, "output_token_limit", None),
+            "actions": list(getattr(model, "supported_actions", None) or []),
+        } for model in self.client.models.list()]
+
+
+class OpenAICompatibleProvider(ModelProvider):
+    """Any server speaking the OpenAI chat completions API (llama.cpp, vLLM, ...)
+
+    Connections are kept alive and reused between requests, so a server on the LAN
+    only pays the TCP handshake once.
+    """
+    name = "openai"
+
+    def __init__(self, base_url, api_key=None, timeout=60):
+        url = urlsplit(base_url.rstrip('/'))
+        self.scheme = url.scheme or "http"
+        self.host = url.hostname or "localhost"
+        self.port = url.port
+        self.base_path = url.path
+        self.api_key = api_key
+        self.timeout = timeout
+        self.idle_connections = []
+        self.lock = threading.Lock()
+        # Last rate limit the server reported: remaining requests and seconds until it resets
+        self.rate_limit = {}
+
+    def _get_connection(self):
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+        return self._new_connection()
+
+    def _new_connection(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _release_connection(self, connection):
+        with self.lock:
+            self.idle_connections.append(connection)
+
+    def _request(self, method, path, body=None, cancel_token=None, timeout=None):
+        """Send a request and return (connection, response, guard), raising ProviderError on HTTP errors"""
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        give_up_at = time.monotonic() + timeout if timeout is not None else None
+
+        for attempt in range(2):
+            if cancel_token:
+                cancel_token.check()
+            if give_up_at is not None and time.monotonic() >= give_up_at:
+                raise TimeoutError("Request timed out")
+            # A kept-alive connection may have been closed by the server, retry once on a fresh one
+            connection = self._get_connection() if attempt == 0 else self._new_connection()
+            guard = _RequestGuard(connection, cancel_token, give_up_at)
+            if give_up_at is not None and connection.sock is None:
+                # The guard can only shut down a connected socket, so bound the connect itself
+                connection.timeout = min(self.timeout, max(give_up_at - time.monotonic(), 0.001))
+            try:
+                connection.request(method, self.base_path + path, body=payload, headers=headers)
+                response = connection.getresponse()
+                if connection.timeout != self.timeout:
+                    connection.timeout = self.timeout
+                    if connection.sock:
+                        connection.sock.settimeout(self.timeout)
+                break
+            except (http.client.HTTPException, OSError):
+                guard.release()
+                connection.close()
+                guard.check()
+                if attempt == 1:
+                    raise
+
+        self._read_rate_limit(response)
+        if response.status >= 400:
+            message = response.read().decode('utf-8', errors='replace')
+            guard.release()
+            connection.close()
+            raise ProviderError(f"HTTP {response.status}: {message[:200]}", status=response.status,
+                                retry_after=_header_seconds(response.getheader("Retry-After")))
+        return connection, response, guard
+
+    def _read_rate_limit(self, response):
+        remaining = response.getheader("x-ratelimit-remaining-requests")
+        if remaining is not None and remaining.isdigit():
+            self.rate_limit = {
+                "remaining": int(remaining),
+                "reset": _header_seconds(response.getheader("x-ratelimit-reset-requests")),
+            }
+
+    def _chat_body(self, prompt, model, temperature, max_output_tokens, stream):
+        body = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "stream": stream,
+        }
+        if max_output_tokens:
+            body["max_tokens"] = max_output_tokens
+        return body
+
+    def generate(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        connection, response, guard = self._request(
+            "POST", "/chat/completions", self._chat_body(prompt, model, temperature, max_output_tokens, False),
+            cancel_token, timeout)
+        try:
+            data = json.loads(response.read())
+        except (http.client.HTTPException, OSError, ValueError):
+            connection.close()
+            guard.check()
+            raise
+        finally:
+            guard.release()
+        self._release_connection(connection)
+        return data["choices"][0]["message"]["content"]
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        connection, response, guard = self._request(
+            "POST", "/chat/completions", self._chat_body(prompt, model, temperature, max_output_tokens, True),
+            cancel_token, timeout)
+        finished = False
+        try:
+            # Server-sent events: one "data: {...}" line per chunk, terminated by "data: [DONE]"
+            for line in response:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+            response.read()  # Drain so the connection can be reused
+            finished = not guard.fired
+        except (http.client.HTTPException, OSError, ValueError):
+            # A cancelled or timed out request fails here because its socket was shut down under it
+            guard.check()
+            raise
+        finally:
+            guard.release()
+            if finished:
+                self._release_connection(connection)
+            else:
+                connection.close()
+        guard.check()
+
+    def _fetch_models(self, timeout=None):
+        connection, response, guard = self._request("GET", "/models", timeout=timeout or self.timeout)
+        try:
+            data = json.loads(response.read())
+        finally:
+            guard.release()
+        self._release_connection(connection)
+        return data.get("data", [])
+
+    def list_models(self, timeout=None):
+        return [model["id"] for model in self._fetch_models(timeout)]
+
+    def describe_models(self):
+        # The OpenAI listing has no capabilities, llama.cpp adds the context size under "meta"
+        return [{
+            "name": model["id"],
+            "input_token_limit": (model.get("meta") or {}).get("n_ctx_train"),
+        } for model in self._fetch_models()]
+
+    def health(self, model, timeout=10):
+        try:
+            models = self.list_models(timeout)
+        except Exception as e:
+            return False, f"Server unreachable: {e}"
+        if models and model not in models:
+            return False, f"Server is up but does not serve {model}"
+        return super().health(model, timeout)
+
+
+def _header_seconds(value):
+    """Parse a header holding seconds ("20" or "1.5s"), None if absent or in another format"""
+    if not value:
+        return None
+    try:
+        return float(value.strip().rstrip('s'))
+    except ValueError:
+        return None
+
+
+class _ResponseSocket:
+    """The socket a streamed Gemini response arrives on, shut down to abort the request
+
+    The SDK hands the socket over once the response headers are in. An abort that
+    comes earlier is remembered and applied as soon as it does.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sock = None
+        self.aborted = False
+
+    def attach(self, sock):
+        with self.lock:
+            self.sock = sock
+            aborted = self.aborted
+        if aborted:
+            self._shutdown(sock)
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            sock = self.sock
+        if sock:
+            self._shutdown(sock)
+
+    @staticmethod
+    def _shutdown(sock):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _RequestGuard:
+    """Shuts a request's socket down when it is cancelled or runs past its deadline
+
+    A blocked read on the socket then returns at once, and check() turns the
+    resulting socket error into Cancelled or TimeoutError.
+    """
+
+    def __init__(self, connection, cancel_token, give_up_at):
+        self.connection = connection
+        self.cancel_token = cancel_token
+        self.timed_out = False
+        self.unregister = cancel_token.on_cancel(self.abort) if cancel_token else (lambda: None)
+        self.timer = None
+        if give_up_at is not None:
+            self.timer = threading.Timer(max(give_up_at - time.monotonic(), 0), self._expire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    @property
+    def fired(self):
+        return self.timed_out or bool(self.cancel_token and self.cancel_token.cancelled)
+
+    def _expire(self):
+        self.timed_out = True
+        self.abort()
+
+    def abort(self):
+        if self.connection.sock:
+            try:
+                self.connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def check(self):
+        """Raise Cancelled or TimeoutError if the guard fired"""
+        if self.cancel_token:
+            self.cancel_token.check()
+        if self.timed_out:
+            raise TimeoutError("Request timed out")
+
+    def release(self):
+        self.unregister()
+        if self.timer:
+            self.timer.cancel()
+
+
+class MockProvider(ModelProvider):
+    """Local stand-in that echoes the task text back, for tests and offline runs"""
+    name = "mock"
+
+    def __init__(self, delay=0.0, chunk_size=16, models=None):
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.models = models or ["mock-model"]
+        self.requests = 0
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        self.requests += 1
+        give_up_at = time.monotonic() + timeout if timeout is not None else None
+        # Echo the part of the prompt after the pipeline's "Text for the task:" marker
+        text = prompt.split("Text for the task:\n", 1)[-1].rstrip('\n')
+        if max_output_tokens:
+            text = text[:max_output_tokens * 4]
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+        for chunk in chunks:
+            delay = self.delay / len(chunks)
+            if give_up_at is not None and time.monotonic() + delay > give_up_at:
+                time.sleep(max(give_up_at - time.monotonic(), 0))
+                raise TimeoutError("Mock request timed out")
+            if cancel_token:
+                cancel_token.sleep(delay)
+            elif delay:
+                time.sleep(delay)
+            yield chunk
+
+    def list_models(self):
+        return list(self.models)
+
+
+def create_provider(config):
+    """Create the provider selected by the config's "provider" key
+
+    With more than one key in "api_keys" the requests are spread over a KeyPoolProvider
+    holding one provider per key.
+    """
+    from key_pool import KeyPoolProvider, configured_api_keys
+
+    provider = config.get("provider", "gemini")
+    logger.info("Creating %s model provider", provider)
+    if provider == "gemini":
+        make_provider = GeminiProvider
+    elif provider == "openai":
+        def make_provider(api_key):
+            return OpenAICompatibleProvider(config.get("provider_url", "http://localhost:8080/v1"), api_key)
+    elif provider == "mock":
+        return MockProvider()
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+    keys = configured_api_keys(config)
+    if len(keys) < 2:
+        return make_provider(keys[0] if keys else config.get("api_key", ""))
+    logger.info("Spreading requests over %s API keys", len(keys))
+    return KeyPoolProvider(
+        keys, make_provider,
+        strategy=config.get("key_pool_strategy", "least_loaded"),
+        weights=config.get("api_key_weights") or None,
+        cooldown=config.get("key_cooldown_seconds", 60),
+        requests_per_minute=config.get("key_requests_per_minute") or None,
+    )
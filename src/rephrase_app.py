@@ -1,6 +1,5 @@
 import os
 import sys
-import json
 import tkinter as tk
 import keyboard
 import pyperclip
@@ -9,21 +8,34 @@ import time
 import platform
 from tkinter import ttk
 from plyer import notification
-from google import genai
-from google.genai import types
 import ctypes
 from ctypes import wintypes
 import subprocess
 import socket
+import signal
+import logging
+import queue
+import multiprocessing
+import gc
+from app_logging import get_logger, clip, setup_logging, dump_recent_events, DEBUG_MODE
+from hotkeys import create_hotkey_backend, parse_shortcut, InMemoryHotkeyBackend
+from clipboard_backends import create_clipboard_backend, ClipboardSession
+from providers import create_provider
+from pipeline import RephrasePipeline
+from tracing import TraceRecorder
+from profiling import ProfilingSession
+from cancellation import CancelToken, Cancelled
+from deadlines import Deadline, DeadlineExceeded, DeadlineMisses
+from response_cache import ResponseCache
+from paragraph_cache import ParagraphCache
+from speculation import SpeculativeRephraser
+from key_pool import configured_api_keys, mask_key
+from model_catalog import ModelCatalog
+from worker_process import WorkerPipeline, WorkerCrashed
+from config_store import ConfigStore
+from idle import IdleManager, resident_memory, megabytes
 
-# Debug mode flag - set to False for production (this is just for me)
-DEBUG_MODE = False
-
-def debug_print(*args, **kwargs):
-    """Print only if DEBUG_MODE is enabled"""
-    if DEBUG_MODE:
-        print(*args, **kwargs)
-
+logger = get_logger("rephrase_app")
 
 
 # Hardcoded system prompt that defines the core purpose of this app
@@ -35,14 +47,62 @@ DEFAULT_CONFIG = {
     "shortcut": "ctrl+shift+r",
     "user_system_prompt": "Improve this text by fixing grammer, spelling and making it more professional and clear while keeping the original meaning",
     "api_key": "",
+    "api_keys": [],
+    "api_key_weights": [],
+    "key_pool_strategy": "least_loaded",
+    "key_cooldown_seconds": 60,
+    "key_requests_per_minute": 0,
     "model": "gemini-2.0-flash-lite",
-    "creativity_level": 5
+    "creativity_level": 5,
+    "hotkey_backend": "auto",
+    "restore_clipboard": True,
+    "provider": "gemini",
+    "provider_url": "http://localhost:8080/v1",
+    "trace_requests": False,
+    "profiling_max_seconds": 300,
+    "cancel_shortcut": "",
+    "deadline_seconds": 30,
+    "deadline_fallback": "abort",
+    "fallback_model": "gemini-2.0-flash-lite",
+    "speculative_rephrase": False,
+    "speculative_min_chars": 20,
+    "speculative_max_chars": 2000,
+    "speculative_max_per_hour": 30,
+    "speculative_deny_patterns": [],
+    "paragraph_cache": True,
+    "model_catalog_ttl_hours": 24,
+    "worker_process": True,
+    "idle_release_minutes": 15,
+    "debug_logging": False,
+    "log_clipboard_text": False
 }
 
+# Model providers selectable in the settings window
+PROVIDERS = ["gemini", "openai", "mock"]
+# How the providers are named in messages to the user
+PROVIDER_LABELS = {"gemini": "Google Gemini", "openai": "OpenAI-compatible server", "mock": "mock provider"}
+
+# Settings that need a new provider (and key pool) when they change
+CONNECTION_SETTINGS = ("api_key", "api_keys", "provider", "provider_url")
+
+# Settings the provider client or the in-process pipeline is built from
+CLIENT_SETTINGS = CONNECTION_SETTINGS + ("api_key_weights", "key_pool_strategy", "key_cooldown_seconds",
+                                         "key_requests_per_minute", "trace_requests", "paragraph_cache", "worker_process")
+
+# Settings that shape a response, cached responses made under other values are useless
+RESPONSE_SETTINGS = ("provider", "model", "creativity_level", "user_system_prompt")
+
+# Tk variables of the settings window, dropped with its root when it closes
+SETTINGS_VARIABLES = ("enabled_var", "shortcut_var", "user_system_prompt_var", "api_key_var", "displayed_api_key_var",
+                      "model_var", "provider_var", "provider_url_var", "creativity_level_var")
+
 # Windows constants
 CF_UNICODETEXT = 13
 GMEM_MOVEABLE = 0x0002
 
+# Port of the single-instance lock socket, which also receives control commands
+INSTANCE_PORT = 52878
+
 
 def is_another_instance_running():
     """Check if another instance of this application is already running"""
@@ -50,14 +110,19 @@ def is_another_instance_running():
         # Use a socket as a simple lock mechanism
         global single_instance_socket
         single_instance_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        single_instance_socket.bind(('localhost', 52878))  # Using a specific port for this app
+        single_instance_socket.bind(('localhost', INSTANCE_PORT))  # Using a specific port for this app
         return False  # No other instance is running
     except socket.error:
         return True  # Another instance is already running
 
+def send_command_to_running_instance(command):
+    """Send a control command (e.g. 'profile start') to the running instance"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(command.encode('utf-8'), ('localhost', INSTANCE_PORT))
+
 class RephraseApp:
     def __init__(self):
-        debug_print("Initializing RephraseApp...")
+        logger.debug("Initializing RephraseApp...")
         
         # Try to load config from installation directory first, then fall back to default location
         exe_dir = os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__))
@@ -68,17 +133,75 @@ class RephraseApp:
         
         self.load_config()
         
-        # Configure Gemini API once at initialization
+        # Rotating JSON log (and a ring buffer of recent events) in a "logs" folder next to config.json
+        self.log_dir = os.path.join(os.path.dirname(self.config_path), "logs")
+        setup_logging(
+            self.log_dir,
+            debug=DEBUG_MODE or self.config.get("debug_logging", False),
+            log_clipboard_text=self.config.get("log_clipboard_text", False)
+        )
+        
+        # On-demand profiler, reports go to a "profiles" folder next to config.json
+        self.profiler = ProfilingSession(
+            os.path.join(os.path.dirname(self.config_path), "profiles"),
+            max_seconds=self.config.get("profiling_max_seconds", 300)
+        )
+        
+        # Rephrased paragraphs, so editing one paragraph of a long text only resends that one
+        self.paragraph_cache = ParagraphCache()
+        
+        # Models offered by the provider, cached on disk with the latency and speed measured here
+        self.model_catalog = ModelCatalog(
+            os.path.join(os.path.dirname(self.config_path), "model_catalog.json"),
+            ttl=self.config.get("model_catalog_ttl_hours", 24) * 3600
+        )
+        
+        # Process running the request pipeline, started by configure_api when worker_process is on
+        self.worker = None
+        # Held while the provider, the pipeline and the worker are rebuilt or released
+        self.api_lock = threading.RLock()
+        
+        # Configure the model provider once at initialization
         self.configure_api()
         
+        # OS-registered hotkeys where available, so typing never runs Python code
+        self.hotkeys = create_hotkey_backend(self.config.get("hotkey_backend", "auto"))
+        if self.hotkeys.name == InMemoryHotkeyBackend.name:
+            self.show_notification("Shortcut Unavailable",
+                                   "No keyboard hook could be set up, so the shortcut will not work. See the log for details.")
+        
+        # Persistent clipboard backend: Win32 on Windows, Tk or wl-clipboard on Linux (None if none works)
+        self.clipboard_backend = create_clipboard_backend()
+        
+        # State of the rephrase in progress and the windows, read by the idle manager from now on
         self.recording_shortcut = False
         self.processing = False
         self.settings_open = False
+        self.cancel_token = None
+        self.deadline = None
+        self.deadline_misses = DeadlineMisses()
+        self.speculator = None
+        
+        # After idle_release_minutes without use, free the worker, the clients and the caches until the next hotkey
+        self.idle = IdleManager(
+            self.config.get("idle_release_minutes", 15) * 60,
+            release=self.release_idle_resources,
+            rehydrate=self.rehydrate,
+            busy=lambda: self.processing or self.settings_open or bool(self.speculator and self.speculator.in_flight)
+        )
+        self.idle.start()
+        
+        # Opt-in: rephrase copied text before the hotkey is pressed
+        self.response_cache = ResponseCache()
+        self.setup_speculation()
+        
         self.setup_tray()
         self.setup_keyboard_hook()
+        self.setup_command_listener()
+        self.watch_config()
         
-        debug_print(f"RephraseApp initialized with shortcut: {self.config['shortcut']}")
-        debug_print(f"App enabled: {self.config['enabled']}")
+        logger.info("RephraseApp initialized with shortcut: %s", self.config['shortcut'])
+        logger.debug("App enabled: %s", self.config['enabled'])
 
 
     ##########################################################################################################
@@ -88,45 +211,89 @@ class RephraseApp:
 
     def load_config(self):
         """Load configuration from file or use defaults"""
-        try:
-            # Try each possible config path
-            config_loaded = False
-            for config_path in self.config_paths:
-                if os.path.exists(config_path):
-                    with open(config_path, 'r') as f:
-                        self.config = json.load(f)
-                    debug_print(f"Configuration loaded from {config_path}")
-                    self.config_path = config_path  # Save the path that worked
-                    config_loaded = True
-                    break
-                    
-            if not config_loaded:
-                debug_print("No configuration file found, using defaults")
-                self.config = DEFAULT_CONFIG.copy()
-                self.config_path = self.config_paths[0]  # Use first path for saving
-                self.save_config()
-        except Exception as e:
-            debug_print(f"Error loading configuration: {e}")
-            self.config = DEFAULT_CONFIG.copy()
-            self.config_path = self.config_paths[0]
-            
-    def save_config(self):
-        """Save configuration to file"""
-        try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
-            debug_print(f"Configuration saved to {self.config_path}")
-        except Exception as e:
-            debug_print(f"Error saving configuration: {e}")
+        # Use the first config file that exists, or create one at the first path
+        self.config_path = next((path for path in self.config_paths if os.path.exists(path)), self.config_paths[0])
+        self.config_store = ConfigStore(self.config_path, DEFAULT_CONFIG)
+        self.config_store.load()
+    
+    @property
+    def config(self):
+        """The current settings, a read-only snapshot; change them with self.config_store.update()"""
+        return self.config_store.snapshot
+    
+    def watch_config(self):
+        """Rebuild only what a settings change affects, whether made in the app or in config.json"""
+        store = self.config_store
+        store.subscribe(("enabled", "shortcut"), lambda old, new: self.setup_keyboard_hook())
+        # While idle the client is rebuilt on the next hotkey press anyway
+        store.subscribe(CLIENT_SETTINGS, lambda old, new: self.idle.idle or self.configure_api())
+        # Results prepared under the old settings can never be asked for again
+        store.subscribe(RESPONSE_SETTINGS, lambda old, new: (self.response_cache.clear(), self.paragraph_cache.clear()))
+        store.subscribe(("speculative_rephrase",), lambda old, new: self.setup_speculation())
+        store.subscribe(("debug_logging", "log_clipboard_text"), lambda old, new: setup_logging(
+            self.log_dir, debug=DEBUG_MODE or new["debug_logging"], log_clipboard_text=new["log_clipboard_text"]))
+        store.subscribe(("idle_release_minutes",), lambda old, new: setattr(self.idle, "idle_seconds", new["idle_release_minutes"] * 60))
+        store.subscribe(("model_catalog_ttl_hours",), lambda old, new: setattr(self.model_catalog, "ttl", new["model_catalog_ttl_hours"] * 3600))
+        store.start_watching()
    
     def configure_api(self):
-        """Configure the API with the current API key"""
+        """Configure the model provider with the current API key"""
+        # Called from the config watcher and from waking up after idle, possibly at the same time
+        with self.api_lock:
+            self._configure_api()
+    
+    def _configure_api(self):
         try:
-            self.client = genai.Client(api_key=self.config["api_key"])
-            debug_print("Gemini API client configured with saved API key")
+            # Opt-in request tracing for offline replay (sizes, timing and hashes only, never the text)
+            trace_path = os.path.join(os.path.dirname(self.config_path), "trace.jsonl")
+            if self.config.get("worker_process", True):
+                # The provider's SDK and client live in the worker only, the settings window makes its own
+                self.provider = None
+                # Requests run in a separate process, so response handling never holds up the keyboard hook.
+                # The worker follows later config changes by itself, it gets the config with every request.
+                if not self.worker:
+                    self.worker = WorkerPipeline(
+                        SYSTEM_PROMPT, self.log_dir, trace_path, self.model_catalog,
+                        debug=DEBUG_MODE or self.config.get("debug_logging", False),
+                        log_clipboard_text=self.config.get("log_clipboard_text", False)
+                    )
+                # Import the provider's SDK and connect now, not on the first hotkey press
+                self.worker.prepare(self.config)
+                self.pipeline = self.worker
+            else:
+                if self.worker:
+                    self.worker.stop()
+                    self.worker = None
+                self.provider = create_provider(self.config)
+                recorder = TraceRecorder(trace_path) if self.config.get("trace_requests", False) else None
+                paragraph_cache = self.paragraph_cache if self.config.get("paragraph_cache", True) else None
+                self.pipeline = RephrasePipeline(self.provider, SYSTEM_PROMPT, recorder, paragraph_cache, self.model_catalog)
+            logger.debug("%s provider configured with saved settings", self.config.get("provider", "gemini"))
         except Exception as e:
-            debug_print(f"Error configuring Gemini API client: {e}")
-            self.client = None
+            logger.warning("Error configuring model provider: %s", e)
+            self.provider = None
+            self.pipeline = None
+    
+    def rehydrate(self):
+        """Rebuild what release_idle_resources freed, returning once the worker can take a request"""
+        self.configure_api()
+        worker = self.worker
+        if worker:
+            worker.wait_ready(10)
+    
+    def release_idle_resources(self):
+        """Free what the next hotkey press can rebuild: the worker process, the clients and the caches"""
+        with self.api_lock:
+            if self.worker:
+                if self.worker.process:
+                    logger.info("Stopping the idle rephrase worker (%s resident)",
+                                megabytes(resident_memory(self.worker.process.pid)))
+                self.worker.stop()
+                self.worker = None
+            self.pipeline = None
+            self.provider = None
+        self.response_cache.clear()
+        self.paragraph_cache.clear()
     
     def show_notification(self, title, message):
         """Show a notification to the user"""
@@ -142,29 +309,104 @@ class RephraseApp:
                 timeout=5,
                 app_icon=icon_path
             )
-            debug_print(f"Notification shown: {title} - {message}")
+            logger.debug("Notification shown: %s - %s", title, message)
         except Exception as e:
-            debug_print(f"Error showing notification: {e}")   
+            logger.warning("Error showing notification: %s", e)   
+
+    def setup_speculation(self):
+        """Start or stop the clipboard watcher that pre-rephrases copied text"""
+        if self.speculator:
+            self.speculator.stop()
+            self.speculator = None
+        if not self.config.get("speculative_rephrase", False):
+            return
+        if not self.clipboard_backend:
+            # Polling through pyperclip would spawn a helper process every poll
+            logger.warning("Speculative rephrasing needs a native clipboard backend, not starting it")
+            return
+        self.speculator = SpeculativeRephraser(
+            self.clipboard_backend, self.response_cache, lambda: self.config, self.speculative_rephrase).start()
+        logger.info("Watching the clipboard to pre-rephrase copied text")
+
+    def speculative_rephrase(self, text, cancel_token):
+        """Rephrase copied text in the background for the speculator"""
+        # Copying counts as using the app
+        self.idle.wake()
+        self.idle.wait_awake()
+        if not self.pipeline:
+            return None
+        return self.pipeline.rephrase(text, self.config, cancel_token)
 
     def setup_keyboard_hook(self):
         """Setup keyboard shortcut hook to trigger the rephrasing process"""
         try:
-            # Unhook any existing keyboard hooks
-            keyboard.unhook_all()
+            # Unregister any existing hotkeys
+            self.hotkeys.unregister_all()
             
             # Only set up the hook if the app is enabled
             if self.config["enabled"]:
-                # Use a combination of suppress=True to prevent event propagation to other applications
-                keyboard.add_hotkey(
-                    self.config["shortcut"], 
-                    self.process_clipboard,
-                    suppress=True  # This prevents Windows from processing the hotkey
-                )
-                debug_print(f"Keyboard hook set up for shortcut: {self.config['shortcut']} with suppression")
+                # Every backend keeps the hotkey from reaching other applications
+                self.hotkeys.register(self.config["shortcut"], self.process_clipboard)
             else:
-                debug_print("Keyboard hook not set up because app is disabled")
+                logger.debug("Keyboard hook not set up because app is disabled")
         except Exception as e:
-            debug_print(f"Error setting up keyboard hook: {e}")
+            logger.error("Error setting up keyboard hook: %s", e)
+
+    def setup_command_listener(self):
+        """Accept control commands over the single-instance socket and from signals"""
+        def listen():
+            while True:
+                try:
+                    data, address = single_instance_socket.recvfrom(1024)
+                except Exception as e:
+                    logger.warning("Command listener stopped: %s", e)
+                    return
+                # The socket is bound to localhost, but only trust loopback senders anyway
+                if address[0] in ('127.0.0.1', '::1'):
+                    self.handle_command(data.decode('utf-8', errors='replace').strip())
+        
+        if 'single_instance_socket' in globals():
+            threading.Thread(target=listen, daemon=True).start()
+        
+        # SIGUSR1 toggles profiling where available (not on Windows)
+        if hasattr(signal, 'SIGUSR1'):
+            try:
+                signal.signal(signal.SIGUSR1, lambda signum, frame: self.handle_command("profile toggle"))
+            except ValueError:
+                logger.debug("Not on the main thread, SIGUSR1 profiling toggle unavailable")
+    
+    def profile_worker(self, folder):
+        """Start (folder) or stop (None) profiling in the worker process, if there is one"""
+        worker = self.worker
+        if worker:
+            try:
+                worker.profile(folder, self.profiler.max_seconds)
+            except WorkerCrashed as e:
+                logger.warning("Cannot profile the rephrase worker: %s", e)
+
+    def handle_command(self, command):
+        """Run a control command received from the tray, a signal or another process"""
+        logger.info("Received command: %s", command)
+        if command == "profile start" or (command == "profile toggle" and not self.profiler.active):
+            if self.profiler.start():
+                # The worker profiles itself, into a "worker" folder inside this session's
+                self.profile_worker(os.path.join(self.profiler.folder, "worker"))
+                self.show_notification("Profiling Started", f"Profiling for up to {self.profiler.max_seconds // 60} minutes")
+        elif command == "profile stop" or command == "profile toggle":
+            folder = self.profiler.stop()
+            self.profile_worker(None)
+            if folder:
+                self.show_notification("Profiling Stopped", f"Reports saved to {folder}")
+        elif command == "log dump":
+            path = dump_recent_events(self.log_dir)
+            if path:
+                self.show_notification("Recent Events Saved", f"Saved to {path}")
+        elif command == "idle now":
+            # Release right away instead of waiting for idle_release_minutes, to check what it frees
+            self.idle.release_now()
+            logger.info("Idle manager: %s", self.idle.stats())
+        else:
+            logger.warning("Unknown command: %s", command)
 
 
     ##########################################################################################################
@@ -174,50 +416,82 @@ class RephraseApp:
         """Simulate copy operation using keyboard"""
         try:
             # First, simulate copy operation (Ctrl+C)
-            debug_print("Simulating Ctrl+C...")
+            logger.debug("Simulating Ctrl+C...")
             # Try first sequence
             keyboard.press('ctrl')
-            time.sleep(0.2)
-            keyboard.press('c')
-            time.sleep(0.2)
-            keyboard.release('c')
-            keyboard.release('ctrl')
-            time.sleep(0.5)  # Wait for clipboard to update
+            try:
+                self.wait(0.2)
+                keyboard.press('c')
+                self.wait(0.2)
+            finally:
+                # Never leave the keys held down, even when cancelled mid-sequence
+                keyboard.release('c')
+                keyboard.release('ctrl')
+            self.wait(0.5)  # Wait for clipboard to update
             return True
         except Exception as e:
-            debug_print(f"Keyboard simulation error: {e}")
+            logger.debug("Keyboard simulation error: %s", e)
             return False
 
     def simulate_alternative_copy(self):
         """Try alternative copy key sequence"""
         try:
-            debug_print("Trying alternative key sequence...")
+            logger.debug("Trying alternative key sequence...")
             # Release any possibly stuck keys
             keyboard.release('ctrl')
-            time.sleep(0.1)
+            self.wait(0.1)
             
             # Try with press_and_release for better compatibility
             keyboard.press_and_release('ctrl+c')
-            time.sleep(0.7)
+            self.wait(0.7)
             return True
         except Exception as e:
-            debug_print(f"Alternative key sequence error: {e}")
+            logger.debug("Alternative key sequence error: %s", e)
             return False
 
+    def wait(self, seconds):
+        """Sleep between keystrokes, cut short by Cancelled when the rephrase is cancelled"""
+        if self.cancel_token:
+            self.cancel_token.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def get_clipboard_native(self, original_content):
+        """Get clipboard content using the persistent in-process backend"""
+        if not self.clipboard_backend:
+            return None
+            
+        try:
+            text = self.clipboard_backend.get_text()
+            if text and text != '':
+                if not original_content or text != original_content:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Got new clipboard text using %s backend: %s",
+                                     self.clipboard_backend.name, clip(text, 30))
+                    return text
+                else:
+                    logger.debug("Native backend returned same content as initial state")
+            else:
+                logger.debug("Native backend returned empty text")
+        except Exception as e:
+            logger.debug("Native clipboard method failed: %s", e)
+        return None
+
     def get_clipboard_pyperclip(self, original_content):
         """Get clipboard content using pyperclip library"""
         try:
             text = pyperclip.paste()
             if text and text != '':
                 if not original_content or text != original_content:
-                    debug_print(f"Got new clipboard text using pyperclip: {text[:30]}...")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Got new clipboard text using pyperclip: %s", clip(text, 30))
                     return text
                 else:
-                    debug_print("Pyperclip returned same content as initial state")
+                    logger.debug("Pyperclip returned same content as initial state")
             else:
-                debug_print("Pyperclip returned empty text")
+                logger.debug("Pyperclip returned empty text")
         except Exception as e:
-            debug_print(f"Pyperclip method failed: {e}")
+            logger.debug("Pyperclip method failed: %s", e)
         return None
 
     def get_clipboard_win32(self):
@@ -226,7 +500,7 @@ class RephraseApp:
             return None
             
         try:
-            debug_print("Trying Win32 API with unicode text...")
+            logger.debug("Trying Win32 API with unicode text...")
             ctypes.windll.user32.OpenClipboard(0)
             if ctypes.windll.user32.IsClipboardFormatAvailable(CF_UNICODETEXT):
                 handle = ctypes.windll.user32.GetClipboardData(CF_UNICODETEXT)
@@ -235,13 +509,14 @@ class RephraseApp:
                 ctypes.windll.kernel32.GlobalUnlock(handle)
                 ctypes.windll.user32.CloseClipboard()
                 if text and text != '':
-                    debug_print(f"Got clipboard text using Win32 API (unicode): {text[:30]}...")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Got clipboard text using Win32 API (unicode): %s", clip(text, 30))
                     return text
             else:
-                debug_print("No Unicode text in clipboard")
+                logger.debug("No Unicode text in clipboard")
                 ctypes.windll.user32.CloseClipboard()
         except Exception as e:
-            debug_print(f"Win32 API unicode method failed: {e}")
+            logger.debug("Win32 API unicode method failed: %s", e)
             try:
                 ctypes.windll.user32.CloseClipboard()
             except:
@@ -254,7 +529,7 @@ class RephraseApp:
             return None
             
         try:
-            debug_print("Trying PowerShell Get-Clipboard -Raw...")
+            logger.debug("Trying PowerShell Get-Clipboard -Raw...")
             process = subprocess.Popen(
                 ['powershell.exe', '-command', 'Get-Clipboard -Raw'],
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,
@@ -263,22 +538,37 @@ class RephraseApp:
             stdout, stderr = process.communicate()
             text = stdout.decode('utf-8', errors='replace').strip()
             if text and text != '':
-                debug_print(f"Got clipboard text using PowerShell: {text[:30]}...")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Got clipboard text using PowerShell: %s", clip(text, 30))
                 return text
             else:
-                debug_print("PowerShell returned empty text")
+                logger.debug("PowerShell returned empty text")
         except Exception as e:
-            debug_print(f"PowerShell method failed: {e}")
+            logger.debug("PowerShell method failed: %s", e)
         return None
 
+    def set_clipboard_native(self, text):
+        """Set clipboard content using the persistent in-process backend"""
+        if not self.clipboard_backend:
+            return False
+            
+        try:
+            if self.clipboard_backend.set_text(text):
+                logger.debug("Text set to clipboard using %s backend", self.clipboard_backend.name)
+                return True
+            return False
+        except Exception as e:
+            logger.debug("Native clipboard set method failed: %s", e)
+            return False
+
     def set_clipboard_pyperclip(self, text):
         """Set clipboard content using pyperclip"""
         try:
             pyperclip.copy(text)
-            debug_print("Text set to clipboard using pyperclip")
+            logger.debug("Text set to clipboard using pyperclip")
             return True
         except Exception as e:
-            debug_print(f"Pyperclip set method failed: {e}")
+            logger.debug("Pyperclip set method failed: %s", e)
             return False
 
     def set_clipboard_win32(self, text):
@@ -303,10 +593,10 @@ class RephraseApp:
             ctypes.windll.user32.SetClipboardData(CF_UNICODETEXT, h_mem)
             ctypes.windll.user32.CloseClipboard()
             
-            debug_print("Text set to clipboard using Win32 API (unicode)")
+            logger.debug("Text set to clipboard using Win32 API (unicode)")
             return True
         except Exception as e:
-            debug_print(f"Win32 API set method failed: {e}")
+            logger.debug("Win32 API set method failed: %s", e)
             try:
                 ctypes.windll.user32.CloseClipboard()
             except:
@@ -330,61 +620,41 @@ class RephraseApp:
             process.communicate()
             
             if process.returncode == 0:
-                debug_print("Text set to clipboard using PowerShell")
+                logger.debug("Text set to clipboard using PowerShell")
                 return True
             return False
         except Exception as e:
-            debug_print(f"PowerShell set method failed: {e}")
+            logger.debug("PowerShell set method failed: %s", e)
             return False
     
     
     ##########################################################################################################
     #                                Section: Rephrasing Clipboard Text
     ##########################################################################################################
-    def clear_clipboard(self):
-            """Clear clipboard using multiple methods"""
-            try:
-                # Clear clipboard using multiple methods
-                pyperclip.copy('')
-                if platform.system() == 'Windows':
-                    try:
-                        ctypes.windll.user32.OpenClipboard(0)
-                        ctypes.windll.user32.EmptyClipboard()
-                        ctypes.windll.user32.CloseClipboard()
-                    except:
-                        try:
-                            ctypes.windll.user32.CloseClipboard()
-                        except:
-                            pass
-                    try:
-                        subprocess.run(['powershell.exe', '-command', 'Set-Clipboard -Value ""'], 
-                                    check=False, capture_output=True,
-                                    creationflags=subprocess.CREATE_NO_WINDOW)
-                    except:
-                        pass
-                debug_print("Clipboard cleared")
-                time.sleep(0.2)  # Small delay after clearing
-            except Exception as e:
-                debug_print(f"Error clearing clipboard: {e}")
-    
     def get_clipboard_text_multi_approach(self):
         """Robust clipboard access using multiple methods"""
-        debug_print("Trying to get clipboard text...")
-        
-        # First, clear the clipboard to avoid capturing old content
-        self.clear_clipboard()
+        logger.debug("Trying to get clipboard text...")
         
-        # Store original clipboard content (I want it be empty after clearing)
+        # Store original clipboard content (I want it be empty after the session cleared it)
         original_content = None
         try:
-            original_content = pyperclip.paste()
-            debug_print(f"Initial clipboard state: '{original_content[:30]}...' if present")
+            if self.clipboard_backend:
+                original_content = self.clipboard_backend.get_text()
+            else:
+                original_content = pyperclip.paste()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Initial clipboard state: '%s' if present", clip(original_content, 30))
         except:
             pass
         
         # Simulate text copy using keyboard
         self.simulate_copy()
         
+        # Method 0: Using the persistent native backend
+        text = self.get_clipboard_native(original_content)
+        if text:
+            return text
+        
         # Method 1: Using pyperclip
         text = self.get_clipboard_pyperclip(original_content)
         if text:
@@ -403,6 +673,11 @@ class RephraseApp:
         # Try all methods one more time with different text copy simulation
         if self.simulate_alternative_copy():
             
+            # Method 0: Persistent native backend again
+            text = self.get_clipboard_native(original_content)
+            if text:
+                return text
+            
             # Method 1: Pyperclip again
             text = self.get_clipboard_pyperclip(original_content)
             if text:
@@ -413,12 +688,17 @@ class RephraseApp:
             if text:
                 return text
         
-        debug_print("All clipboard access methods failed")
+        logger.warning("All clipboard access methods failed")
         return None  # Return None instead of original content
         
     def set_clipboard_text_multi_approach(self, text):
         """Robust clipboard setting using multiple methods"""
-        debug_print(f"Trying to set clipboard text: {text[:30]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Trying to set clipboard text: %s", clip(text, 30))
+        
+        # Method 0: Using the persistent native backend
+        if self.set_clipboard_native(text):
+            return True
         
         # Method 1: Using pyperclip
         if self.set_clipboard_pyperclip(text):
@@ -432,130 +712,178 @@ class RephraseApp:
         if self.set_clipboard_powershell(text):
             return True
             
-        debug_print("All clipboard set methods failed")
+        logger.warning("All clipboard set methods failed")
         return False
     
     def process_clipboard(self):
-        """Process the text from clipboard with Google Generative AI"""
+        """Process the text from clipboard with the configured model provider"""
         if self.processing:
-            debug_print("Already processing clipboard text, skipping...")
+            # Pressing the shortcut again cancels the rephrase in progress
+            self.cancel_processing()
             return
             
         self.processing = True
+        self.cancel_token = CancelToken()
+        # End-to-end budget of this hotkey press, split across capture, request and paste
+        deadline_seconds = self.config.get("deadline_seconds", 0)
+        self.deadline = Deadline(deadline_seconds, self.deadline_misses) if deadline_seconds else None
         
         def process_thread():
+            # Rebuild what idle mode released while the clipboard is being captured. Not on the
+            # hotkey thread: wake() waits for a release in progress, and a stalled hook is dropped
+            self.idle.wake()
+            if self.speculator:
+                # Our own copy, clear and restore must not look like the user copying something
+                self.speculator.paused = True
+            cancel_shortcut = self.register_cancel_shortcut()
             try:
-                debug_print(f"Processing clipboard with shortcut: {self.config['shortcut']}")
+                # Snapshot (and clear) the user's clipboard once, it is restored when the block exits
+                with ClipboardSession(self.clipboard_backend, restore=self.config.get("restore_clipboard", True)):
+                    logger.debug("Processing clipboard with shortcut: %s", self.config['shortcut'])
                 
-                # Get text from clipboard
-                text = self.get_clipboard_text_multi_approach()
-                if not text:
-                    self.show_notification("Error", "Failed to get text from clipboard")
-                    self.processing = False
-                    return
+                    # Get text from clipboard
+                    text = self.get_clipboard_text_multi_approach()
+                    if self.deadline:
+                        self.deadline.end_stage("capture")
+                    if not text:
+                        self.show_notification("Error", "Failed to get text from clipboard")
+                        self.processing = False
+                        return
 
-                # Show notification that rephrasing is in progress
-                self.show_notification("Processing", "Rephrasing text with AI...")
+                    # Show notification that rephrasing is in progress
+                    self.show_notification("Processing", "Rephrasing text with AI...")
 
-                debug_print(f"Text captured from clipboard: {text[:50]}...")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Text captured from clipboard: %s", clip(text))
                 
-                # Send text to Google Generative AI
-                rephrased_text = self.rephrase_with_google_generative_ai(text)
-                if not rephrased_text:
-                    self.show_notification("Error", "Failed to rephrase text")
-                    self.processing = False
-                    return
+                    # Send text to the model provider
+                    rephrased_text = self.rephrase_with_provider(text)
+                    if not rephrased_text:
+                        self.show_notification("Error", "Failed to rephrase text")
+                        self.processing = False
+                        return
                     
-                debug_print(f"Rephrased text received: {rephrased_text[:50]}...")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Rephrased text received: %s", clip(rephrased_text))
                 
-                # Set rephrased text to clipboard
-                if self.set_clipboard_text_multi_approach(rephrased_text):
-                    # Wait a moment before pasting
-                    time.sleep(0.2)
+                    # Last chance to cancel before anything is written to the target app
+                    self.cancel_token.check()
                     
-                    # Use paste instead of direct writing to avoid triggering auto-send in chat apps
-                    try:
-                        # Use a more controlled paste sequence
-                        keyboard.press('ctrl')
-                        time.sleep(0.1)
-                        keyboard.press('v')
-                        time.sleep(0.1)
-                        keyboard.release('v')
-                        keyboard.release('ctrl')
-                    except Exception as paste_error:
-                        debug_print(f"Paste failed: {paste_error}")
-                        self.show_notification("Error", "Failed to paste rephrased text")
+                    # Set rephrased text to clipboard
+                    if self.set_clipboard_text_multi_approach(rephrased_text):
+                        # Wait a moment before pasting
+                        self.wait(0.2)
                     
-                    # Clear clipboard after operation complete
-                    time.sleep(0.5)  # Small delay after paste
-                    try:
-                        pyperclip.copy('')
-                        debug_print("Clipboard cleared after operation")
-                    except:
-                        pass
-                else:
-                    self.show_notification("Error", "Failed to set rephrased text to clipboard")
+                        # Use paste instead of direct writing to avoid triggering auto-send in chat apps
+                        try:
+                            # Use a more controlled paste sequence
+                            keyboard.press('ctrl')
+                            try:
+                                self.wait(0.1)
+                                keyboard.press('v')
+                                self.wait(0.1)
+                            finally:
+                                keyboard.release('v')
+                                keyboard.release('ctrl')
+                        except Exception as paste_error:
+                            logger.warning("Paste failed: %s", paste_error)
+                            self.show_notification("Error", "Failed to paste rephrased text")
+                    
+                        # Give the target app time to read the clipboard before it is restored
+                        time.sleep(0.5)
+                    else:
+                        self.show_notification("Error", "Failed to set rephrased text to clipboard")
+
+                    if self.deadline:
+                        self.deadline.end_stage("paste")
+                        if "request" in self.deadline.missed:
+                            self.show_notification("Slow Response", "The model was too slow, pasted a fallback result")
+            except DeadlineExceeded as e:
+                logger.info("Rephrase aborted: %s", e)
+                self.show_notification("Timed Out", "The model took too long, nothing was pasted")
+            except Cancelled:
+                # The clipboard session has already put the user's clipboard back
+                logger.info("Rephrase cancelled")
+                self.show_notification("Cancelled", "Rephrase cancelled")
             except Exception as e:
-                debug_print(f"Error processing clipboard: {e}")
+                logger.error("Error processing clipboard: %s", e)
                 self.show_notification("Error", f"Error processing: {str(e)}")
             finally:
+                if self.speculator:
+                    self.speculator.paused = False
                 self.processing = False
+                if cancel_shortcut:
+                    self.unregister_cancel_shortcut(cancel_shortcut)
                 
-        # Run in a separate thread to avoid blocking
-        threading.Thread(target=process_thread).start()
+        # Run in a separate thread to avoid blocking (under cProfile while profiling is on)
+        threading.Thread(target=self.profiler.profile_call, args=(process_thread,)).start()
         
-    def rephrase_with_google_generative_ai(self, text):
-        """Send text to Google Generative AI for rephrasing"""
+    def register_cancel_shortcut(self):
+        """Register the optional cancel_shortcut for one rephrase, returns it if it was registered"""
+        cancel_shortcut = self.config.get("cancel_shortcut", "")
+        if not cancel_shortcut:
+            return None
         try:
-            debug_print("Sending text to Google Generative AI...")
-            
-            # Check if client is initialized
-            if not self.client:
-                self.configure_api()
-                if not self.client:
-                    raise Exception("Failed to initialize Gemini client")
-            
-            # Convert creativity level (0-10) to temperature (0-1)
-            temperature = self.config.get("creativity_level", 5) / 10
-            debug_print(f"Using temperature: {temperature}")
-            
-            user_system_prompt = self.config["user_system_prompt"]
-            if user_system_prompt.endswith(':'):
-                user_system_prompt = user_system_prompt[:-1]
-            
-            # Create prompt for rephrasing task
-            prompt = f"""
-Your System Prompt:
-{SYSTEM_PROMPT}
+            if parse_shortcut(cancel_shortcut) == parse_shortcut(self.config["shortcut"]):
+                # The shortcut cancels by itself, and unregistering it afterwards would remove it
+                logger.warning("Ignoring cancel_shortcut %s, it is the rephrase shortcut", cancel_shortcut)
+                return None
+            self.hotkeys.register(cancel_shortcut, self.cancel_processing)
+            return cancel_shortcut
+        except Exception as e:
+            # The cancel key is optional, the rephrase goes ahead without it
+            logger.warning("Cannot register cancel_shortcut %s: %s", cancel_shortcut, e)
+            return None
 
-User's instructions:
-{user_system_prompt}:
+    def unregister_cancel_shortcut(self, cancel_shortcut):
+        try:
+            self.hotkeys.unregister(cancel_shortcut)
+        except Exception as e:
+            # Already gone when the hotkeys were set up again during the request
+            logger.warning("Cannot unregister cancel_shortcut %s: %s", cancel_shortcut, e)
+
+    def cancel_processing(self):
+        """Cancel the rephrase in progress: stops keystrokes, aborts the request and skips the paste"""
+        if self.cancel_token and not self.cancel_token.cancelled:
+            logger.debug("Cancelling the rephrase in progress...")
+            self.cancel_token.cancel()
 
-Text for the task:
-{text}
-"""
+    def rephrase_with_provider(self, text):
+        """Send text to the configured model provider for rephrasing"""
+        try:
+            # Pasted straight away when it was rephrased while the user was still getting to the hotkey
+            if self.speculator:
+                timeout = self.deadline.remaining("request") if self.deadline else 30
+                rephrased_text = self.speculator.take(text, timeout, self.cancel_token)
+                if rephrased_text:
+                    return rephrased_text
+            
+            logger.debug("Sending text to the model provider...")
+            
+            # Check if provider is initialized (after idle mode, once the rebuild started by the hotkey is done)
+            self.idle.wait_awake()
+            if not self.pipeline:
+                self.configure_api()
+                if not self.pipeline:
+                    raise Exception("Failed to initialize model provider")
             
             # Generate the response 
-            response = self.client.models.generate_content(
-                model=self.config["model"],
-                contents=[prompt],
-                config=types.GenerateContentConfig(
-                    temperature=temperature,   
-                )
-            )
+            rephrased_text = self.pipeline.rephrase(text, self.config, self.cancel_token, self.deadline)
             
             # Extract and return rephrased text
-            if response and hasattr(response, "text"):
-                rephrased_text = response.text
-                debug_print("Successfully received response from Google Generative AI")
+            if rephrased_text:
+                logger.debug("Successfully received response from the model provider")
                 return rephrased_text
             else:
-                debug_print("Empty response received from Google Generative AI")
+                logger.debug("Empty response received from the model provider")
                 return None
+        except DeadlineExceeded:
+            raise  # Handled by process_clipboard, which tells the user nothing was pasted
         except Exception as e:
-            debug_print(f"Error in Google Generative AI request: {e}")
+            logger.warning("Error in model provider request: %s", e)
             if "api_key" in str(e).lower():
-                self.show_notification("API Key Error", "Please check your Google Generative AI API key")
+                provider = self.config.get("provider", "gemini")
+                self.show_notification("API Key Error", f"Please check your {PROVIDER_LABELS.get(provider, provider)} API key")
             return None
                       
     
@@ -576,10 +904,10 @@ Text for the task:
             try:
                 # Use absolute path to ensure icon loads after system restart
                 icon_image = Image.open(icon_path)
-                debug_print(f"Loaded icon from file: {icon_path}")
+                logger.debug("Loaded icon from file: %s", icon_path)
             except Exception as e:
                 # Create a simple icon if file is not found
-                debug_print(f"Icon file not found ({e}), creating a simple icon")
+                logger.debug("Icon file not found (%s), creating a simple icon", e)
                 icon_image = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
                 draw = ImageDraw.Draw(icon_image)
                 draw.ellipse((4, 4, 60, 60), fill='blue')
@@ -588,16 +916,32 @@ Text for the task:
             def on_clicked(icon, item):
                 if str(item) == "Settings":
                     if not self.settings_open:
+                        self.idle.wake()
                         self.create_settings_window()
+                        # Tk must be torn down on the thread that created it, so not by the idle manager
+                        self.release_settings_window()
                 elif str(item) == "Enable App":
-                    self.config["enabled"] = not self.config["enabled"]
-                    self.save_config()
-                    self.setup_keyboard_hook()
+                    # Updating the config re-registers the hotkey
+                    self.config_store.update(enabled=not self.config["enabled"])
                     if self.config["enabled"]:
                         self.show_notification("App Enabled", "Text rephrasing is now enabled")
                     else:
                         self.show_notification("App Disabled", "Text rephrasing is now disabled")
+                elif str(item) == "Pre-rephrase Copied Text":
+                    self.config_store.update(speculative_rephrase=not self.config.get("speculative_rephrase", False))
+                elif str(item) == "Start Profiling":
+                    self.handle_command("profile start")
+                elif str(item) == "Stop Profiling":
+                    self.handle_command("profile stop")
+                elif str(item) == "Save Recent Events":
+                    self.handle_command("log dump")
                 elif str(item) == "Exit":
+                    if self.speculator:
+                        self.speculator.stop()
+                    if self.profiler.active:
+                        self.profiler.stop()
+                    if self.worker:
+                        self.worker.stop()
                     icon.stop()
                     os._exit(0)
                     
@@ -605,6 +949,10 @@ Text for the task:
             menu = pystray.Menu(
                 pystray.MenuItem("Enable App", on_clicked, checked=lambda item: self.config["enabled"]),
                 pystray.MenuItem("Settings", on_clicked),
+                pystray.MenuItem("Pre-rephrase Copied Text", on_clicked,
+                                 checked=lambda item: self.config.get("speculative_rephrase", False)),
+                pystray.MenuItem(lambda item: "Stop Profiling" if self.profiler.active else "Start Profiling", on_clicked),
+                pystray.MenuItem("Save Recent Events", on_clicked),
                 pystray.MenuItem("Exit", on_clicked)
             )
             
@@ -613,9 +961,9 @@ Text for the task:
             
             # Run the icon in a separate thread
             threading.Thread(target=self.icon.run, daemon=True).start()
-            debug_print("System tray icon set up")
+            logger.debug("System tray icon set up")
         except Exception as e:
-            debug_print(f"Error setting up tray icon: {e}")
+            logger.error("Error setting up tray icon: %s", e)
             
     def record_shortcut(self, shortcut_label, shortcut_button):
         """Start recording a new shortcut"""
@@ -625,85 +973,41 @@ Text for the task:
         self.recording_shortcut = True
         shortcut_button.config(text="Recording... Press keys")
         
-        # Function to handle key events
-        def on_hotkey(event):
+        # Function to handle the recorded key combination
+        def on_recorded(hotkey):
             if not self.recording_shortcut:
                 return
-                
-            # Get the key combination
-            key_name = event.name
-            modifiers = []
-            
-            if keyboard.is_pressed('ctrl'):
-                modifiers.append('ctrl')
-            if keyboard.is_pressed('alt'):
-                modifiers.append('alt')
-            if keyboard.is_pressed('shift'):
-                modifiers.append('shift')
-            
-            # If it's just a modifier key press, ignore it
-            if key_name in ['ctrl', 'alt', 'shift']:
-                return
-            
-            # Create the hotkey string
-            if modifiers:
-                hotkey = '+'.join(modifiers) + f"+{key_name}"
-            else:
-                hotkey = key_name
             
             # Update the shortcut in the UI
             self.shortcut_var.set(hotkey)
             shortcut_label.config(text=f"Current shortcut: {hotkey}")
             shortcut_button.config(text="Record New Shortcut")
             
-            # Stop recording
+            # Stop recording and re-setup the main keyboard hook
             self.recording_shortcut = False
-            
-            try:
-                keyboard.unhook_all()
-                # Re-setup the main keyboard hook
-                if self.config["enabled"]:
-                    keyboard.add_hotkey(self.config["shortcut"], self.process_clipboard)
-            except Exception as e:
-                debug_print(f"Error resetting keyboard hook: {e}")
+            self.setup_keyboard_hook()
         
         try:
-            # Hook the keyboard globally
-            keyboard.unhook_all()
-            keyboard.on_press(on_hotkey)
+            # The main hotkey must not fire while the user is typing the new one
+            self.hotkeys.unregister_all()
+            self.hotkeys.record_next(on_recorded)
         except Exception as e:
-            debug_print(f"Error setting up shortcut recording: {e}")
+            logger.error("Error setting up shortcut recording: %s", e)
             self.recording_shortcut = False
             shortcut_button.config(text="Record New Shortcut")
     
-    def list_available_models(self):
-        """List all available Gemini models and their capabilities"""
-        # # Here i tried to list all the models but it was too many models of the same type - too confusing for the user
-
-        # wanted_models_names = ['gemini-2.0-flash','gemini-2.0-flash-lite', 'gemini-1.5-flash','gemini-1.5-flash-8b']
-        # try:
-        #     # Get models
-        #     models = genai.list_models()
-        #     available_models = []
-            
-        #     # Filter for chat-capable models
-        #     for model in models:
-        #         if any(wanted_model_name in model.name for wanted_model_name in wanted_models_names):
-        #             model_name = model.name.split('/')[-1]
-        #             available_models.append(model_name)
-            
-        #     return available_models
-        # except Exception as e:
-        #     debug_print(f"Error listing models: {e}")
-        #     return ['gemini-2.0-flash', 'gemini-1.5-flash']
-
-        # hardcoded list of models
-        return ['gemini-2.0-flash','gemini-2.0-flash-lite', 'gemini-1.5-flash','gemini-1.5-flash-8b']
+    def list_available_models(self, provider=None, config=None, refresh=False):
+        """List the text models of a provider, from the model catalog unless it is stale or refresh is set"""
+        provider = provider or self.provider
+        config = config or self.config
+        if provider and (refresh or self.model_catalog.is_stale(config)):
+            self.model_catalog.refresh(provider, config)
+        return self.model_catalog.names(config)
     
     def create_settings_window(self):
         """Create and show settings window"""
         if self.settings_open:
-            debug_print("Settings window already open")
+            logger.debug("Settings window already open")
             if hasattr(self, 'root') and self.root:
                 try:
                     self.root.focus_force()  # Bring to front if it exists
@@ -712,13 +1016,13 @@ Text for the task:
             return
             
         self.settings_open = True
-        debug_print("Opening settings window")
+        logger.debug("Opening settings window")
         
         try:
             # Create a new Tkinter window
             self.root = tk.Tk()
             self.root.title("Rephrase App Settings")
-            self.root.geometry("500x450")
+            self.root.geometry("500x480")
             self.root.resizable(False, False)
             
             # Create instance variables for settings
@@ -727,11 +1031,14 @@ Text for the task:
             self.user_system_prompt_var = tk.StringVar(value=self.config["user_system_prompt"])
             
             # For API key, store the actual value but display masked version
-            self.api_key_var = tk.StringVar(value=self.config["api_key"])
-            displayed_api_key = self.mask_api_key(self.config["api_key"])
+            # Several keys (a shared pool) are shown comma-separated
+            self.api_key_var = tk.StringVar(value=", ".join(configured_api_keys(self.config)))
+            displayed_api_key = self.mask_api_key(self.api_key_var.get())
             self.displayed_api_key_var = tk.StringVar(value=displayed_api_key)
             
             self.model_var = tk.StringVar(value=self.config["model"])
+            self.provider_var = tk.StringVar(value=self.config.get("provider", "gemini"))
+            self.provider_url_var = tk.StringVar(value=self.config.get("provider_url", DEFAULT_CONFIG["provider_url"]))
             
             # Add creativity level variable (0-10 scale)
             self.creativity_level_var = tk.IntVar(value=self.config.get("creativity_level", 5))
@@ -763,7 +1070,7 @@ Text for the task:
             notebook.add(api_frame, text="API Settings")
             
             # API configuration
-            api_config_frame = ttk.LabelFrame(api_frame, text="Google Generative AI Configuration")
+            api_config_frame = ttk.LabelFrame(api_frame, text="Model Provider Configuration")
             api_config_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
             
             ttk.Label(api_config_frame, text="API Key:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
@@ -786,55 +1093,100 @@ Text for the task:
             show_hide_button.grid(row=0, column=2, padx=5, pady=5)
             
             # API key instructions
-            ttk.Label(api_config_frame, text="Enter new key to update").grid(row=1, column=1, padx=5, pady=0, sticky=tk.W)
+            ttk.Label(api_config_frame, text="Enter new key to update, separate several keys with commas").grid(row=1, column=1, padx=5, pady=0, sticky=tk.W)
             
             ttk.Label(api_config_frame, text="Model:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
             
-            # Create a combobox for model selection
-            models_list = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.0-pro"]  # Default models
-            try:
-                # Try to get actual models if possible
-                if self.config["api_key"]:
-                    available_models = self.list_available_models()
-                    if available_models:
-                        models_list = available_models
-            except:
-                pass
-                
-            model_combobox = ttk.Combobox(api_config_frame, textvariable=self.model_var, values=models_list, width=38)
+            # Create a combobox for model selection, filled from the model catalog so it opens without a request
+            model_combobox = ttk.Combobox(api_config_frame, textvariable=self.model_var,
+                                          values=self.model_catalog.names(self.config), width=38)
             model_combobox.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
             
-            # Model refresh button
-            def refresh_models():
+            # How the selected model has performed in this app
+            model_info_var = tk.StringVar()
+            ttk.Label(api_config_frame, textvariable=model_info_var, foreground="gray").grid(row=3, column=1, padx=5, pady=0, sticky=tk.W)
+            
+            def update_model_info(*args):
+                model_info_var.set(self.model_catalog.describe(self.model_var.get()))
+                
+            self.model_var.trace_add("write", update_model_info)
+            update_model_info()
+            
+            # Provider selection (Gemini, or an OpenAI-compatible server such as llama.cpp/vLLM)
+            ttk.Label(api_config_frame, text="Provider:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
+            provider_combobox = ttk.Combobox(api_config_frame, textvariable=self.provider_var, values=PROVIDERS, state="readonly", width=38)
+            provider_combobox.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+            
+            ttk.Label(api_config_frame, text="Server URL:").grid(row=5, column=0, padx=5, pady=5, sticky=tk.W)
+            provider_url_entry = ttk.Entry(api_config_frame, textvariable=self.provider_url_var, width=40)
+            provider_url_entry.grid(row=5, column=1, padx=5, pady=5, sticky=tk.W)
+            
+            # Config with the connection settings currently shown in the UI
+            def ui_config():
+                return self.config_store.preview(self.split_api_keys(self.api_key_var.get()),
+                                                 provider=self.provider_var.get(), provider_url=self.provider_url_var.get())
+            
+            # Provider for the settings currently shown in the UI
+            def ui_provider(config=None):
+                config = config or ui_config()
+                # Reuse the live provider if the connection settings haven't changed
+                if self.provider and all(config[key] == self.config.get(key) for key in CONNECTION_SETTINGS):
+                    return self.provider
+                return create_provider(config)
+            
+            # Model listings arrive from a background thread, the Tk loop picks them up from this queue
+            model_results = queue.Queue()
+            
+            def fetch_models(config, refresh):
                 try:
-                    status_var.set("Fetching available models...")
-                    self.root.update_idletasks()
+                    model_results.put((config, self.list_available_models(ui_provider(config), config, refresh), None))
+                except Exception as e:
+                    model_results.put((config, None, e))
                     
-                    # Only try to get models if API key is set
-                    if self.api_key_var.get():
-                        # Only reconfigure if using a different API key than current
-                        current_key_changed = self.api_key_var.get() != self.config["api_key"]
-                        if current_key_changed:
-                            # Create a temporary client with the new key
-                            temp_client = genai.Client(api_key=self.api_key_var.get())
-                            debug_print("Temporarily created client with new key for fetching models")
-                        
-                        available_models = self.list_available_models()
-                        
-                        if available_models:
-                            model_combobox['values'] = available_models
-                            status_var.set(f"Found {len(available_models)} available models")
-                            status_bar.config(foreground="green")
-                        else:
-                            status_var.set("No models found")
-                            status_bar.config(foreground="red")
+            def poll_models(announce):
+                try:
+                    config, available_models, error = model_results.get_nowait()
+                except queue.Empty:
+                    self.root.after(100, poll_models, announce)
+                    return
+                if error:
+                    logger.warning("Error fetching models: %s", error)
+                    if announce:
+                        status_var.set(f"Error fetching models...")
+                        status_bar.config(foreground="red")
+                    return
+                # The provider may have been switched while the list was on its way
+                if config["provider"] == self.provider_var.get() and available_models:
+                    model_combobox['values'] = available_models
+                    update_model_info()
+                if announce:
+                    if available_models:
+                        status_var.set(f"Found {len(available_models)} available models")
+                        status_bar.config(foreground="green")
                     else:
+                        status_var.set("No models found")
+                        status_bar.config(foreground="red")
+            
+            def refresh_models(refresh=True):
+                # Only try to get models if API key is set (a local server may not need one)
+                if not self.api_key_var.get() and self.provider_var.get() == "gemini":
+                    if refresh:
                         status_var.set("API Key required to fetch models")
                         status_bar.config(foreground="red")
-                except Exception as e:
-                    status_var.set(f"Error fetching models...")
-                    status_bar.config(foreground="red")
-                    debug_print(f"Error fetching models: {e}")
+                    return
+                config = ui_config()
+                if refresh:
+                    status_var.set("Fetching available models...")
+                elif not self.model_catalog.is_stale(config):
+                    return
+                threading.Thread(target=fetch_models, args=(config, refresh), daemon=True).start()
+                poll_models(announce=refresh)
+            
+            def on_provider_change(event):
+                model_combobox['values'] = self.model_catalog.names(ui_config())
+                refresh_models(refresh=False)
+                
+            provider_combobox.bind("<<ComboboxSelected>>", on_provider_change)
             
             refresh_button = ttk.Button(api_config_frame, text="Refresh Models", command=refresh_models)
             refresh_button.grid(row=2, column=2, padx=5, pady=5)
@@ -930,32 +1282,23 @@ Text for the task:
                     status_bar.config(foreground="black")  # Reset color
                     self.root.update_idletasks()
                     
-                    # Create a test client with current settings in UI
-                    test_client = genai.Client(api_key=self.api_key_var.get())
-                    
-                    # Simple test request
-                    response = test_client.models.generate_content(
-                        model=self.model_var.get(),
-                        contents=["Hello"],
-                        config=types.GenerateContentConfig(
-                            temperature=0.2,
-                            max_output_tokens=10
-                        )
-                    )
+                    # Simple test request with current settings in UI
+                    ok, message = ui_provider().health(self.model_var.get())
                     
-                    if response and hasattr(response, 'text'):
-                        status_var.set("Connection successful! API settings are valid.")
+                    if ok:
+                        status_var.set(message)
                         status_bar.config(foreground="green")  # Green for success
                     else:
-                        status_var.set("Connection test returned empty response.")
-                        status_bar.config(foreground="red")  # Red for failure
+                        raise Exception(message)
                         
                 except Exception as e:
                     error_msg = str(e)
                     if "api_key" in error_msg.lower() or "key" in error_msg.lower() and "invalid" in error_msg.lower():
                         status_var.set(f"Connection test failed: Invalid API key..")
-                        status_bar.config(foreground="red")  # Red for failure
-                        debug_print(f"API connection test failed: {e}")
+                    else:
+                        status_var.set(f"Connection test failed: {error_msg[:60]}")
+                    status_bar.config(foreground="red")  # Red for failure
+                    logger.debug("API connection test failed: %s", e)
                     
             test_button = ttk.Button(button_frame, text="Test API Connection", command=test_connection)
             test_button.pack(side=tk.LEFT, padx=5)
@@ -966,29 +1309,17 @@ Text for the task:
                     # Update system prompt from text widget
                     self.user_system_prompt_var.set(system_prompt_text.get("1.0", tk.END).strip())
                     
-                    # Get current API key before updating
-                    old_api_key = self.config["api_key"]
-                    new_api_key = self.api_key_var.get()
-                    
-                    # Update config with all settings
-                    self.config["enabled"] = self.enabled_var.get()
-                    self.config["shortcut"] = self.shortcut_var.get()
-                    self.config["user_system_prompt"] = self.user_system_prompt_var.get()
-                    self.config["api_key"] = new_api_key  # Use actual API key
-                    self.config["model"] = self.model_var.get()
-                    self.config["creativity_level"] = self.creativity_level_var.get()
-                    
-                    # Only reconfigure API if the key has changed
-                    if old_api_key != new_api_key or not self.client:
-                        try:
-                            self.client = genai.Client(api_key=new_api_key)
-                            debug_print("Gemini API client reconfigured with new API key")
-                        except Exception as e:
-                            debug_print(f"Error reconfiguring Gemini API client: {e}")
-                    
-                    # Save to file and update keyboard hook
-                    self.save_config()
-                    self.setup_keyboard_hook()
+                    # Save all settings at once; only the parts whose settings changed are rebuilt
+                    self.config_store.update(
+                        self.split_api_keys(self.api_key_var.get()),  # Use actual API keys
+                        enabled=self.enabled_var.get(),
+                        shortcut=self.shortcut_var.get(),
+                        user_system_prompt=self.user_system_prompt_var.get(),
+                        model=self.model_var.get(),
+                        creativity_level=self.creativity_level_var.get(),
+                        provider=self.provider_var.get(),
+                        provider_url=self.provider_url_var.get()
+                    )
                     
                     # Show success notification and update status bar
                     self.show_notification("Settings Saved", "Your settings have been updated")
@@ -998,7 +1329,7 @@ Text for the task:
                 except Exception as e:
                     status_var.set(f"Error saving settings.. please try again.")
                     status_bar.config(foreground="red")
-                    debug_print(f"Error saving settings: {e}")
+                    logger.warning("Error saving settings: %s", e)
             
             save_button = ttk.Button(button_frame, text="Save Settings", command=save_settings)
             save_button.pack(side=tk.RIGHT, padx=5)
@@ -1009,6 +1340,9 @@ Text for the task:
                 
             self.root.protocol("WM_DELETE_WINDOW", on_close)
             
+            # Bring a stale model list up to date without holding up the window
+            refresh_models(refresh=False)
+            
             # Make sure the window is on top and request focus
             self.root.attributes('-topmost', True)
             self.root.attributes('-topmost', False)
@@ -1017,26 +1351,42 @@ Text for the task:
             # Run the Tkinter event loop in the main thread
             self.root.mainloop()
         except Exception as e:
-            debug_print(f"Error creating settings window: {e}")
+            logger.error("Error creating settings window: %s", e)
             self.settings_open = False
             
     def mask_api_key(self, api_key):
-        """Mask the API key to show only the last 3 characters"""
-        if not api_key or len(api_key) <= 3:
+        """Mask the API key(s) to show only the last 3 characters of each
+
+        Takes a single key, a comma-separated string of keys or a list of keys.
+        """
+        if not api_key:
             return api_key
-        
-        masked_part = '*' * (len(api_key) - 3)
-        visible_part = api_key[-3:]
-        return masked_part + visible_part
+        keys = api_key if isinstance(api_key, (list, tuple)) else [key.strip() for key in api_key.split(',')]
+        return ", ".join(mask_key(key) for key in keys)
     
+    def split_api_keys(self, text):
+        """Config entries for the comma-separated key(s) typed in the settings window"""
+        keys = [key.strip() for key in text.split(',') if key.strip()]
+        return {"api_key": keys[0] if keys else "", "api_keys": keys if len(keys) > 1 else []}
+    
+    def release_settings_window(self):
+        """Drop the closed settings window's Tk root and variables, which frees its Tcl interpreter"""
+        if self.settings_open:
+            return
+        self.root = None
+        for name in SETTINGS_VARIABLES:
+            self.__dict__.pop(name, None)
+        # Widgets reference each other, collect them here rather than on whichever thread runs the next GC
+        gc.collect()
+        
     def close_settings_window(self):
         """Safely close the settings window and reset state"""
         try:
-            debug_print("Closing settings window")
+            logger.debug("Closing settings window")
             # Reset recording state if needed
             if self.recording_shortcut:
                 self.recording_shortcut = False
-                keyboard.unhook_all()
+                self.hotkeys.stop_recording()
                 self.setup_keyboard_hook()
                 
             # Destroy the window if it exists
@@ -1044,7 +1394,7 @@ Text for the task:
                 self.root.destroy()
                 
         except Exception as e:
-            debug_print(f"Error closing settings window: {e}")
+            logger.warning("Error closing settings window: %s", e)
         finally:
             # Ensure this flag is reset
             self.settings_open = False
@@ -1052,9 +1402,15 @@ Text for the task:
             self.setup_keyboard_hook()
 
 if __name__ == "__main__":
+    # The request worker is a spawned process, which a frozen executable has to hand over to here
+    multiprocessing.freeze_support()
+    
     # Check if another instance is already running
     if is_another_instance_running():
-        debug_print("Another instance is already running. Exiting.")
+        # Forward a command like "profile start" to it if one was given
+        if len(sys.argv) > 1:
+            send_command_to_running_instance(' '.join(sys.argv[1:]))
+        logger.info("Another instance is already running. Exiting.")
         sys.exit(0)
     
     # If not, start the app
@@ -1065,7 +1421,7 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        debug_print("Exiting...")
+        logger.info("Exiting...")
         if hasattr(app, 'icon'):
             app.icon.stop()
         sys.exit(0) 
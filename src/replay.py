@@ -0,0 +1,117 @@
+"""Replay a recorded request trace against a local stand-in server
+
+Usage: python replay.py trace.jsonl [--speed 1.0] [--concurrency 8] [--output replay.jsonl]
+
+Each recorded request is re-issued through the rephrase pipeline at its original
+offset in the trace (divided by --speed) with synthetic text of the recorded size.
+The stand-in server answers with the recorded number of characters, delivered with
+the recorded chunk timing (also divided by --speed). The replayed requests are
+traced to --output, and recorded vs replayed latency percentiles are printed.
+"""
+import os
+import re
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_server import StandInServer
+from pipeline import APP_DIR, RephrasePipeline
+from providers import OpenAICompatibleProvider
+from tracing import TraceRecorder, read_trace
+
+TRACE_MARKER = re.compile(r"\[\[trace:(\d+)\]\]")
+
+
+def trace_responder(records, speed):
+    """Responder that plays back the recorded response size and chunk timing"""
+    def respond(body):
+        match = TRACE_MARKER.search(body["messages"][-1]["content"])
+        record = records[int(match.group(1))] if match else {}
+        chunks = record.get("chunks") or []
+        if not chunks:
+            # No chunk timing (failed request), answer in one piece after the recorded time
+            return [((record.get("total") or 0) / speed, "x" * record.get("response_chars", 0))]
+
+        plan = []
+        previous = 0.0
+        for arrival, chars in chunks:
+            plan.append((max(arrival - previous, 0) / speed, "x" * chars))
+            previous = arrival
+        return plan
+    return respond
+
+
+def synthetic_text(index, chars):
+    """Filler text of the recorded size that tells the server which record to play"""
+    marker = f"[[trace:{index}]] "
+    return marker + "lorem ipsum " * (max(chars - len(marker), 0) // 12 + 1)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def print_summary(name, records, scale=1.0):
+    totals = [r["total"] * scale for r in records if r.get("total") is not None]
+    ttfbs = [r["ttfb"] * scale for r in records if r.get("ttfb") is not None]
+    errors = sum(1 for r in records if r.get("error"))
+    print(f"{name:<10} n={len(records):<6} errors={errors:<4} "
+          f"total p50={percentile(totals, 0.5):.3f}s p95={percentile(totals, 0.95):.3f}s p99={percentile(totals, 0.99):.3f}s  "
+          f"ttfb p50={percentile(ttfbs, 0.5):.3f}s p95={percentile(ttfbs, 0.95):.3f}s")
+
+
+def replay(records, speed=1.0, concurrency=8, output_path="replay.jsonl"):
+    """Drive the pipeline with the trace's traffic shape, returns the scheduling lag per request"""
+    server = StandInServer(responder=trace_responder(records, speed)).start()
+    with open(os.path.join(APP_DIR, "system_prompt.txt"), 'r') as f:
+        system_prompt = f.read()
+    pipeline = RephrasePipeline(OpenAICompatibleProvider(server.base_url), system_prompt, TraceRecorder(output_path))
+
+    def send(index, record):
+        config = {
+            "model": record.get("model", "stand-in"),
+            "creativity_level": (record.get("temperature") or 0) * 10,
+            "user_system_prompt": "Replay",
+        }
+        try:
+            pipeline.rephrase(synthetic_text(index, record.get("text_chars", 0)), config)
+        except Exception as e:
+            print(f"Request {index} failed: {e}")
+
+    lags = []
+    t0 = records[0]["t"] if records else 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for index, record in enumerate(records):
+                due = (record["t"] - t0) / speed
+                wait = due - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+                lags.append(max(-wait, 0))
+                executor.submit(send, index, record)
+    finally:
+        server.stop()
+    return lags
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="trace file recorded with trace_requests enabled")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor (1 = real time)")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum requests in flight")
+    parser.add_argument("--output", default="replay.jsonl", help="trace file for the replayed requests")
+    args = parser.parse_args()
+
+    records = sorted(read_trace(args.trace), key=lambda r: r["t"])
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    lags = replay(records, args.speed, args.concurrency, args.output)
+
+    print_summary("recorded", records)
+    # Scale replayed timings back to real time so they compare directly with the recording
+    print_summary("replayed", read_trace(args.output), scale=args.speed)
+    print(f"scheduling lag p95={percentile(lags, 0.95) * 1000:.1f} ms (requests issued late by the driver)")
@@ -0,0 +1,66 @@
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def response_key(text, config):
+    """Hash of the text plus every setting that shapes the response"""
+    shape = [
+        config.get("provider", "gemini"),
+        config.get("model"),
+        config.get("creativity_level", 5),
+        config.get("user_system_prompt"),
+        text,
+    ]
+    return hashlib.sha256(json.dumps(shape).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Rephrased results waiting to be pasted, in memory only
+
+    Entries are taken (removed) when used, so pressing the hotkey twice on the same
+    text still gets a fresh rephrase the second time. Entries that are never taken
+    are dropped after max_age seconds or when the cache is full, and counted as
+    wasted.
+    """
+
+    def __init__(self, max_entries=16, max_age=300):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.wasted = 0
+
+    def put(self, key, response):
+        with self.lock:
+            self._expire()
+            if key in self.entries:
+                self.wasted += 1
+                del self.entries[key]
+            self.entries[key] = (time.monotonic(), response)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.wasted += 1
+
+    def take(self, key):
+        """Remove and return the response stored under key, or None"""
+        with self.lock:
+            self._expire()
+            entry = self.entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        with self.lock:
+            self.wasted += len(self.entries)
+            self.entries.clear()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.max_age
+        while self.entries:
+            key, (stored, _) = next(iter(self.entries.items()))
+            if stored >= cutoff:
+                break
+            del self.entries[key]
+            self.wasted += 1
@@ -0,0 +1,193 @@
+import re
+import time
+import threading
+from collections import deque
+
+from app_logging import get_logger
+from cancellation import CancelToken, Cancelled
+from response_cache import response_key
+
+logger = get_logger("speculation")
+
+# Content that must never leave the machine just because it was copied
+DENY_PATTERNS = [
+    re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----"),
+    re.compile(r"\b(?:password|passwd|pwd|passphrase|secret|token)\s*[:=]", re.IGNORECASE),
+    re.compile(r"\bAKIA[0-9A-Z]{16}\b"),                         # AWS access key
+    re.compile(r"\bAIza[0-9A-Za-z_\-]{35}\b"),                   # Google API key
+    re.compile(r"\b(?:sk|pk|rk)-[A-Za-z0-9_\-]{20,}"),           # OpenAI/Stripe style keys
+    re.compile(r"\beyJ[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+"),  # JWT
+    re.compile(r"\b(?:\d[ -]?){13,19}\b"),                       # Card numbers
+]
+
+
+def speculation_blocked(text, config):
+    """Return why text must not be rephrased speculatively, or None if it may be"""
+    if not text or not text.strip():
+        return "empty"
+    if len(text) < config.get("speculative_min_chars", 20):
+        return "too short"
+    if len(text) > config.get("speculative_max_chars", 2000):
+        return "too long"
+    if len(text.split()) < 3:
+        # A single token is far more likely a password, key or URL than prose
+        return "not prose"
+    for pattern in DENY_PATTERNS:
+        if pattern.search(text):
+            return "deny-listed"
+    for pattern in config.get("speculative_deny_patterns", []):
+        try:
+            if re.search(pattern, text):
+                return "deny-listed"
+        except re.error as e:
+            logger.warning("Ignoring bad speculative_deny_patterns entry %r: %s", pattern, e)
+    return None
+
+
+class SpeculativeRephraser:
+    """Rephrases newly copied text in the background, before the hotkey is pressed
+
+    A watcher thread polls the clipboard backend (through its change counter when it
+    has one, so an unchanged clipboard costs nothing). New text that passes the filters
+    and the hourly spend cap is rephrased with rephrase(text, cancel_token) and the
+    result parked in the response cache. get_config returns the current settings. Copying something else cancels the request in
+    flight. process_clipboard then calls take() to paste a hit without a round trip.
+    """
+
+    def __init__(self, backend, cache, get_config, rephrase, poll_interval=0.25):
+        self.backend = backend
+        self.cache = cache
+        self.get_config = get_config
+        self.rephrase = rephrase
+        self.poll_interval = poll_interval
+        self.paused = False
+        self.lock = threading.Lock()
+        self.in_flight = None  # (key, cancel token, done event)
+        self.sent_times = deque()
+        self.stop_event = threading.Event()
+
+        # Metrics
+        self.sent = 0
+        self.superseded = 0
+        self.failed = 0
+        self.blocked = 0
+        self.capped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self._cancel_in_flight()
+        self.cache.clear()
+
+    def _watch(self):
+        last_count = self.backend.change_count()
+        # Whatever was on the clipboard before we started is not a fresh copy
+        last_text = self.backend.get_text()
+        while not self.stop_event.wait(self.poll_interval):
+            if self.paused:
+                continue
+            try:
+                count = self.backend.change_count()
+                if count is not None and count == last_count:
+                    continue
+                last_count = count
+                text = self.backend.get_text()
+            except Exception as e:
+                logger.warning("Clipboard watcher error: %s", e)
+                continue
+            if text != last_text:
+                last_text = text
+                self._on_copy(text)
+
+    def _on_copy(self, text):
+        self._cancel_in_flight()
+
+        config = self.get_config()
+        reason = speculation_blocked(text, config)
+        if reason is None and self.backend.is_sensitive():
+            reason = "marked sensitive"
+        if reason:
+            self.blocked += 1
+            logger.debug("Not pre-rephrasing copied text: %s", reason)
+            return
+
+        # Spend cap: at most speculative_max_per_hour requests in any sliding hour
+        now = time.monotonic()
+        while self.sent_times and now - self.sent_times[0] > 3600:
+            self.sent_times.popleft()
+        if len(self.sent_times) >= config.get("speculative_max_per_hour", 30):
+            self.capped += 1
+            logger.debug("Not pre-rephrasing copied text: hourly cap reached")
+            return
+        self.sent_times.append(now)
+
+        key = response_key(text, config)
+        token = CancelToken()
+        done = threading.Event()
+        with self.lock:
+            self.in_flight = (key, token, done)
+        self.sent += 1
+        threading.Thread(target=self._run, args=(text, key, token, done), daemon=True).start()
+
+    def _run(self, text, key, token, done):
+        try:
+            response = self.rephrase(text, token)
+            if response:
+                self.cache.put(key, response)
+                logger.debug("Pre-rephrased copied text is ready")
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.failed += 1
+            logger.warning("Speculative rephrase failed: %s", e)
+        finally:
+            with self.lock:
+                if self.in_flight and self.in_flight[1] is token:
+                    self.in_flight = None
+            done.set()
+
+    def _cancel_in_flight(self):
+        with self.lock:
+            in_flight, self.in_flight = self.in_flight, None
+        if in_flight:
+            self.superseded += 1
+            in_flight[1].cancel()
+
+    def take(self, text, timeout=0, cancel_token=None):
+        """Return the pre-rephrased result for text, waiting up to timeout for one still in flight"""
+        key = response_key(text, self.get_config())
+        with self.lock:
+            in_flight = self.in_flight
+        if in_flight and in_flight[0] == key:
+            # Already on its way, waiting beats sending the same request again
+            give_up_at = time.monotonic() + timeout
+            while not in_flight[2].wait(0.05) and time.monotonic() < give_up_at:
+                if cancel_token:
+                    cancel_token.check()
+
+        response = self.cache.take(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        logger.debug("Speculative %s, %s", 'hit' if response is not None else 'miss', self.stats())
+        return response
+
+    def stats(self):
+        presses = self.hits + self.misses
+        return {
+            "hit_rate": round(self.hits / presses, 3) if presses else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "sent": self.sent,
+            # Requests paid for that never got pasted
+            "wasted": self.superseded + self.failed + self.cache.wasted,
+            "blocked": self.blocked,
+            "capped": self.capped,
+        }
@@ -0,0 +1,78 @@
+import json
+import time
+import hashlib
+import threading
+
+from app_logging import get_logger
+
+logger = get_logger("tracing")
+
+
+def text_digest(text):
+    """Short stable hash of a text, so traces never contain the user's words"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+class TraceRecorder:
+    """Appends one compact JSON line per model request to a trace file
+
+    Each record holds the request shape (model, temperature, sizes, hashed text), the
+    time to first chunk, the total time and the arrival time and size of every chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def record(self, **fields):
+        try:
+            line = json.dumps(fields, separators=(',', ':'))
+            with self.lock:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+        except Exception as e:
+            logger.warning("Error writing trace record: %s", e)
+
+    def traced_stream(self, provider, prompt, text, model, temperature, max_output_tokens=None, cancel_token=None,
+                      timeout=None):
+        """Stream a response through provider, recording its timing once it finishes or fails"""
+        start_wall = time.time()
+        start = time.perf_counter()
+        chunks = []
+        response_chars = 0
+        error = None
+        try:
+            for chunk in provider.stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout):
+                chunks.append([round(time.perf_counter() - start, 4), len(chunk)])
+                response_chars += len(chunk)
+                yield chunk
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(
+                t=round(start_wall, 3),
+                provider=provider.name,
+                model=model,
+                temperature=temperature,
+                prompt_chars=len(prompt),
+                text_chars=len(text),
+                text_sha=text_digest(text),
+                response_chars=response_chars,
+                ttfb=chunks[0][0] if chunks else None,
+                total=round(time.perf_counter() - start, 4),
+                chunks=chunks,
+                error=error,
+            )
+
+
+def read_trace(path):
+    """Load the records of a trace file, skipping a torn last line"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
@@ -0,0 +1,400 @@
+import time
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+
+from app_logging import get_logger, setup_logging
+from cancellation import CancelToken, Cancelled
+from deadlines import Deadline, DeadlineExceeded
+from paragraph_cache import ParagraphCache
+from pipeline import RephrasePipeline
+from profiling import ProfilingSession
+from providers import create_provider, ProviderError
+from tracing import TraceRecorder
+
+logger = get_logger("worker_process")
+
+# Texts larger than this many UTF-8 bytes cross in shared memory instead of being pickled through the pipe
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+# Settings that need a new pipeline in the worker when they change
+PIPELINE_SETTINGS = ("api_key", "api_keys", "api_key_weights", "provider", "provider_url", "key_pool_strategy",
+                     "key_cooldown_seconds", "key_requests_per_minute", "trace_requests", "paragraph_cache")
+
+# A worker that crashes more often than this is left down
+MAX_RESTARTS = 5
+RESTART_WINDOW = 60
+
+
+class WorkerCrashed(Exception):
+    """The worker process died (or could not be started) while a request needed it"""
+
+
+def _pack_text(text):
+    """Return (payload for the pipe, SharedMemory block or None) for text
+
+    The process that creates a block keeps it open until the other side has read it:
+    on Windows a block disappears with its last handle.
+    """
+    if text is None:
+        return None, None
+    data = text.encode('utf-8')
+    if len(data) < SHARED_MEMORY_THRESHOLD:
+        return text, None
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return ("shm", block.name, len(data)), block
+
+
+def _unpack_text(payload):
+    if payload is None or isinstance(payload, str):
+        return payload
+    _, name, size = payload
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size]).decode('utf-8')
+    finally:
+        block.close()
+
+
+def _release_block(block):
+    if block:
+        block.close()
+        block.unlink()
+
+
+def _rebuild_error(kind, message, detail):
+    """The exception the worker raised, from its ("error", ...) reply"""
+    if kind == "deadline":
+        return DeadlineExceeded(message, detail)
+    if kind == "cancelled":
+        return Cancelled()
+    if kind == "timeout":
+        return TimeoutError(message)
+    if kind == "provider":
+        return ProviderError(message, *detail)
+    return Exception(message)
+
+
+class _ObservationRelay:
+    """Takes the place of the ModelCatalog in the worker
+
+    Measurements are collected per request thread and sent back with the reply, so
+    only the front process ever writes the catalog file.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def start(self):
+        self.local.observations = []
+
+    def observe(self, *observation):
+        self.local.observations.append(observation)
+
+    def collected(self):
+        return self.local.observations
+
+
+class _WorkerServer:
+    """Serves the requests of the front process, one thread per request"""
+
+    def __init__(self, connection, system_prompt, trace_path):
+        self.connection = connection
+        self.system_prompt = system_prompt
+        self.trace_path = trace_path
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.tokens = {}  # request id -> CancelToken
+        self.replies = {}  # request id -> SharedMemory holding its response until the front has read it
+        self.relay = _ObservationRelay()
+        self.paragraph_cache = ParagraphCache()
+        self.pipeline = None
+        self.pipeline_settings = None
+        self.profiler = None
+
+    def serve(self):
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                break  # The front process is gone
+            kind, request_id = message[0], message[1]
+            if kind == "rephrase":
+                token = CancelToken()
+                self.tokens[request_id] = token
+                threading.Thread(target=self._rephrase, args=(request_id, token) + tuple(message[2:]),
+                                 daemon=True).start()
+            elif kind == "cancel":
+                token = self.tokens.get(request_id)
+                if token:
+                    token.cancel()
+            elif kind == "release":
+                _release_block(self.replies.pop(request_id, None))
+            elif kind == "prepare":
+                threading.Thread(target=self._prepare, args=(message[2],), daemon=True).start()
+            elif kind == "profile":
+                self._profile(*message[2:])
+            elif kind == "stop":
+                break
+        for token in list(self.tokens.values()):
+            token.cancel()
+        # Stopped while profiling (idle release, exit): keep what was recorded
+        if self.profiler:
+            self.profiler.stop()
+
+    def _send(self, message):
+        try:
+            with self.send_lock:
+                self.connection.send(message)
+        except OSError as e:
+            logger.warning("Cannot reach the front process: %s", e)
+
+    def _pipeline_for(self, config):
+        with self.lock:
+            settings = [config.get(key) for key in PIPELINE_SETTINGS]
+            if settings != self.pipeline_settings:
+                recorder = TraceRecorder(self.trace_path) if config.get("trace_requests", False) else None
+                paragraph_cache = self.paragraph_cache if config.get("paragraph_cache", True) else None
+                self.pipeline = RephrasePipeline(create_provider(config), self.system_prompt, recorder,
+                                                 paragraph_cache, self.relay)
+                self.pipeline_settings = settings
+            return self.pipeline
+
+    def _prepare(self, config):
+        try:
+            self._pipeline_for(config)
+        except Exception as e:
+            logger.warning("Error preparing the pipeline: %s", e)
+        finally:
+            self._send(("prepared", None))
+
+    def _profile(self, folder, max_seconds):
+        """Start a profiling session writing its reports to folder, or stop the running one when folder is None"""
+        if self.profiler:
+            self.profiler.stop()
+        if folder:
+            self.profiler = ProfilingSession(folder, max_seconds)
+            self.profiler.start(folder)
+
+    def _rephrase(self, request_id, token, payload, config, remaining):
+        try:
+            text = _unpack_text(payload)
+            deadline = Deadline.from_remaining(remaining) if remaining else None
+            self.relay.start()
+            pipeline = self._pipeline_for(config)
+            if self.profiler:
+                response = self.profiler.profile_call(pipeline.rephrase, text, config, token, deadline)
+            else:
+                response = pipeline.rephrase(text, config, token, deadline)
+            reply, block = _pack_text(response)
+            if block:
+                self.replies[request_id] = block
+            self._send(("done", request_id, reply, deadline.missed if deadline else [], self.relay.collected()))
+        except DeadlineExceeded as e:
+            self._send(("error", request_id, "deadline", e.stage, e.partial))
+        except Cancelled:
+            self._send(("error", request_id, "cancelled", None, None))
+        except TimeoutError as e:
+            self._send(("error", request_id, "timeout", str(e), None))
+        except ProviderError as e:
+            self._send(("error", request_id, "provider", str(e), (e.status, e.retry_after)))
+        except Exception as e:
+            logger.warning("Rephrase failed in the worker: %s", e)
+            self._send(("error", request_id, "error", str(e), None))
+        finally:
+            self.tokens.pop(request_id, None)
+
+
+def worker_main(connection, system_prompt, trace_path, log_dir, debug=False, log_clipboard_text=False):
+    """Entry point of the worker process, serves requests until the front process stops or goes away"""
+    setup_logging(log_dir, debug, log_clipboard_text, file_name="worker.log")
+    logger.info("Rephrase worker started")
+    _WorkerServer(connection, system_prompt, trace_path).serve()
+    logger.info("Rephrase worker stopped")
+
+
+class WorkerPipeline:
+    """The rephrase pipeline run in a separate process, behind the same rephrase() as RephrasePipeline
+
+    The provider client, the paragraph cache, JSON decoding and response handling all
+    live in the worker, so none of it holds the GIL of the process running the keyboard
+    hook, the tray and Tk. Requests and replies cross a multiprocessing pipe, texts
+    above SHARED_MEMORY_THRESHOLD in shared memory. Cancelling the CancelToken cancels
+    the request in the worker. A worker that dies fails the requests in flight with
+    WorkerCrashed and is started again, up to MAX_RESTARTS times per RESTART_WINDOW.
+    """
+
+    def __init__(self, system_prompt, log_dir, trace_path=None, catalog=None, debug=False, log_clipboard_text=False):
+        self.worker_args = (system_prompt, trace_path, log_dir, debug, log_clipboard_text)
+        self.catalog = catalog
+        self.ids = itertools.count(1)
+        self.pending = {}  # request id -> [done event, reply]
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.restarts = deque()
+        # Held while a worker is started, so a crash seen by two threads starts only one replacement
+        self.start_lock = threading.Lock()
+        self.process = None
+        self.connection = None
+        self.stopping = False
+        self.start()
+
+    def start(self):
+        # Spawned on every OS: a forked child would inherit the keyboard hook and the tray threads
+        context = multiprocessing.get_context("spawn")
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=worker_main, args=(child_connection,) + self.worker_args,
+                                  name="rephrase-worker", daemon=True)
+        process.start()
+        child_connection.close()
+        self.process, self.connection = process, connection
+        self.ready = threading.Event()
+        threading.Thread(target=self._read_replies, args=(connection, process, self.ready), daemon=True).start()
+        logger.info("Started rephrase worker process %s", process.pid)
+
+    def _restart(self, crashed=None):
+        """Start a worker in place of the crashed process (None: of no process), unless one was started already"""
+        with self.start_lock:
+            if self.stopping or self.process is not crashed:
+                return
+            now = time.monotonic()
+            while self.restarts and now - self.restarts[0] > RESTART_WINDOW:
+                self.restarts.popleft()
+            if len(self.restarts) >= MAX_RESTARTS:
+                logger.error("Rephrase worker crashed %s times in %ss, leaving it down", MAX_RESTARTS, RESTART_WINDOW)
+                self.process = None
+                return
+            self.restarts.append(now)
+            self.start()
+
+    def _read_replies(self, connection, process, ready):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "prepared":
+                ready.set()
+                continue
+            with self.lock:
+                entry = self.pending.pop(message[1], None)
+            if entry is None:
+                # Cancelled while the reply was on its way
+                if message[0] == "done" and isinstance(message[2], tuple):
+                    self._send(("release", message[1]))
+                continue
+            entry[1] = message
+            entry[0].set()
+
+        connection.close()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for entry in pending.values():
+            entry[0].set()  # No reply: the request fails with WorkerCrashed
+        if self.stopping:
+            return
+        process.join(1)
+        logger.error("Rephrase worker exited unexpectedly (exit code %s), restarting it", process.exitcode)
+        self._restart(process)
+
+    def _send(self, message):
+        try:
+            with self.send_lock:
+                self.connection.send(message)
+        except (OSError, AttributeError) as e:
+            raise WorkerCrashed(f"Cannot reach the rephrase worker: {e}")
+
+    def prepare(self, config):
+        """Have the worker build its provider for config now rather than on the first request
+
+        Returns at once, wait_ready() waits for the worker to be done.
+        """
+        self._send(("prepare", None, dict(config)))
+
+    def wait_ready(self, timeout=None):
+        """Wait for the worker to finish prepare(), returns False on timeout"""
+        return self.ready.wait(timeout)
+
+    def profile(self, folder, max_seconds=300):
+        """Profile the worker (see ProfilingSession) with reports in folder, None stops it
+
+        Returns at once, the worker writes its reports when its session stops. A session
+        ends with the worker, so a worker restarted or released while idle isn't profiled.
+        """
+        self._send(("profile", None, folder, max_seconds))
+
+    def rephrase(self, text, config, cancel_token=None, deadline=None):
+        """Rephrase text in the worker, see RephrasePipeline.rephrase"""
+        if self.process is None:
+            self._restart()
+            if self.process is None:
+                raise WorkerCrashed("The rephrase worker is not running")
+
+        if cancel_token:
+            cancel_token.check()
+        request_id = next(self.ids)
+        entry = [threading.Event(), None]
+        with self.lock:
+            self.pending[request_id] = entry
+        payload, block = _pack_text(text)
+        unregister = cancel_token.on_cancel(entry[0].set) if cancel_token else (lambda: None)
+        try:
+            self._send(("rephrase", request_id, payload, dict(config),
+                        deadline.stage_remaining() if deadline else None))
+            entry[0].wait()
+        except WorkerCrashed:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise
+        finally:
+            unregister()
+            _release_block(block)
+
+        with self.lock:
+            self.pending.pop(request_id, None)
+        reply = entry[1]
+        if cancel_token and cancel_token.cancelled:
+            # A reply that raced the cancel is dropped like one arriving after it
+            if reply is None:
+                self._send(("cancel", request_id))
+            elif reply[0] == "done" and isinstance(reply[2], tuple):
+                self._send(("release", request_id))
+            raise Cancelled()
+        if reply is None:
+            raise WorkerCrashed("The rephrase worker crashed during the request")
+
+        if reply[0] == "done":
+            _, _, payload, missed, observations = reply
+            response = _unpack_text(payload)
+            if isinstance(payload, tuple):
+                self._send(("release", request_id))
+            if deadline:
+                for stage in missed:
+                    deadline.miss(stage)
+            if self.catalog:
+                for observation in observations:
+                    self.catalog.observe(*observation)
+            return response
+
+        _, _, kind, message, detail = reply
+        if kind == "deadline" and deadline:
+            deadline.miss(message)
+        raise _rebuild_error(kind, message, detail)
+
+    def stop(self):
+        """Ask the worker to exit, terminating it if it doesn't within two seconds"""
+        with self.start_lock:
+            self.stopping = True
+            process = self.process
+        if process is None:
+            return
+        try:
+            self._send(("stop", None))
+        except WorkerCrashed:
+            pass
+        process.join(2)
+        if process.is_alive():
+            process.terminate()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app's modules are plain scripts in src, imported by name like the app does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
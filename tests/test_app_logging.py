@@ -0,0 +1,68 @@
+import os
+import json
+import logging
+
+import pytest
+
+import app_logging
+from app_logging import clip, get_logger, setup_logging, shutdown_logging
+
+SECRET = "Dear Sam, the door code is 4711, please keep it to yourself."
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    """Restores the app's logging setup after the test"""
+    handlers, level = app_logging.ROOT_LOGGER.handlers, app_logging.ROOT_LOGGER.level
+    yield str(tmp_path)
+    shutdown_logging()
+    app_logging.ROOT_LOGGER.handlers = handlers
+    app_logging.ROOT_LOGGER.setLevel(level)
+    app_logging._state["log_clipboard_text"] = False
+
+
+def written_records(log_dir):
+    """Stop logging (which drains the queue) and return the records in the log file"""
+    shutdown_logging()
+    with open(os.path.join(log_dir, "rephrase.log"), 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_clip_redacts_clipboard_text(log_dir):
+    setup_logging(log_dir)
+    get_logger("test").info("Captured: %s", clip(SECRET))
+
+    [record] = written_records(log_dir)
+    assert SECRET not in json.dumps(record)
+    assert "4711" not in record["msg"]
+    assert record["msg"] == f"Captured: <{len(SECRET)} chars redacted>"
+
+
+def test_clip_shows_cut_text_when_enabled(log_dir):
+    setup_logging(log_dir, log_clipboard_text=True)
+    get_logger("test").info("Captured: %s", clip(SECRET, 8))
+
+    assert written_records(log_dir)[0]["msg"] == "Captured: Dear Sam..."
+
+
+def test_mutable_arguments_are_logged_as_they_were_at_the_call(log_dir):
+    setup_logging(log_dir)
+    logger = get_logger("test")
+    stats = {"hits": 1}
+    pending = [1, 2]
+    logger.info("Stats: %s, pending %s", stats, pending)
+    logger.info("Hits: %(hits)s", stats)
+    stats["hits"] = 99
+    pending.clear()
+
+    assert [record["msg"] for record in written_records(log_dir)] == ["Stats: {'hits': 1}, pending [1, 2]", "Hits: 1"]
+
+
+def test_disabled_debug_calls_are_skipped(log_dir):
+    setup_logging(log_dir)
+    logger = get_logger("test")
+    assert not logger.isEnabledFor(logging.DEBUG)
+    logger.debug("Captured: %s", clip(SECRET))
+    logger.info("kept")
+
+    assert [record["msg"] for record in written_records(log_dir)] == ["kept"]
@@ -0,0 +1,124 @@
+import json
+import time
+
+import pytest
+
+from bulk_rephrase import BulkJob, JobLedger
+from pipeline import RephrasePipeline
+from providers import MockProvider, ProviderError
+
+CONFIG = {"model": "mock-model", "creativity_level": 5, "user_system_prompt": "Rephrase"}
+ITEMS = [{"id": i, "text": f"Snippet number {i}."} for i in range(5)]
+
+
+class FailingProvider(MockProvider):
+    """MockProvider whose first failures requests raise error instead of answering"""
+
+    def __init__(self, error=None, failures=None):
+        super().__init__()
+        self.error = error or ProviderError("Server error", status=500)
+        self.failures = failures
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        self.requests += 1
+        if self.failures is None or self.requests <= self.failures:
+            raise self.error
+        self.requests -= 1  # Counted again by MockProvider
+        yield from super().stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "results.jsonl"), str(tmp_path / "results.jsonl.ledger")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the job's back-off sleeps instead of waiting them out"""
+    waited = []
+    monkeypatch.setattr(time, "sleep", waited.append)
+    return waited
+
+
+def run_job(paths, provider, items=ITEMS, config=CONFIG, **kwargs):
+    job = BulkJob(RephrasePipeline(provider, "System"), config, *paths, **kwargs)
+    try:
+        return job.run(items)
+    finally:
+        job.close()
+
+
+def read_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_done_items(paths):
+    assert run_job(paths, MockProvider(), ITEMS[:3], workers=3) == 0
+
+    provider = MockProvider()
+    assert run_job(paths, provider, workers=3) == 0
+
+    assert provider.requests == 2
+    results = read_results(paths[0])
+    assert sorted(result["id"] for result in results) == [0, 1, 2, 3, 4]
+    assert all(result["text"] == ITEMS[result["id"]]["text"] for result in results)
+
+
+def test_torn_writes_are_cut_off_on_resume(paths):
+    run_job(paths, MockProvider(), ITEMS[:2])
+    # A crash mid-write: half a result in the output and half an entry in the ledger
+    with open(paths[0], 'ab') as f:
+        f.write(b'{"id": 2, "te')
+    with open(paths[1], 'ab') as f:
+        f.write(b'{"id": 2, "hash": ')
+
+    provider = MockProvider()
+    assert run_job(paths, provider) == 0
+
+    assert provider.requests == 3
+    # Every line parses: the half result is gone, not followed by the new ones
+    assert [result["id"] for result in read_results(paths[0])] == [0, 1, 2, 3, 4]
+
+
+def test_failing_items_stop_at_the_retry_cap(paths, sleeps):
+    provider = FailingProvider()
+    assert run_job(paths, provider, ITEMS[:2], max_retries=3) == 2
+
+    assert provider.requests == 6
+    assert sleeps == [2, 4, 2, 4]
+    ledger = JobLedger(paths[1])
+    assert [ledger.get(i)["attempts"] for i in (0, 1)] == [3, 3]
+    ledger.close()
+
+    # Out of retries, so a resume doesn't send them again
+    provider = FailingProvider()
+    assert run_job(paths, provider, ITEMS[:2], max_retries=3) == 2
+    assert provider.requests == 0
+
+
+def test_failed_rerun_keeps_the_committed_result(paths, sleeps):
+    run_job(paths, MockProvider(), ITEMS[:2])
+    size = len(open(paths[0], 'rb').read())
+
+    # New instructions change every item's hash, and the re-run of both fails
+    changed = dict(CONFIG, user_system_prompt="Rephrase formally")
+    assert run_job(paths, FailingProvider(), ITEMS[:2], changed, max_retries=1) == 2
+
+    # Reopening must not take the earlier results for torn writes
+    assert run_job(paths, MockProvider(), ITEMS[:2]) == 0
+    assert len(open(paths[0], 'rb').read()) == size
+    assert [result["id"] for result in read_results(paths[0])] == [0, 1]
+
+
+def test_rate_limits_wait_and_quota_stops(paths, sleeps):
+    rate_limited = FailingProvider(ProviderError("Rate limit reached", status=429, retry_after=3), failures=2)
+    assert run_job(paths, rate_limited, ITEMS[:1], max_retries=1) == 0
+    assert sleeps == [3, 3]
+
+    quota = FailingProvider(ProviderError("You exceeded your current quota: insufficient_quota", status=429))
+    assert run_job(paths, quota, ITEMS, max_retries=1) == 4
+    assert quota.requests == 1
+    ledger = JobLedger(paths[1])
+    assert ledger.get(1)["attempts"] == 0  # Not the item's fault, so it keeps its attempts
+    ledger.close()
@@ -0,0 +1,82 @@
+import time
+import threading
+
+import pytest
+
+from cancellation import CancelToken, Cancelled
+from fake_server import StandInServer, echo_responder
+from pipeline import RephrasePipeline
+from providers import OpenAICompatibleProvider
+from worker_process import WorkerPipeline
+
+# Cancelling must end the call well before the server's 5 s answer
+MAX_CANCEL_SECONDS = 0.5
+
+
+@pytest.fixture
+def slow_server():
+    server = StandInServer(responder=echo_responder(delay=5.0)).start()
+    yield server
+    server.stop()
+
+
+def config_for(server):
+    return {"provider": "openai", "provider_url": server.base_url, "model": "stand-in",
+            "creativity_level": 5, "user_system_prompt": "Rephrase", "paragraph_cache": False}
+
+
+def cancel_in_flight(pipeline, config, server):
+    """Start a rephrase, cancel it once it is in flight, returns (raised exception, seconds to return)"""
+    token = CancelToken()
+    outcome = {}
+
+    def run():
+        try:
+            pipeline.rephrase("Some text to rephrase", config, token)
+        except BaseException as e:  # Cancelled is not an Exception, so broad handlers don't swallow it
+            outcome["error"] = e
+        outcome["returned"] = time.monotonic()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    # Cancel once the request reached the server (a worker process has to start first)
+    give_up_at = time.monotonic() + 30
+    while not server.requests and time.monotonic() < give_up_at:
+        time.sleep(0.01)
+    assert server.requests, "the request never reached the server"
+    cancelled_at = time.monotonic()
+    token.cancel()
+    thread.join(5)
+    assert "returned" in outcome, "rephrase did not return after cancel"
+    return outcome.get("error"), outcome["returned"] - cancelled_at
+
+
+def wait_for_disconnect(server, timeout=2.0):
+    give_up_at = time.monotonic() + timeout
+    while not server.disconnects and time.monotonic() < give_up_at:
+        time.sleep(0.01)
+    return server.disconnects
+
+
+def test_cancel_aborts_openai_request(slow_server):
+    config = config_for(slow_server)
+    pipeline = RephrasePipeline(OpenAICompatibleProvider(slow_server.base_url), "System prompt")
+
+    error, seconds = cancel_in_flight(pipeline, config, slow_server)
+
+    assert isinstance(error, Cancelled)
+    assert seconds < MAX_CANCEL_SECONDS
+    assert wait_for_disconnect(slow_server), "the server never saw the connection close"
+
+
+def test_cancel_aborts_worker_request(slow_server, tmp_path):
+    config = config_for(slow_server)
+    worker = WorkerPipeline("System prompt", str(tmp_path))
+    try:
+        error, seconds = cancel_in_flight(worker, config, slow_server)
+
+        assert isinstance(error, Cancelled)
+        assert seconds < MAX_CANCEL_SECONDS
+        assert wait_for_disconnect(slow_server), "the server never saw the connection close"
+    finally:
+        worker.stop()
@@ -0,0 +1,87 @@
+import pytest
+
+from cancellation import CancelToken, Cancelled
+from clipboard_backends import ClipboardBackend, ClipboardSession
+
+
+class MemoryClipboard(ClipboardBackend):
+    """In-memory clipboard holding several formats, like the native backends"""
+    name = "memory"
+
+    def __init__(self, formats=None):
+        self.formats = dict(formats or {})
+        self.fail_snapshot = False
+
+    def get_text(self):
+        return self.formats.get("text")
+
+    def set_text(self, text):
+        self.formats = {"text": text}
+        return True
+
+    def clear(self):
+        self.formats = {}
+
+    def snapshot(self, clear=False):
+        if self.fail_snapshot:
+            raise OSError("clipboard busy")
+        snapshot = dict(self.formats)
+        if clear:
+            self.clear()
+        return snapshot
+
+    def restore(self, snapshot):
+        self.formats = dict(snapshot)
+
+
+USER_CLIPBOARD = {"text": "what the user copied", "image/png": b"\x89PNG..."}
+
+
+def test_session_restores_every_format():
+    backend = MemoryClipboard(USER_CLIPBOARD)
+    with ClipboardSession(backend) as session:
+        # Emptied on entry, so the capture can tell the copied selection from old content
+        assert backend.formats == {}
+        assert session.snapshot_bytes == len("what the user copied") + len(b"\x89PNG...")
+        backend.set_text("selected text")
+        backend.set_text("rephrased text")
+    assert backend.formats == USER_CLIPBOARD
+    assert session.snapshot is None
+
+
+@pytest.mark.parametrize("error", [ValueError("capture failed"), Cancelled()])
+def test_session_restores_when_the_body_fails(error):
+    backend = MemoryClipboard(USER_CLIPBOARD)
+    with pytest.raises(type(error)):
+        with ClipboardSession(backend):
+            backend.set_text("selected text")
+            raise error
+    assert backend.formats == USER_CLIPBOARD
+
+
+def test_session_restores_when_cancelled_mid_paste():
+    backend = MemoryClipboard(USER_CLIPBOARD)
+    token = CancelToken()
+    with pytest.raises(Cancelled):
+        with ClipboardSession(backend):
+            backend.set_text("selected text")
+            token.cancel()
+            token.check()
+            backend.set_text("never pasted")
+    assert backend.formats == USER_CLIPBOARD
+
+
+def test_session_without_restore_leaves_the_clipboard_empty():
+    backend = MemoryClipboard(USER_CLIPBOARD)
+    with ClipboardSession(backend, restore=False):
+        backend.set_text("rephrased text")
+    assert backend.formats == {}
+
+
+def test_failed_snapshot_still_clears_and_never_raises():
+    backend = MemoryClipboard(USER_CLIPBOARD)
+    backend.fail_snapshot = True
+    with ClipboardSession(backend):
+        assert backend.formats == {}
+        backend.set_text("rephrased text")
+    assert backend.formats == {}
@@ -0,0 +1,104 @@
+import os
+import json
+import threading
+
+import pytest
+
+from config_store import ConfigStore
+
+DEFAULTS = {"model": "model-a", "creativity_level": 5, "shortcut": "ctrl+alt+r", "api_keys": []}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConfigStore(str(tmp_path / "config.json"), DEFAULTS, poll_interval=0.02)
+    store.load()
+    yield store
+    store.stop()
+
+
+def read_file(store):
+    with open(store.path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_outside(store, **changes):
+    """Edit the file the way another program would, in place"""
+    data = dict(read_file(store), **changes)
+    with open(store.path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def subscribe(store, keys):
+    """Subscribe to keys, returns the list of (old, new) calls and an event set on each call"""
+    calls = []
+    called = threading.Event()
+
+    def callback(old, new):
+        calls.append((old, new))
+        called.set()
+    store.subscribe(keys, callback)
+    return calls, called
+
+
+def test_load_writes_defaults_and_snapshots_are_read_only(store):
+    assert read_file(store) == DEFAULTS
+    with pytest.raises(TypeError):
+        store.snapshot["model"] = "model-b"
+    assert store.snapshot["api_keys"] == ()
+
+
+def test_update_saves_atomically(store, monkeypatch):
+    store.update(model="model-b", api_keys=["key-1"])
+
+    assert read_file(store)["model"] == "model-b"
+    assert read_file(store)["api_keys"] == ["key-1"]
+    assert os.listdir(os.path.dirname(store.path)) == ["config.json"]
+
+    # A failed replace leaves the old file whole and no temp file behind
+    def fail(source, target):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail)
+    store.update(model="model-c")
+    assert read_file(store)["model"] == "model-b"
+    assert os.listdir(os.path.dirname(store.path)) == ["config.json"]
+
+
+def test_subscribers_fire_only_for_their_keys(store):
+    model_calls, _ = subscribe(store, ["model"])
+    shortcut_calls, _ = subscribe(store, ["shortcut", "creativity_level"])
+
+    store.update(model="model-b")
+    store.update(model="model-b")  # No change, no call
+    store.update(creativity_level=7)
+
+    assert [(old["model"], new["model"]) for old, new in model_calls] == [("model-a", "model-b")]
+    assert [new["creativity_level"] for _, new in shortcut_calls] == [7]
+
+
+def test_watcher_applies_outside_edits(store):
+    model_calls, model_changed = subscribe(store, ["model"])
+    shortcut_calls, _ = subscribe(store, ["shortcut"])
+    store.start_watching()
+
+    write_outside(store, model="edited-in-an-editor")
+
+    assert model_changed.wait(2), "the edit was not picked up"
+    assert store.snapshot["model"] == "edited-in-an-editor"
+    assert model_calls[0][0]["model"] == "model-a"
+    assert shortcut_calls == []
+
+
+def test_watcher_skips_a_half_written_edit_and_takes_the_next(store):
+    calls, changed = subscribe(store, ["creativity_level"])
+    store.start_watching()
+
+    with open(store.path, 'w', encoding='utf-8') as f:
+        f.write('{"creativity_level": ')
+    assert not changed.wait(0.3)
+    assert store.snapshot["creativity_level"] == 5
+
+    with open(store.path, 'w', encoding='utf-8') as f:
+        json.dump(dict(DEFAULTS, creativity_level=9), f, indent=2)
+    assert changed.wait(2), "the fixed edit was not picked up"
+    assert [new["creativity_level"] for _, new in calls] == [9]
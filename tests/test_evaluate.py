@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from evaluate import RecordedProvider, RecordingProvider, change_ratio, edit_distance, evaluate
+from pipeline import RephrasePipeline
+from providers import MockProvider, ProviderError
+from tracing import TraceRecorder, read_trace
+
+CONFIG = {"user_system_prompt": "Rephrase"}
+ITEMS = [{"id": "1", "text": "A cat sat on a mat."}, {"id": "2", "text": "Another day, another draft."}]
+
+
+def levenshtein(a, b):
+    """The textbook dynamic programming version, one row at a time"""
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        previous, row[0] = row[0], i
+        for j, cb in enumerate(b, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (ca != cb))
+    return row[-1]
+
+
+class EditingProvider(MockProvider):
+    """Echoes the text with every "a" turned into an "o", so the change ratio isn't zero"""
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        for chunk in super().stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout):
+            yield chunk.replace("a", "o")
+
+
+@pytest.mark.parametrize("alphabet", ["ab", "abcdef", "aé€😀 \n"])
+def test_edit_distance_matches_plain_dynamic_programming(alphabet):
+    rng = random.Random(alphabet)
+    for _ in range(300):
+        # Lengths on both sides of the 64 bits of a machine word
+        a = ''.join(rng.choices(alphabet, k=rng.randrange(150)))
+        b = ''.join(rng.choices(alphabet, k=rng.randrange(150)))
+        assert edit_distance(a, b) == levenshtein(a, b), (a, b)
+
+
+def test_edit_distance_of_long_texts():
+    text = "The quick brown fox jumps over the lazy dog. " * 10
+    edited = text.replace("lazy", "sleepy", 3).replace("quick ", "", 2)
+    assert len(text) > 64
+    assert edit_distance(text, edited) == levenshtein(text, edited)
+    assert edit_distance(text, text) == 0
+    assert edit_distance(text, "") == edit_distance("", text) == len(text)
+
+
+def test_change_ratio():
+    assert change_ratio("", "") == 0.0
+    assert change_ratio("same text", "same text") == 0.0
+    assert change_ratio("abcd", "wxyz") == 1.0
+    assert change_ratio("", "new") == 1.0
+    assert change_ratio("kitten", "sitting") == 3 / 7
+
+
+def test_recording_replays_offline(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    live = RecordingProvider(EditingProvider(models=["fast", "slow"]), TraceRecorder(path))
+    live_results = evaluate(RephrasePipeline(live, "System prompt"), live, CONFIG, ITEMS, ["fast", "slow"], [2, 6])
+    records = read_trace(path)
+    assert len(records) == len(live_results) == 8
+    assert records[0]["response"] == "A cot sot on o mot."
+
+    recorded = RecordedProvider(records)
+    assert recorded.list_models() == ["fast", "slow"]
+    assert recorded.creativity_levels() == [2, 6]
+    offline_results = evaluate(RephrasePipeline(recorded, "System prompt"), recorded, CONFIG, ITEMS,
+                               recorded.list_models(), recorded.creativity_levels())
+
+    assert [(r["model"], r["creativity"], r["id"], r["change"]) for r in offline_results] == \
+        [(r["model"], r["creativity"], r["id"], r["change"]) for r in live_results]
+    assert all(r["change"] > 0 for r in offline_results)
+    # The recorded timing, not the instant replay's
+    assert [r["total"] for r in offline_results] == [record["total"] for record in records]
+
+
+def test_replay_without_a_recording_fails():
+    recorded = RecordedProvider([])
+    with pytest.raises(ProviderError):
+        recorded.generate("prompt", "fast", 0.5)
+    results = evaluate(RephrasePipeline(recorded, "System prompt"), recorded, CONFIG, ITEMS[:1], ["fast"], [5])
+    assert "error" in results[0]
@@ -0,0 +1,53 @@
+import time
+import threading
+
+from idle import IdleManager
+
+
+def test_wake_during_release_waits_and_rebuilds():
+    events = []
+
+    def release():
+        events.append("release start")
+        time.sleep(0.3)
+        events.append("release end")
+
+    manager = IdleManager(0.01, release=release, rehydrate=lambda: events.append("rehydrate"))
+    time.sleep(0.02)
+    releasing = threading.Thread(target=manager.release_now, kwargs={"only_if_idle": True})
+    releasing.start()
+    time.sleep(0.1)
+
+    manager.wake()
+    manager.wait_awake()
+    releasing.join()
+
+    assert events == ["release start", "release end", "rehydrate"]
+    assert not manager.idle
+
+
+def test_busy_or_recent_activity_prevents_release():
+    released = []
+    busy = [True]
+    manager = IdleManager(0.05, release=lambda: released.append(1), rehydrate=lambda: None, busy=lambda: busy[0])
+    time.sleep(0.06)
+
+    manager.release_now(only_if_idle=True)
+    assert not released
+
+    busy[0] = False
+    manager.touch()
+    manager.release_now(only_if_idle=True)
+    assert not released
+
+    time.sleep(0.06)
+    manager.release_now(only_if_idle=True)
+    assert released == [1] and manager.idle
+
+
+def test_zero_idle_seconds_never_releases():
+    released = []
+    manager = IdleManager(0, release=lambda: released.append(1), rehydrate=lambda: None)
+
+    manager.release_now(only_if_idle=True)
+    assert not released
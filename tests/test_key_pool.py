@@ -0,0 +1,101 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import key_pool
+from fake_server import StandInServer, echo_responder
+from key_pool import KeyPoolProvider
+from providers import MockProvider, OpenAICompatibleProvider
+
+
+@pytest.fixture
+def make_pool():
+    servers = []
+
+    def make(key_limits, strategy="least_loaded", weights=None, delay=0.0, limit_window=60.0):
+        server = StandInServer(responder=echo_responder(delay=delay), key_limits=key_limits,
+                               limit_window=limit_window).start()
+        servers.append(server)
+        pool = KeyPoolProvider(list(key_limits), lambda key: OpenAICompatibleProvider(server.base_url, key),
+                               strategy=strategy, weights=weights, cooldown=30)
+        return pool, server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def ask(pool):
+    return pool.generate("Text for the task:\nhello", "stand-in", 0.5)
+
+
+def test_weighted_round_robin_follows_the_weights(make_pool):
+    pool, server = make_pool({"key-a": 100, "key-b": 100, "key-c": 100}, "weighted_round_robin", [3, 1, 1])
+
+    for _ in range(10):
+        ask(pool)
+
+    assert server.requests_by_key == {"key-a": 6, "key-b": 2, "key-c": 2}
+
+
+def test_weighted_round_robin_interleaves(make_pool):
+    pool, server = make_pool({"key-a": 100, "key-b": 100}, "weighted_round_robin", [2, 1])
+
+    used = []
+    for _ in range(6):
+        before = dict(server.requests_by_key)
+        ask(pool)
+        used.append(next(key for key, count in server.requests_by_key.items() if count != before.get(key, 0)))
+
+    # Smooth: the heavier key never gets its whole share in one burst
+    assert used == ["key-a", "key-b", "key-a"] * 2
+
+
+def test_least_loaded_spreads_concurrent_requests_by_weight(make_pool):
+    pool, server = make_pool({"key-a": 100, "key-b": 100, "key-c": 100}, "least_loaded", [2, 1, 1], delay=0.5)
+
+    threads = [threading.Thread(target=ask, args=(pool,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert server.requests_by_key == {"key-a": 4, "key-b": 2, "key-c": 2}
+
+
+def test_throttled_key_is_skipped_until_its_cooldown_ends(make_pool):
+    # key-a may make one request per one-second window, so its second request gets a 429 with Retry-After: 1
+    pool, server = make_pool({"key-a": 1, "key-b": 100}, "weighted_round_robin", limit_window=1.0)
+
+    for _ in range(6):
+        assert ask(pool) == "hello"  # The 429 is retried on key-b, the caller never sees it
+
+    assert server.throttled_by_key == {"key-a": 1}
+    assert server.requests_by_key == {"key-a": 1, "key-b": 5}
+    assert not pool.keys[0].available
+
+    time.sleep(1.2)
+    for _ in range(2):
+        ask(pool)
+    assert server.requests_by_key["key-a"] == 2
+    assert server.throttled_by_key == {"key-a": 1}
+
+
+def test_request_times_are_kept_for_a_minute_only(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(key_pool, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    pool = KeyPoolProvider(["key-a"], lambda key: MockProvider())
+    state = pool.keys[0]
+
+    # Without requests_per_minute nothing needs them
+    pool._release(pool._acquire([]))
+    assert not state.recent
+
+    state.requests_per_minute = 10
+    for _ in range(3):
+        pool._release(pool._acquire([]))
+        now[0] += 40
+    assert len(state.recent) == 2
+    assert state.remaining_quota() == 9
@@ -0,0 +1,86 @@
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import model_catalog
+from model_catalog import ModelCatalog, text_models
+from providers import MockProvider
+
+CONFIG = {"provider": "mock"}
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    return str(tmp_path / "model_catalog.json")
+
+
+def test_text_models_keeps_models_that_can_rephrase():
+    models = [
+        {"name": "gemini-2.0-flash", "actions": ["generateContent", "countTokens"]},
+        {"name": "gemini-2.0-flash-001", "actions": ["generateContent"]},  # Pinned copy of the one above
+        {"name": "gemini-1.5-pro-002", "actions": ["generateContent"]},  # Pinned, but the only one listed
+        {"name": "text-embedding-004", "actions": ["embedContent"]},
+        {"name": "chat-only", "actions": ["bidiGenerateContent"]},
+        {"name": "gemini-2.0-flash-live-001", "actions": ["generateContent"]},
+        {"name": "whisper-large"},
+        {"name": "tiny-output", "output_token_limit": 256},
+        {"name": "llama-3.1-8b"},
+    ]
+
+    assert [model["name"] for model in text_models(models)] == [
+        "gemini-2.0-flash", "gemini-1.5-pro-002", "llama-3.1-8b"]
+
+
+def test_listing_is_cached_until_the_ttl_expires(catalog_path, monkeypatch):
+    provider = MockProvider(models=["mock-a", "mock-embedding"])
+    catalog = ModelCatalog(catalog_path, ttl=60)
+    assert catalog.is_stale(CONFIG)
+
+    assert [model["name"] for model in catalog.refresh(provider, CONFIG)] == ["mock-a"]
+    assert not catalog.is_stale(CONFIG)
+
+    # Loaded from disk by the next run, and stale once older than the TTL
+    reloaded = ModelCatalog(catalog_path, ttl=60)
+    assert reloaded.names(CONFIG) == ["mock-a"]
+    later = time.time() + 61
+    monkeypatch.setattr(model_catalog, "time", SimpleNamespace(time=lambda: later))
+    assert reloaded.is_stale(CONFIG)
+    assert reloaded.names(CONFIG) == ["mock-a"]  # Still shown until the refresh
+
+
+def test_observe_averages_latency_and_throughput(catalog_path):
+    catalog = ModelCatalog(catalog_path, save_delay=0.05)
+
+    catalog.observe("mock-a", 1.0, 3.0, 800)  # 200 tokens over 2 s of streaming
+    assert catalog.observed["mock-a"] == {"requests": 1, "first_chunk_seconds": 1.0, "tokens_per_second": 100.0}
+
+    catalog.observe("mock-a", 2.0, 3.0, 800)  # 200 tokens over 1 s
+    entry = catalog.observed["mock-a"]
+    assert entry["requests"] == 2
+    assert entry["first_chunk_seconds"] == pytest.approx(1.3)
+    assert entry["tokens_per_second"] == pytest.approx(130.0)
+    assert catalog.describe("mock-a") == "first words after 1.3s, ~130 tokens/s (over 2 requests)"
+
+    # Written a moment later, not on every request
+    time.sleep(0.3)
+    with open(catalog_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)["observed"]["mock-a"]["requests"] == 2
+
+
+def test_concurrent_saves_leave_a_whole_file(catalog_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(model_catalog.logger, "warning", lambda *args: warnings.append(args))
+    catalog = ModelCatalog(catalog_path)
+    catalog.refresh(MockProvider(models=[f"mock-{i}" for i in range(200)]), CONFIG)
+
+    threads = [threading.Thread(target=catalog.save) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert warnings == []
+    assert len(ModelCatalog(catalog_path).names(CONFIG)) == 200
@@ -0,0 +1,150 @@
+import pytest
+
+from cancellation import CancelToken, Cancelled
+from deadlines import Deadline, DeadlineExceeded
+from paragraph_cache import ParagraphCache
+from pipeline import RephrasePipeline, build_prompt
+from providers import MockProvider
+from tracing import TraceRecorder
+
+CONFIG = {"model": "mock-model", "creativity_level": 5, "user_system_prompt": "Rephrase"}
+
+
+class ScriptedProvider(MockProvider):
+    """MockProvider that passes the echoed text through transform, with a delay per model"""
+
+    def __init__(self, transform=str.upper, delays=None, chunk_size=10_000):
+        super().__init__(chunk_size=chunk_size)
+        self.transform = transform
+        self.delays = delays or {}
+        self.prompts = []
+        self.models_used = []
+
+    def stream(self, prompt, model, temperature, max_output_tokens=None, cancel_token=None, timeout=None):
+        self.prompts.append(prompt)
+        self.models_used.append(model)
+        self.delay = self.delays.get(model, 0.0)
+        for chunk in super().stream(prompt, model, temperature, max_output_tokens, cancel_token, timeout):
+            yield self.transform(chunk)
+
+
+def task_text(prompt):
+    return prompt.split("Text for the task:\n", 1)[1].rstrip('\n')
+
+
+def test_mock_generate_and_stream_echo_the_task_text():
+    provider = MockProvider(chunk_size=4)
+    prompt = build_prompt("System", "Rephrase", "Hello there, world")
+
+    assert provider.generate(prompt, "mock-model", 0.5) == "Hello there, world"
+    chunks = list(provider.stream(prompt, "mock-model", 0.5))
+    assert chunks == ["Hell", "o th", "ere,", " wor", "ld"]
+    assert provider.generate(prompt, "mock-model", 0.5, max_output_tokens=1) == "Hell"
+    assert provider.requests == 3
+
+
+def test_mock_stream_honours_timeout_and_cancel():
+    provider = MockProvider(delay=1.0, chunk_size=4)
+    prompt = build_prompt("System", "Rephrase", "Hello there, world")
+
+    with pytest.raises(TimeoutError):
+        list(provider.stream(prompt, "mock-model", 0.5, timeout=0.1))
+
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(Cancelled):
+        list(provider.stream(prompt, "mock-model", 0.5, cancel_token=token))
+
+
+def test_pipeline_generates_and_streams(tmp_path):
+    # Without a recorder the pipeline calls generate, with one it streams to time the chunks
+    trace_path = tmp_path / "trace.jsonl"
+    for recorder in (None, TraceRecorder(str(trace_path))):
+        provider = ScriptedProvider(chunk_size=3)
+        pipeline = RephrasePipeline(provider, "System", recorder)
+        assert pipeline.rephrase("make this loud", CONFIG) == "MAKE THIS LOUD"
+        assert provider.prompts[0] == build_prompt("System", "Rephrase", "make this loud")
+    assert '"response_chars":14' in trace_path.read_text()
+
+
+def slow_request(fallback, fallback_model=None):
+    """A request the mock answers in four chunks, one every 0.25 s, with about 0.45 s left for it"""
+    provider = ScriptedProvider(delays={"mock-model": 1.0, "fast-model": 0.0}, chunk_size=4)
+    pipeline = RephrasePipeline(provider, "System")
+    config = dict(CONFIG, deadline_fallback=fallback, fallback_model=fallback_model)
+    return provider, pipeline, config, Deadline(0.5)
+
+
+def test_deadline_abort_raises_with_the_partial_text():
+    provider, pipeline, config, deadline = slow_request("abort")
+
+    with pytest.raises(DeadlineExceeded) as raised:
+        pipeline.rephrase("abcdefghijklmnop", config, deadline=deadline)
+
+    assert raised.value.stage == "request"
+    assert raised.value.partial == "ABCD"
+    assert deadline.missed == ["request"]
+
+
+def test_deadline_partial_returns_what_arrived():
+    provider, pipeline, config, deadline = slow_request("partial")
+
+    assert pipeline.rephrase("abcdefghijklmnop", config, deadline=deadline) == "ABCD"
+    assert deadline.missed == ["request"]
+
+
+def test_deadline_faster_model_answers_in_time():
+    provider, pipeline, config, deadline = slow_request("faster_model", "fast-model")
+
+    assert pipeline.rephrase("abcdefghijklmnop", config, deadline=deadline) == "ABCDEFGHIJKLMNOP"
+    assert provider.models_used == ["mock-model", "fast-model"]
+    assert deadline.missed == ["request"]
+
+
+def test_deadline_not_hit_returns_the_full_text():
+    provider = ScriptedProvider(chunk_size=4)
+    deadline = Deadline(5.0)
+
+    assert RephrasePipeline(provider, "System").rephrase("abcdefgh", CONFIG, deadline=deadline) == "ABCDEFGH"
+    assert deadline.missed == []
+
+
+def test_paragraph_cache_resends_only_changed_paragraphs():
+    provider = ScriptedProvider()
+    pipeline = RephrasePipeline(provider, "System", paragraph_cache=ParagraphCache())
+    # Blank lines before the first paragraph, padding around the second, a newline after the last
+    text = "\n\nFirst paragraph.\n\n  Second paragraph.  \n \nThird paragraph.\n"
+
+    assert pipeline.rephrase(text, CONFIG) == text.upper()
+    assert len(provider.prompts) == 1
+
+    edited = text.replace("Second paragraph.", "Second paragraph, edited.")
+    assert pipeline.rephrase(edited, CONFIG) == edited.upper()
+    assert len(provider.prompts) == 2
+    # Only the edited paragraph is sent, with its neighbours as context
+    assert task_text(provider.prompts[-1]).strip() == "Second paragraph, edited."
+    assert "Before the text:\nFirst paragraph.\n" in provider.prompts[-1]
+    assert "After the text:\nThird paragraph.\n" in provider.prompts[-1]
+
+
+def test_paragraph_cache_sends_an_unchanged_text_again_whole():
+    provider = ScriptedProvider()
+    pipeline = RephrasePipeline(provider, "System", paragraph_cache=ParagraphCache())
+    text = "One.\n\nTwo."
+
+    pipeline.rephrase(text, CONFIG)
+    assert pipeline.rephrase(text, CONFIG) == "ONE.\n\nTWO."
+    assert [task_text(prompt) for prompt in provider.prompts] == [text, text]
+
+
+def test_paragraph_cache_keeps_merged_paragraphs_as_one_piece():
+    provider = ScriptedProvider()
+    pipeline = RephrasePipeline(provider, "System", paragraph_cache=ParagraphCache())
+    pipeline.rephrase("A one.\n\nB two.\n\nC three.", CONFIG)
+
+    # The model now merges the two edited paragraphs it gets into one
+    provider.transform = lambda chunk: chunk.upper().replace("\n\n", " ")
+    result = pipeline.rephrase("A one!\n\nB two!\n\nC three.", CONFIG)
+
+    assert task_text(provider.prompts[-1]) == "A one!\n\nB two!"
+    assert result == "A ONE! B TWO!\n\nC THREE."
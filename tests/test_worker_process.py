@@ -0,0 +1,29 @@
+import os
+import time
+
+from worker_process import WorkerPipeline
+
+CONFIG = {"provider": "mock", "model": "mock-model", "creativity_level": 5, "user_system_prompt": "Rephrase"}
+
+
+def wait_for(path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, f"{path} was not written"
+        time.sleep(0.05)
+
+
+def test_profiling_covers_the_worker(tmp_path):
+    worker = WorkerPipeline("System prompt", str(tmp_path / "logs"))
+    folder = tmp_path / "profile" / "worker"
+    try:
+        worker.profile(str(folder), max_seconds=60)
+        assert worker.rephrase("Some text to rephrase", CONFIG) == "Some text to rephrase"
+        worker.profile(None)
+        wait_for(folder / "allocations_top.txt")
+    finally:
+        worker.stop()
+
+    assert (folder / "rephrase.pstats").exists()
+    assert "rephrase" in (folder / "rephrase_top.txt").read_text()
+    assert (folder / "samples_top.txt").read_text().split()[1] == "samples"